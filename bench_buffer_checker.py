@@ -0,0 +1,241 @@
+"""Benchmark the scan pipeline against a simulated network.
+
+Synthetic targets are served by a FakeProber (configurable PMTU, hops, RTT distribution, loss,
+ICMP rate limiting and PMTU blackholes) and geo/WHOIS lookups by a local stub HTTP server, so
+runs are repeatable and need no internet access. For each scenario it reports targets/sec,
+probes per target, p50/p99 per-target completion time and peak RSS.
+
+    python bench_buffer_checker.py --targets 2000 --realtime
+    python bench_buffer_checker.py --scenario blackhole --scenario ratelimited --main
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from tabulate import tabulate
+
+import buffer_checker as bc
+
+# Path MTUs seen in the wild and how often (weights); None picks a random odd size
+PMTU_MIX = [(1500, 70), (1492, 8), (1480, 4), (1460, 4), (1400, 4), (1280, 4), (576, 1), (None, 5)]
+
+# name: (share of lossy targets, loss rate on them, ICMP errors/s per path, share of blackholed paths)
+SCENARIOS = {
+    "clean": (0.0, 0.0, 0, 0.0),
+    "lossy": (0.3, 0.05, 0, 0.0),
+    "ratelimited": (0.0, 0.0, 10, 0.0),
+    "blackhole": (0.0, 0.0, 0, 0.1),
+    "mixed": (0.2, 0.02, 50, 0.03),
+}
+
+# Targets share registrable domains, as real lists do, so WHOIS coalescing and caching show up
+BENCH_DOMAINS = 500
+
+def build_network(count, scenario, seed=0, rtt=30.0, rtt_spread=0.6, jitter=0.1):
+    """Return ({name: [address]}, {address: FakeHost}) for `count` synthetic targets."""
+    lossy, loss, icmp_rate, blackholes = SCENARIOS[scenario]
+    rng = random.Random(seed)
+    sizes, weights = zip(*PMTU_MIX)
+    names, hosts = {}, {}
+    for i in range(count):
+        # One /24 per target (for up to 65536 targets), as in a typical target list
+        address = f"10.{(i >> 8) & 255}.{i & 255}.{(i >> 16) + 1}"
+        names[f"site{i}.bench{i % BENCH_DOMAINS}.test"] = [address]
+        pmtu = rng.choices(sizes, weights)[0] or rng.randrange(1200, 1500)
+        median = rng.lognormvariate(math.log(rtt), rtt_spread)
+        hosts[address] = bc.FakeHost(
+            pmtu=pmtu,
+            hops=rng.randint(4, 24),
+            initial_ttl=rng.choice(bc.INITIAL_TTLS),
+            rtt=median,
+            loss=loss if rng.random() < lossy else 0.0,
+            jitter=median * jitter,
+            icmp_rate=icmp_rate,
+            blackhole=rng.random() < blackholes,
+        )
+    return names, hosts
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers ipinfo-style geo lookups (single and /batch) and WhoisXML-style WHOIS queries."""
+
+    delay = 0.0
+
+    def _send(self, payload):
+        time.sleep(self.delay)
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def _geo(address):
+        return {"ip": address, "city": f"City{sum(map(int, address.split('.'))) % 97}", "country": "ZZ"}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/whois":
+            domain = parse_qs(url.query).get("domainName", ["unknown"])[0]
+            self._send({"WhoisRecord": {"domainName": domain, "registrarName": "Bench Registrar", "createdDate": "2001-01-01", "expiresDate": "2031-01-01"}})
+        elif url.path.endswith("/json"):
+            self._send(self._geo(url.path.split("/")[1]))
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        addresses = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"[]")
+        self._send({address: self._geo(address) for address in addresses})
+
+    def log_message(self, *args):
+        pass
+
+def start_stub_server(delay=0.0):
+    """Start the geo/WHOIS stub on a free local port; returns (server, base URL)."""
+    handler = type("Handler", (StubHandler,), {"delay": delay})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def make_backends(names, hosts, base_url, seed, realtime, rate=0):
+    network = bc.FakeProber(hosts, seed=seed, realtime=realtime)
+    network.log = None
+    prober = bc.ProbeScheduler(network, rate, bc.PROBE_BURST, bc.PROBE_PREFIX_RATE, bc.PROBE_PREFIX_BURST) if rate else network
+    resolver = bc.DnsResolver(servers=[], hosts=names)
+    enricher = bc.Enricher(
+        geo_url=base_url,
+        whois_url=f"{base_url}/whois",
+        geo_cache=bc.DiskCache(None, bc.GEO_CACHE_TTL, bc.ENRICH_CACHE_SIZE),
+        whois_cache=bc.DiskCache(None, bc.WHOIS_CACHE_TTL, bc.ENRICH_CACHE_SIZE),
+    )
+    return prober, resolver, enricher
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else float("nan")
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024)
+
+async def run_scan(names, prober, resolver, enricher, concurrency):
+    """Scan every name, returning (wall seconds, per-target completion seconds)."""
+    started, durations = {}, []
+
+    def feed():
+        for name in names:
+            started[name] = time.perf_counter()
+            yield name
+
+    begin = time.perf_counter()
+    async for result in bc.scan_targets(feed(), concurrency, prober=prober, resolver=resolver, enricher=enricher):
+        durations.append(time.perf_counter() - started[result.website])
+    return time.perf_counter() - begin, durations
+
+def bench_scenario(scenario, args, base_url):
+    names, hosts = build_network(args.targets, scenario, args.seed, args.rtt)
+    prober, resolver, enricher = make_backends(names, hosts, base_url, args.seed, args.realtime, args.rate)
+    try:
+        elapsed, durations = asyncio.run(run_scan(names, prober, resolver, enricher, args.concurrency))
+    finally:
+        prober.close()
+        enricher.close()
+    return {
+        "scenario": scenario,
+        "targets": len(durations),
+        "seconds": elapsed,
+        "targets/s": len(durations) / elapsed if elapsed else float("inf"),
+        "probes/target": prober.sent / max(len(durations), 1),
+        "rate limited": getattr(prober, "prober", prober).rate_limited,
+        "http requests": enricher.requests_sent,
+        "p50 ms": percentile(durations, 0.50) * 1000,
+        "p99 ms": percentile(durations, 0.99) * 1000,
+        "peak RSS MB": peak_rss_mb(),
+    }
+
+def bench_main(scenario, args, base_url):
+    """Time main() end to end (CLI, sinks and HTML report) on the same simulated network."""
+    names, hosts = build_network(args.targets, scenario, args.seed, args.rtt)
+    prober, resolver, enricher = make_backends(names, hosts, base_url, args.seed, args.realtime, args.rate)
+    bc.set_prober(prober)
+    bc.set_resolver(resolver)
+    bc.set_enricher(enricher)
+    with tempfile.TemporaryDirectory() as workdir:
+        targets = os.path.join(workdir, "targets.txt")
+        with open(targets, "w", encoding="utf-8") as targetfile:
+            targetfile.write("\n".join(names))
+        argv = ["-f", targets, "--no-cache", "--no-table", "--concurrency", str(args.concurrency),
+                "-o", os.path.join(workdir, "results.jsonl"), "-o", os.path.join(workdir, "report.html")]
+        begin = time.perf_counter()
+        try:
+            bc.main(argv)
+        finally:
+            prober.close()
+            enricher.close()
+        elapsed = time.perf_counter() - begin
+    return {
+        "scenario": f"main() {scenario}",
+        "targets": len(names),
+        "seconds": elapsed,
+        "targets/s": len(names) / elapsed if elapsed else float("inf"),
+        "probes/target": prober.sent / max(len(names), 1),
+        "rate limited": getattr(prober, "prober", prober).rate_limited,
+        "http requests": enricher.requests_sent,
+        "p50 ms": float("nan"),
+        "p99 ms": float("nan"),
+        "peak RSS MB": peak_rss_mb(),
+    }
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark buffer_checker against a simulated network.")
+    parser.add_argument("--targets", type=int, default=1000, help="synthetic targets per scenario (default: 1000)")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="scenario to run (repeatable; default: all)")
+    parser.add_argument("--realtime", action="store_true", help="deliver replies after their simulated RTT instead of instantly")
+    parser.add_argument("--rate", type=float, default=0, help="pace probes through a ProbeScheduler at this many probes/s (default: 0, unpaced)")
+    parser.add_argument("--rtt", type=float, default=30.0, help="median RTT in ms across targets (default: 30)")
+    parser.add_argument("--http-delay", type=float, default=0.0, help="seconds the geo/WHOIS stub waits per request (default: 0)")
+    parser.add_argument("--concurrency", type=int, default=bc.SCAN_CONCURRENCY, help=f"targets in flight (default: {bc.SCAN_CONCURRENCY})")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic network (default: 0)")
+    parser.add_argument("--main", action="store_true", help="also time main() end to end on the first scenario")
+    parser.add_argument("--output", help="append the results table to this file")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Keep lookups on the stub: no local GeoIP database, no retries hiding slow requests
+    bc.GEOIP_DATABASE = None
+    bc.HTTP_RETRIES = 0
+    server, base_url = start_stub_server(args.http_delay)
+    scenarios = args.scenario or list(SCENARIOS)
+    rows = []
+    try:
+        for scenario in scenarios:
+            rows.append(bench_scenario(scenario, args, base_url))
+            print(f"{scenario}: {rows[-1]['targets/s']:.0f} targets/s")
+        if args.main:
+            rows.append(bench_main(scenarios[0], args, base_url))
+    finally:
+        server.shutdown()
+
+    mode = ("realtime" if args.realtime else "instant replies") + (f", paced at {args.rate:g} probes/s" if args.rate else "")
+    table = tabulate([list(row.values()) for row in rows], headers=list(rows[0]), floatfmt=".1f")
+    report = f"\n{args.targets} targets per scenario, {mode}, concurrency {args.concurrency}, seed {args.seed}\n{table}\n"
+    print(report)
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as outfile:
+            outfile.write(report)
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,382 @@
 import json
-import subprocess
-import platform
+import sys
+import argparse
+import hashlib
+import itertools
+import collections
+import asyncio
 import concurrent.futures
 import time
-import requests
-from tqdm import tqdm
-from tabulate import tabulate
-from colorama import Fore, Style, init
 import re
 import os
+import socket
+import struct
+import math
+import select
+import threading
+import weakref
+import heapq
+import errno
+import random
+import ipaddress
+import contextvars
+import contextlib
+import functools
+from collections import namedtuple, OrderedDict
 
-# Initialize colorama for colored terminal output
-init(autoreset=True)
+# requests, tqdm, tabulate, colorama and the heavier standard modules (sqlite3, csv, mmap, subprocess)
+# are imported where they are used, so importing this module stays fast and has no side effects
 
 # WHOIS API key (replace with your actual API key)
 WHOIS_API_KEY = ""
 
-# Ensure the reports directory exists
-if not os.path.exists("reports"):
-    os.makedirs("reports")
+# Probe backend: "auto" tries the in-process ICMP engine first, "icmp", "subprocess"
+PROBE_BACKEND = os.environ.get("BUFFER_CHECKER_BACKEND", "auto")
+
+# Seconds to wait for a single probe reply while nothing is known about the destination's RTT
+PROBE_TIMEOUT = 1.0
+
+# Adaptive timeouts (RFC 6298 style): smoothed RTT + 4 * RTT variance, clamped to [floor, cap] seconds,
+# tracked for up to RTT_STATS_SIZE destinations and prefixes
+PROBE_TIMEOUT_FLOOR = 0.05
+PROBE_TIMEOUT_CAP = 2.0
+RTT_STATS_SIZE = 100000
+
+# Probe pacing shared by every stage: global probes/s and burst, plus a per-prefix (/24, /48) rate and
+# burst so no single network sees enough ICMP to trip router rate limits; PROBE_RATE = 0 disables pacing
+PROBE_RATE = 2000
+PROBE_BURST = 200
+PROBE_PREFIX_RATE = 100
+PROBE_PREFIX_BURST = 20
+
+# Probe outcomes
+REPLY = "reply"
+TTL_EXCEEDED = "ttl_exceeded"
+FRAG_NEEDED = "frag_needed"
+TIMEOUT = "timeout"
+
+# Stages a scan can run; "dns" always runs
+SCAN_STAGES = ("hops", "echo", "mtu", "geo", "whois")
+
+# Worker processes: targets per batch, batches in flight per worker, restarts per worker slot
+WORKER_BATCH_SIZE = 50
+WORKER_PIPELINE = 2
+WORKER_MAX_RESTARTS = 3
+
+# Monitoring mode: seconds between re-measurements per stage, startup spread (s) and metrics endpoint
+MONITOR_INTERVALS = {"echo": 60, "hops": 3600, "mtu": 3600, "geo": 86400, "whois": 86400}
+MONITOR_STARTUP_SPREAD = 10.0
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464
+
+# Rows shown in the terminal summary table
+TABLE_LIMIT = 200
+
+# Targets scanned at once, and per-stage limits on how many targets may be inside each stage
+SCAN_CONCURRENCY = 512
+STAGE_LIMITS = {"dns": 64, "hops": 256, "echo": 256, "mtu": 256, "geo": 256, "whois": 64}
+
+# On-disk caches live here
+CACHE_DIR = "cache"
+
+# Enrichment APIs; point these at a local mock server for tests
+GEO_API_URL = "https://ipinfo.io"
+GEO_API_TOKEN = ""
+WHOIS_API_URL = "https://www.whoisxmlapi.com/whoisserver/WhoisService"
+
+# HTTP client: (connect, read) timeouts in seconds, retry budget per request, pooled connections
+HTTP_TIMEOUT = (3.05, 10)
+HTTP_RETRIES = 2
+HTTP_POOL_SIZE = 16
+
+# Geo lookups are batched up to GEO_BATCH_SIZE IPs or GEO_BATCH_DELAY seconds, whichever comes first
+GEO_BATCH_SIZE = 100
+GEO_BATCH_DELAY = 0.05
+
+# Local GeoIP database (.mmdb, e.g. GeoLite2-City); misses go to GEO_API_URL when GEO_REMOTE_FALLBACK is set
+GEOIP_DATABASE = os.environ.get("BUFFER_CHECKER_GEOIP", "GeoLite2-City.mmdb")
+GEO_REMOTE_FALLBACK = True
+GEOIP_RECORD_CACHE = 65536
+
+# Enrichment caches: files, expiry (s) and LRU size
+GEO_CACHE_FILE = os.path.join(CACHE_DIR, "geo_cache.json")
+WHOIS_CACHE_FILE = os.path.join(CACHE_DIR, "whois_cache.json")
+GEO_CACHE_TTL = 7 * 86400
+WHOIS_CACHE_TTL = 3 * 86400
+ENRICH_CACHE_SIZE = 500000
+
+# Second-level public suffixes under which the registrable domain has three labels
+MULTI_LABEL_SUFFIXES = {
+    "co.uk", "org.uk", "ac.uk", "gov.uk", "com.au", "net.au", "org.au", "co.nz", "co.jp", "ne.jp",
+    "or.jp", "com.br", "com.cn", "com.mx", "co.in", "co.za", "com.tr", "com.sg", "com.hk", "co.kr",
+}
+
+# DNS: nameservers (None reads /etc/resolv.conf), per-query timeout (s), attempts per server,
+# negative-cache TTL, TTL used with the getaddrinfo fallback, and cache size before pruning
+DNS_SERVERS = None
+DNS_TIMEOUT = 2.0
+DNS_ATTEMPTS = 2
+DNS_NEGATIVE_TTL = 300
+DNS_FALLBACK_TTL = 300
+DNS_CACHE_SIZE = 100000
+DNS_A = 1
+DNS_AAAA = 28
+
+# Result sinks write in batches of this many records, or after this many seconds
+SINK_BATCH_SIZE = 100
+SINK_FLUSH_INTERVAL = 2.0
+PARQUET_BATCH_SIZE = 10000
+
+# SQLite result store: default location (every scan appends a run), rows per transaction, and the
+# smallest changes --diff reports for MTU (bytes), hops, latency (ms) and packet loss (percentage points)
+RESULT_STORE = "reports/buffer_results.db"
+SQLITE_BATCH_SIZE = 5000
+DIFF_THRESHOLDS = {"mtu": 1, "hops": 1, "latency": 20.0, "loss": 5.0}
+
+# Path cache: file, expiry (s), LRU size, and the IPv6 prefix used when prefix keys are enabled;
+# runs without a path cache remember their last PATH_RECENT_SIZE measurements instead
+PATH_CACHE_FILE = os.path.join(CACHE_DIR, "path_cache.json")
+PATH_CACHE_TTL = 6 * 3600
+PATH_CACHE_SIZE = 100000
+PATH_CACHE_PREFIX_V6 = 64
+PATH_RECENT_SIZE = 4096
+
+# Path-MTU search: plateau MTUs tried first, probes per narrowing round, round cap
+PMTU_PLATEAUS = (1500, 1492, 1480, 1460, 1400, 1280)
+PMTU_FANOUT = 8
+PMTU_MAX_ROUNDS = 6
+
+# Per-size outcomes of the path-MTU search
+FITS = "fits"
+NEEDS_FRAGMENTATION = "needs_fragmentation"
+NO_ANSWER = "no_answer"
+
+# Hop discovery: common initial TTLs, hard hop cap, per-target deadline (s), parallel sweep window and
+# probes per TTL before a silent TTL is taken as not reaching the host
+INITIAL_TTLS = (64, 128, 255)
+MAX_HOPS = 30
+HOPS_DEADLINE = 10.0
+HOPS_SWEEP_WIDTH = 8
+HOPS_ATTEMPTS = 4
+
+# Echo burst shared by the latency, loss, jitter and reply-TTL metrics
+ECHO_COUNT = 4
+ECHO_INTERVAL = 0.1
+
+# IPv4 + ICMP header bytes on top of the echo payload
+ICMP_OVERHEAD = 28
+
+# Linux socket options not exported by the socket module
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+IP_PMTUDISC_DO = getattr(socket, "IP_PMTUDISC_DO", 2)
+IP_PMTUDISC_PROBE = getattr(socket, "IP_PMTUDISC_PROBE", 3)
+IP_RECVERR = getattr(socket, "IP_RECVERR", 11)
+IP_RECVTTL = getattr(socket, "IP_RECVTTL", 12)
+MSG_ERRQUEUE = getattr(socket, "MSG_ERRQUEUE", 0x2000)
+
+# Result of a single echo probe; rtt is in ms, mtu is the next-hop MTU from a "fragmentation needed" error
+ProbeReply = namedtuple("ProbeReply", ["status", "rtt", "reply_ttl", "mtu"], defaults=[None, None, None])
+
+# Largest unfragmented payload, per-size outcomes and number of parallel probe rounds of a path-MTU search
+PmtuResult = namedtuple("PmtuResult", ["size", "outcomes", "rounds"])
+
+# Packed numeric fields of a ScanResult: max buffer size, TTL hops and reply TTL as int32 (_NA_INT = "N/A",
+# _MISSING_INT = None), then latency, jitter, packet loss % and scan time as doubles (NaN = "N/A", -inf = None)
+_RESULT_NUMBERS = struct.Struct("<iiidddd")
+_NA_INT = -1
+_MISSING_INT = -2
+
+def _pack_int(value):
+    if value is None:
+        return _MISSING_INT
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return _NA_INT
+
+def _pack_float(value):
+    if value is None:
+        return -math.inf
+    if isinstance(value, str):
+        value = value.rstrip("%")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+def _unpack_int(value):
+    return None if value == _MISSING_INT else "N/A" if value == _NA_INT else value
+
+def _unpack_float(value):
+    return None if value == -math.inf else "N/A" if value != value else value
+
+class WhoisRecord:
+    """One distinct set of WHOIS details as compact JSON, shared by every result that has it."""
+
+    __slots__ = ("text", "__weakref__")
+
+    def __init__(self, text):
+        self.text = text
+
+    def load(self):
+        """Decode the record into a fresh dict."""
+        return json.loads(self.text)
+
+class WhoisTable:
+    """Deduplicates WHOIS details between live results.
+
+    Each distinct record is kept once for as long as some result refers to it, so results
+    that have gone to the sinks and been dropped free their details. Results decode the
+    JSON only when their details are read.
+    """
+
+    def __init__(self, recent_size=1024):
+        self.records = weakref.WeakValueDictionary()
+        self.recent = {}
+        self.recent_size = recent_size
+        self.lock = threading.Lock()
+
+    def intern(self, details):
+        """Return the shared WhoisRecord for `details`, creating it if no live result has it."""
+        # Results of one run mostly share the same dict object per domain, so skip re-encoding those
+        seen = self.recent.get(id(details))
+        if seen is not None and seen[0] is details:
+            return seen[1]
+        text = json.dumps(details, separators=(",", ":"), default=str)
+        with self.lock:
+            record = self.records.get(text)
+            if record is None:
+                record = self.records[text] = WhoisRecord(text)
+            if len(self.recent) >= self.recent_size:
+                self.recent.clear()
+            self.recent[id(details)] = (details, record)
+        return record
+
+_whois_table = None
+
+def get_whois_table():
+    """Return the process-wide WhoisTable, creating it on first use."""
+    global _whois_table
+    if _whois_table is None:
+        _whois_table = WhoisTable()
+    return _whois_table
+
+class ScanResult:
+    """One scanned target, stored compactly.
+
+    Reads like the historical positional tuple (website, max_buffer_size, ttl_hops, latency,
+    packet_loss, geo_location, domain_details, ip, jitter, reply_ttl, scanned_at), with the
+    same display values ("N/A", "25%"); see RESULT_SCHEMA for sink columns. Numeric fields are
+    packed into one bytes object, addresses and locations are interned, and WHOIS details
+    are shared through the WhoisTable until `domain_details` is read. Error details embed
+    per-request text and are kept as given instead.
+    """
+
+    __slots__ = ("website", "ip", "geo_location", "_numbers", "_whois")
+    _fields = ("website", "max_buffer_size", "ttl_hops", "latency", "packet_loss", "geo_location", "domain_details", "ip", "jitter", "reply_ttl", "scanned_at")
+
+    def __init__(self, website, max_buffer_size, ttl_hops, latency, packet_loss, geo_location, domain_details, ip=None, jitter=None, reply_ttl=None, scanned_at=None):
+        self.website = website
+        self.ip = sys.intern(ip) if isinstance(ip, str) else ip
+        self.geo_location = sys.intern(geo_location) if isinstance(geo_location, str) else geo_location
+        self._numbers = _RESULT_NUMBERS.pack(
+            _pack_int(max_buffer_size), _pack_int(ttl_hops), _pack_int(reply_ttl),
+            _pack_float(latency), _pack_float(jitter), _pack_float(packet_loss), _pack_float(scanned_at),
+        )
+        if isinstance(domain_details, dict) and "error" not in domain_details:
+            self._whois = get_whois_table().intern(domain_details)
+        else:
+            self._whois = domain_details
+
+    @property
+    def max_buffer_size(self):
+        return _unpack_int(_RESULT_NUMBERS.unpack(self._numbers)[0])
+
+    @property
+    def ttl_hops(self):
+        return _unpack_int(_RESULT_NUMBERS.unpack(self._numbers)[1])
+
+    @property
+    def reply_ttl(self):
+        return _unpack_int(_RESULT_NUMBERS.unpack(self._numbers)[2])
+
+    @property
+    def latency(self):
+        return _unpack_float(_RESULT_NUMBERS.unpack(self._numbers)[3])
+
+    @property
+    def jitter(self):
+        return _unpack_float(_RESULT_NUMBERS.unpack(self._numbers)[4])
+
+    @property
+    def packet_loss(self):
+        loss = _unpack_float(_RESULT_NUMBERS.unpack(self._numbers)[5])
+        return loss if loss is None or loss == "N/A" else f"{round(loss)}%"
+
+    @property
+    def scanned_at(self):
+        return _unpack_float(_RESULT_NUMBERS.unpack(self._numbers)[6])
+
+    @property
+    def domain_details(self):
+        whois = self._whois
+        if isinstance(whois, WhoisRecord):
+            return whois.load()
+        return dict(whois) if isinstance(whois, dict) else whois
+
+    def __iter__(self):
+        return (getattr(self, field) for field in self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(getattr(self, field) for field in self._fields[index])
+        return getattr(self, self._fields[index])
+
+    def __eq__(self, other):
+        if isinstance(other, (ScanResult, tuple)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "ScanResult(" + ", ".join(f"{field}={value!r}" for field, value in zip(self._fields, self)) + ")"
+
+    def __reduce__(self):
+        # Pickle the values, so the unpickled result interns its details in its own process
+        return ScanResult, tuple(self)
+
+    def _asdict(self):
+        return dict(zip(self._fields, self))
+
+    def _replace(self, **changes):
+        return ScanResult(**dict(self._asdict(), **changes))
+
+# Column names and types written by the machine-readable result sinks
+RESULT_SCHEMA = [
+    ("website", "string"),
+    ("ip", "string"),
+    ("max_buffer_size", "int"),
+    ("ttl_hops", "int"),
+    ("latency_ms", "float"),
+    ("jitter_ms", "float"),
+    ("packet_loss_pct", "float"),
+    ("reply_ttl", "int"),
+    ("geo_location", "string"),
+    ("domain_details", "json"),
+    ("scanned_at", "float"),
+]
+
+# Simulated destination for the fake backend; pmtu is the path MTU in bytes, rtt and jitter (stddev) in ms,
+# icmp_rate the ICMP errors per second the path will send (0 = unlimited), blackhole drops frag-needed errors
+FakeHost = namedtuple("FakeHost", ["pmtu", "hops", "initial_ttl", "rtt", "loss", "jitter", "icmp_rate", "blackhole"], defaults=[1500, 10, 64, 20.0, 0.0, 0.0, 0.0, False])
 
 def print_banner():
     """Print the program banner."""
+    from colorama import Fore, Style
     banner = f"""
     {Fore.GREEN}{Style.BRIGHT}
     ██████╗ ██╗██████╗ ███████╗███████╗██████╗      ██████╗██╗  ██╗███████╗ ██████╗██╗  ██╗███████╗██████╗
@@ -35,447 +390,3392 @@ def print_banner():
     """
     print(banner)
 
-def get_geo_location(website_name):
+def _ping_command(host, count=1, size=None, ttl=None, df=False, timeout=None):
+    """Build a platform-specific ping command line."""
+    import platform
+    if platform.system().lower() == "windows":
+        command = ["ping", host, "-n", str(count)]
+        if ttl is not None:
+            command += ["-i", str(ttl)]
+        if df:
+            command += ["-f"]
+        if size is not None:
+            command += ["-l", str(size)]
+        if timeout is not None:
+            command += ["-w", str(max(1, int(timeout * 1000)))]
+    else:
+        command = ["ping", host, "-c", str(count)]
+        if ttl is not None:
+            command += ["-t", str(ttl)]
+        if df:
+            command += ["-M", "do"]
+        if size is not None:
+            command += ["-s", str(size)]
+        if timeout is not None:
+            command += ["-W", str(max(1, round(timeout)))]
+    return command
+
+def _icmp_checksum(data):
+    """Compute the RFC 1071 internet checksum."""
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+class SubprocessProber:
+    """Probe backend that runs the system `ping` once per probe (fallback path)."""
+
+    def __init__(self, max_workers=32):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.sent = 0
+
+    def submit(self, host, size=56, ttl=64, df=True, timeout=None):
+        """Queue a probe and return a future resolving to a ProbeReply."""
+        self.sent += 1
+        return self.executor.submit(self._run, host, size, ttl, df, PROBE_TIMEOUT if timeout is None else timeout)
+
+    def probe(self, host, size=56, ttl=64, df=True, timeout=None):
+        """Send one probe and wait for its outcome."""
+        return self.submit(host, size, ttl, df, timeout).result()
+
+    def probe_many(self, probes):
+        """Send several probes (dicts of probe() keyword arguments) at once and return their replies in order."""
+        futures = [self.submit(**probe) for probe in probes]
+        return [future.result() for future in futures]
+
+    def _run(self, host, size, ttl, df, timeout):
+        command = _ping_command(host, size=size, ttl=ttl, df=df, timeout=timeout)
+        import subprocess
+        result = subprocess.run(command, capture_output=True, text=True)
+        return self.parse_output(result.stdout + result.stderr)
+
+    @staticmethod
+    def parse_output(output):
+        """Turn ping's text output into a ProbeReply."""
+        if "TTL expired in transit" in output or "Time to live exceeded" in output:
+            return ProbeReply(TTL_EXCEEDED)
+        if "Packet needs to be fragmented" in output or "Message too long" in output or "Frag needed" in output:
+            match = re.search(r'mtu\s*=\s*(\d+)', output)
+            return ProbeReply(FRAG_NEEDED, mtu=int(match.group(1)) if match else None)
+        if match := re.search(r'ttl=(\d+)', output, re.IGNORECASE):
+            rtt = re.search(r'time[=<]([0-9.]+)\s*ms', output)
+            return ProbeReply(REPLY, float(rtt.group(1)) if rtt else None, int(match.group(1)))
+        return ProbeReply(TIMEOUT)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+class IcmpProber:
+    """In-process ICMP echo engine: one reusable socket, DF set, per-probe size and TTL, replies matched by id/seq."""
+
+    def __init__(self):
+        self.sock, self.raw = self._open_socket()
+        self.ident = os.getpid() & 0xFFFF
+        self.next_seq = 0
+        self.pending = {}
+        self.deadlines = []
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.closed = False
+        self.fallback = None
+        self.reader = threading.Thread(target=self._read_loop, name="icmp-reader", daemon=True)
+        self.reader.start()
+
+    @staticmethod
+    def _open_socket():
+        """Open an unprivileged ping socket, falling back to a raw socket."""
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            raw = False
+        except OSError:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            raw = True
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_PROBE)
+        except OSError:
+            sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+        if not raw:
+            sock.setsockopt(socket.IPPROTO_IP, IP_RECVERR, 1)
+            sock.setsockopt(socket.IPPROTO_IP, IP_RECVTTL, 1)
+        sock.setblocking(False)
+        return sock, raw
+
+    def submit(self, host, size=56, ttl=64, df=True, timeout=None):
+        """Send an echo request now and return a future resolving to a ProbeReply."""
+        timeout = PROBE_TIMEOUT if timeout is None else timeout
+        future = concurrent.futures.Future()
+        address = self._address(host)
+        if address is None:
+            future.set_result(ProbeReply(TIMEOUT))
+            return future
+        if ":" in address:
+            # IPv6 destinations go through the system ping
+            self.fallback = self.fallback or SubprocessProber()
+            return self.fallback.submit(host, size, ttl, df, timeout)
+
+        with self.lock:
+            self.next_seq = (self.next_seq + 1) & 0xFFFF
+            seq = self.next_seq
+            header = struct.pack("!BBHHH", 8, 0, 0, self.ident, seq)
+            payload = bytes(size)
+            packet = struct.pack("!BBHHH", 8, 0, _icmp_checksum(header + payload), self.ident, seq) + payload
+            now = time.monotonic()
+            self.pending[seq] = (future, address, now)
+            heapq.heappush(self.deadlines, (now + timeout, seq))
+            self.sent += 1
+            try:
+                self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
+                self.sock.sendto(packet, (address, 0))
+            except OSError as e:
+                del self.pending[seq]
+                if e.errno == errno.EMSGSIZE:
+                    future.set_result(ProbeReply(FRAG_NEEDED))
+                else:
+                    future.set_result(ProbeReply(TIMEOUT))
+        return future
+
+    @staticmethod
+    def _address(host):
+        """The address to probe for `host` (an IP literal or a name), preferring IPv4; None if it does not resolve."""
+        try:
+            return str(ipaddress.ip_address(host))
+        except ValueError:
+            pass
+        try:
+            return pick_address([info[4][0] for info in socket.getaddrinfo(host, None, type=socket.SOCK_DGRAM)])
+        except OSError:
+            return None
+
+    def probe(self, host, size=56, ttl=64, df=True, timeout=None):
+        """Send one probe and wait for its outcome."""
+        return self.submit(host, size, ttl, df, timeout).result()
+
+    def probe_many(self, probes):
+        """Send several probes (dicts of probe() keyword arguments) at once and return their replies in order."""
+        futures = [self.submit(**probe) for probe in probes]
+        return [future.result() for future in futures]
+
+    def _resolve(self, seq, address, reply):
+        """Complete the pending probe `seq` if it was sent to `address`."""
+        with self.lock:
+            entry = self.pending.get(seq)
+            if entry is None or (address is not None and entry[1] != address):
+                return
+            del self.pending[seq]
+        future, _, sent_at = entry
+        if reply.status == REPLY:
+            reply = reply._replace(rtt=round((time.monotonic() - sent_at) * 1000, 3))
+        future.set_result(reply)
+
+    def _expire(self):
+        """Time out probes past their deadline and return seconds until the next one."""
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            while self.deadlines and self.deadlines[0][0] <= now:
+                _, seq = heapq.heappop(self.deadlines)
+                entry = self.pending.pop(seq, None)
+                if entry is not None:
+                    expired.append(entry[0])
+            wait = self.deadlines[0][0] - now if self.deadlines else 0.05
+        for future in expired:
+            future.set_result(ProbeReply(TIMEOUT))
+        return min(max(wait, 0.001), 0.05)
+
+    def _read_loop(self):
+        while not self.closed:
+            wait = self._expire()
+            try:
+                readable, _, _ = select.select([self.sock], [], [], wait)
+            except (OSError, ValueError):
+                return
+            if not readable:
+                continue
+            if self.raw:
+                self._read_raw()
+            else:
+                self._read_errqueue()
+                self._read_dgram()
+
+    def _read_raw(self):
+        """Parse packets from a raw ICMP socket, which include the IP header."""
+        while True:
+            try:
+                data, (address, _) = self.sock.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            ihl = (data[0] & 0x0F) * 4
+            reply_ttl = data[8]
+            icmp_type, code = data[ihl], data[ihl + 1]
+            if icmp_type == 0:
+                ident, seq = struct.unpack("!HH", data[ihl + 4:ihl + 8])
+                if ident == self.ident:
+                    self._resolve(seq, address, ProbeReply(REPLY, reply_ttl=reply_ttl))
+            elif icmp_type in (3, 11) and len(data) >= ihl + 8 + 28:
+                inner = data[ihl + 8:]
+                inner_ihl = (inner[0] & 0x0F) * 4
+                destination = socket.inet_ntoa(inner[16:20])
+                ident, seq = struct.unpack("!HH", inner[inner_ihl + 4:inner_ihl + 8])
+                if ident != self.ident:
+                    continue
+                if icmp_type == 11:
+                    self._resolve(seq, destination, ProbeReply(TTL_EXCEEDED))
+                elif code == 4:
+                    mtu = struct.unpack("!H", data[ihl + 6:ihl + 8])[0]
+                    self._resolve(seq, destination, ProbeReply(FRAG_NEEDED, mtu=mtu or None))
+                else:
+                    self._resolve(seq, destination, ProbeReply(TIMEOUT))
+
+    def _read_dgram(self):
+        """Read echo replies from a ping socket; the kernel strips the IP header and reports TTL as ancillary data."""
+        while True:
+            try:
+                data, ancdata, _, (address, _) = self.sock.recvmsg(65535, socket.CMSG_SPACE(4))
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # A pending ICMP error surfaces here once; the details are on the error queue
+                self._read_errqueue()
+                continue
+            if len(data) < 8 or data[0] != 0:
+                continue
+            reply_ttl = None
+            for level, kind, value in ancdata:
+                if level == socket.IPPROTO_IP and kind == socket.IP_TTL:
+                    reply_ttl = struct.unpack("=i", value[:4])[0]
+            seq = struct.unpack("!H", data[6:8])[0]
+            self._resolve(seq, address, ProbeReply(REPLY, reply_ttl=reply_ttl))
+
+    def _read_errqueue(self):
+        """Drain ICMP errors (TTL exceeded, fragmentation needed) queued by IP_RECVERR."""
+        while True:
+            try:
+                data, ancdata, _, addr = self.sock.recvmsg(65535, 512, MSG_ERRQUEUE)
+            except (BlockingIOError, InterruptedError, OSError):
+                return
+            if len(data) < 8:
+                continue
+            seq = struct.unpack("!H", data[6:8])[0]
+            destination = addr[0] if addr else None
+            for level, kind, value in ancdata:
+                if level != socket.IPPROTO_IP or kind != IP_RECVERR or len(value) < 16:
+                    continue
+                ee_errno, origin, icmp_type, code, _, info, _ = struct.unpack("=IBBBBII", value[:16])
+                if ee_errno == errno.EMSGSIZE or (icmp_type == 3 and code == 4):
+                    self._resolve(seq, destination, ProbeReply(FRAG_NEEDED, mtu=info or None))
+                elif icmp_type == 11:
+                    self._resolve(seq, destination, ProbeReply(TTL_EXCEEDED))
+                else:
+                    self._resolve(seq, destination, ProbeReply(TIMEOUT))
+
+    def close(self):
+        self.closed = True
+        self.reader.join(timeout=1)
+        self.sock.close()
+        if self.fallback:
+            self.fallback.close()
+
+class FakeProber:
+    """Scriptable in-memory probe backend so the tool can run and be tested without the network.
+
+    By default every probe completes immediately. With `realtime` set, replies arrive after
+    their simulated RTT and lost probes after their timeout, so concurrency and deadlines
+    behave as they would on a real network. Set `log` to None to stop recording probes.
+    """
+
+    def __init__(self, hosts=None, script=None, seed=None, realtime=False):
+        self.hosts = dict(hosts or {})
+        self.script = script
+        self.random = random.Random(seed)
+        self.realtime = realtime
+        self.sent = 0
+        self.rate_limited = 0
+        self.log = []
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.pending = []
+        self.order = itertools.count()
+        self.wakeup = threading.Condition(self.lock)
+        self.timer = None
+        self.closed = False
+
+    def add_host(self, host, **kwargs):
+        """Register a simulated destination (see FakeHost for the fields)."""
+        self.hosts[host] = FakeHost(**kwargs)
+
+    def _icmp_error(self, host, target, reply):
+        """Apply the path's ICMP error rate limit (a token bucket with a one-second burst)."""
+        if not target.icmp_rate:
+            return reply
+        now = time.monotonic()
+        tokens, stamp = self.buckets.get(host, (target.icmp_rate, now))
+        tokens = min(target.icmp_rate, tokens + (now - stamp) * target.icmp_rate)
+        if tokens < 1:
+            self.buckets[host] = (tokens, now)
+            self.rate_limited += 1
+            return ProbeReply(TIMEOUT)
+        self.buckets[host] = (tokens - 1, now)
+        return reply
+
+    def reply_for(self, host, size=56, ttl=64):
+        """Compute the outcome of a probe against the simulated network."""
+        if self.script is not None:
+            reply = self.script(host, size, ttl)
+            if reply is not None:
+                return reply
+        target = self.hosts.get(host)
+        with self.lock:
+            if target is None or self.random.random() < target.loss:
+                return ProbeReply(TIMEOUT)
+            if ttl < target.hops:
+                return self._icmp_error(host, target, ProbeReply(TTL_EXCEEDED))
+            if size + ICMP_OVERHEAD > target.pmtu:
+                if target.blackhole:
+                    return ProbeReply(TIMEOUT)
+                return self._icmp_error(host, target, ProbeReply(FRAG_NEEDED, mtu=target.pmtu))
+            rtt = max(self.random.gauss(target.rtt, target.jitter), 0.0) if target.jitter else target.rtt
+        return ProbeReply(REPLY, float(rtt), target.initial_ttl - target.hops + 1)
+
+    def _delay(self, host, ttl, reply, timeout):
+        """Seconds until a realtime reply arrives."""
+        if reply.status == TIMEOUT:
+            return timeout
+        if reply.rtt is not None:
+            return reply.rtt / 1000
+        target = self.hosts.get(host)
+        if target is None:
+            return 0.0
+        # Errors come from the router that dropped the probe, part of the way along the path
+        return target.rtt * min(ttl, target.hops) / target.hops / 1000
+
+    def _run_timer(self):
+        with self.lock:
+            while not self.closed:
+                if not self.pending:
+                    self.wakeup.wait()
+                    continue
+                wait = self.pending[0][0] - time.monotonic()
+                if wait > 0:
+                    self.wakeup.wait(wait)
+                    continue
+                _, _, future, reply = heapq.heappop(self.pending)
+                self.lock.release()
+                try:
+                    future.set_result(reply)
+                finally:
+                    self.lock.acquire()
+
+    def submit(self, host, size=56, ttl=64, df=True, timeout=None):
+        """Return a future for the probe; already completed unless running in realtime."""
+        timeout = PROBE_TIMEOUT if timeout is None else timeout
+        self.sent += 1
+        if self.log is not None:
+            self.log.append((host, size, ttl))
+        future = concurrent.futures.Future()
+        reply = self.reply_for(host, size, ttl)
+        if not self.realtime:
+            future.set_result(reply)
+            return future
+        with self.lock:
+            heapq.heappush(self.pending, (time.monotonic() + self._delay(host, ttl, reply, timeout), next(self.order), future, reply))
+            if self.timer is None:
+                self.timer = threading.Thread(target=self._run_timer, name="fake-prober", daemon=True)
+                self.timer.start()
+            self.wakeup.notify()
+        return future
+
+    def probe(self, host, size=56, ttl=64, df=True, timeout=None):
+        """Send one probe and return its outcome."""
+        return self.submit(host, size, ttl, df, timeout).result()
+
+    def probe_many(self, probes):
+        """Send several probes (dicts of probe() keyword arguments) and return their replies in order."""
+        futures = [self.submit(**probe) for probe in probes]
+        return [future.result() for future in futures]
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.wakeup.notify()
+        if self.timer is not None:
+            self.timer.join(timeout=1)
+
+def _probe_prefix(host):
+    """Group destinations by /24 (IPv4) or /48 (IPv6) for pacing; names form their own group."""
+    if ":" in host:
+        try:
+            return str(ipaddress.IPv6Network(f"{host}/48", strict=False))
+        except ValueError:
+            return host
+    head, _, last = host.rpartition(".")
+    return head if last.isdigit() and head.replace(".", "").isdigit() else host
+
+class RttEstimator:
+    """Per-destination smoothed RTT and RTT variance (RFC 6298), turned into probe timeouts.
+
+    A destination without samples of its own borrows its prefix's estimate, and falls back
+    to `initial` when neither is known.
+    """
+
+    def __init__(self, floor=PROBE_TIMEOUT_FLOOR, cap=PROBE_TIMEOUT_CAP, initial=PROBE_TIMEOUT, max_entries=RTT_STATS_SIZE):
+        self.floor = floor
+        self.cap = cap
+        self.initial = initial
+        self.max_entries = max_entries
+        self.hosts = OrderedDict()
+        self.prefixes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _sample(self, table, key, rtt):
+        stats = table.get(key)
+        if stats is None:
+            table[key] = [rtt, rtt / 2]
+            if len(table) > self.max_entries:
+                table.popitem(last=False)
+        else:
+            stats[1] = 0.75 * stats[1] + 0.25 * abs(stats[0] - rtt)
+            stats[0] = 0.875 * stats[0] + 0.125 * rtt
+            table.move_to_end(key)
+
+    def update(self, host, rtt):
+        """Feed one RTT sample (seconds) for `host`."""
+        with self.lock:
+            self._sample(self.hosts, host, rtt)
+            self._sample(self.prefixes, _probe_prefix(host), rtt)
+
+    def timeout(self, host):
+        """Return the probe timeout (seconds) for `host`."""
+        with self.lock:
+            stats = self.hosts.get(host) or self.prefixes.get(_probe_prefix(host))
+        if stats is None:
+            return self.initial
+        return min(max(stats[0] + 4 * stats[1], self.floor), self.cap)
+
+class ProbeScheduler:
+    """Wraps a probe backend with global packet pacing, per-prefix fairness and adaptive timeouts.
+
+    Every probe takes a token from one global bucket (`rate` per second, `burst` deep) and
+    one from its destination prefix's bucket; queued probes are released round-robin across
+    prefixes. Probes submitted without a timeout get one from the RttEstimator, which learns
+    from every reply. A probe whose deadline passes resolves as a timeout even if the backend
+    is still waiting (e.g. on a running `ping`). Offers the same interface as the backends.
+    """
+
+    def __init__(self, prober, rate=PROBE_RATE, burst=PROBE_BURST, prefix_rate=PROBE_PREFIX_RATE, prefix_burst=PROBE_PREFIX_BURST, estimator=None):
+        self.prober = prober
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.prefix_rate = prefix_rate
+        self.prefix_burst = max(prefix_burst, 1)
+        self.estimator = estimator or RttEstimator()
+        self.queues = OrderedDict()
+        self.buckets = {}
+        self.tokens = float(self.burst)
+        self.stamp = time.monotonic()
+        self.deadlines = []
+        self.order = itertools.count()
+        self.paced = 0
+        self.expired = 0
+        self.lock = threading.Condition()
+        self.thread = None
+        self.closed = False
+
+    @property
+    def sent(self):
+        return self.prober.sent
+
+    def _admit(self, prefix, now):
+        """Take a global and a prefix token if both are available (a rate of 0 means unlimited)."""
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens < 1:
+                return False
+        if self.prefix_rate:
+            bucket = self.buckets.get(prefix)
+            if bucket is None:
+                if len(self.buckets) >= RTT_STATS_SIZE:
+                    self.buckets.clear()
+                bucket = self.buckets[prefix] = [float(self.prefix_burst), now]
+            bucket[0] = min(self.prefix_burst, bucket[0] + (now - bucket[1]) * self.prefix_rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                return False
+            bucket[0] -= 1
+        if self.rate:
+            self.tokens -= 1
+        return True
+
+    def _start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="probe-scheduler", daemon=True)
+            self.thread.start()
+
+    def submit(self, host, size=56, ttl=64, df=True, timeout=None):
+        """Queue a probe and return a future resolving to a ProbeReply."""
+        future = concurrent.futures.Future()
+        probe = (host, size, ttl, df, timeout, future)
+        prefix = _probe_prefix(host)
+        with self.lock:
+            # Send straight away when nothing is queued and both buckets have a token
+            if not self.queues and self._admit(prefix, time.monotonic()):
+                probe = None
+            else:
+                self.queues.setdefault(prefix, collections.deque()).append(probe)
+                self.paced += 1
+                self._start()
+                self.lock.notify()
+        if probe is None:
+            self._dispatch(host, size, ttl, df, timeout, future)
+        return future
+
+    def _dispatch(self, host, size, ttl, df, timeout, future):
+        if timeout is None:
+            timeout = self.estimator.timeout(host)
+        sent_at = time.monotonic()
+        with self.lock:
+            heapq.heappush(self.deadlines, (sent_at + timeout, next(self.order), future))
+            if self.deadlines[0][2] is future:
+                self._start()
+                self.lock.notify()
+        inner = self.prober.submit(host, size, ttl, df, timeout)
+        inner.add_done_callback(functools.partial(self._complete, host, future, sent_at))
+
+    def _complete(self, host, future, sent_at, inner):
+        try:
+            reply = inner.result()
+        except Exception as e:
+            with contextlib.suppress(concurrent.futures.InvalidStateError):
+                future.set_exception(e)
+            return
+        if reply.status == REPLY:
+            self.estimator.update(host, reply.rtt / 1000 if reply.rtt is not None else time.monotonic() - sent_at)
+        with contextlib.suppress(concurrent.futures.InvalidStateError):
+            future.set_result(reply)
+
+    def _run(self):
+        with self.lock:
+            while not self.closed:
+                now = time.monotonic()
+                expired = []
+                while self.deadlines and self.deadlines[0][0] <= now:
+                    expired.append(heapq.heappop(self.deadlines)[2])
+                ready = []
+                # Round-robin over prefixes: a prefix goes to the back after releasing a probe or running dry
+                for _ in range(len(self.queues)):
+                    prefix, queue = next(iter(self.queues.items()))
+                    if not self._admit(prefix, now):
+                        if self.tokens < 1:
+                            break
+                        self.queues.move_to_end(prefix)
+                        continue
+                    ready.append(queue.popleft())
+                    if queue:
+                        self.queues.move_to_end(prefix)
+                    else:
+                        del self.queues[prefix]
+                if expired or ready:
+                    self.lock.release()
+                    try:
+                        for future in expired:
+                            if not future.done():
+                                self.expired += 1
+                                with contextlib.suppress(concurrent.futures.InvalidStateError):
+                                    future.set_result(ProbeReply(TIMEOUT))
+                        for probe in ready:
+                            self._dispatch(*probe)
+                    finally:
+                        self.lock.acquire()
+                    continue
+                waits = []
+                if self.deadlines:
+                    waits.append(self.deadlines[0][0] - now)
+                if self.queues:
+                    # Until the next global token, or the next prefix token when only prefixes ran dry
+                    waits.append((1 - self.tokens) / self.rate if self.tokens < 1 else 1 / (self.prefix_rate or self.rate))
+                self.lock.wait(max(min(waits), 0.0005) if waits else None)
+
+    def probe(self, host, size=56, ttl=64, df=True, timeout=None):
+        """Send one probe and wait for its outcome."""
+        return self.submit(host, size, ttl, df, timeout).result()
+
+    def probe_many(self, probes):
+        """Send several probes (dicts of probe() keyword arguments) and return their replies in order."""
+        futures = [self.submit(**probe) for probe in probes]
+        return [future.result() for future in futures]
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.lock.notify()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+        self.prober.close()
+
+_prober = None
+_prober_lock = threading.Lock()
+
+def get_prober():
+    """Return the shared probe backend, creating it on first use."""
+    global _prober
+    with _prober_lock:
+        if _prober is None:
+            if PROBE_BACKEND in ("auto", "icmp"):
+                try:
+                    _prober = IcmpProber()
+                except OSError:
+                    if PROBE_BACKEND == "icmp":
+                        raise
+            if _prober is None:
+                _prober = SubprocessProber()
+            if PROBE_RATE:
+                _prober = ProbeScheduler(_prober, PROBE_RATE, PROBE_BURST, PROBE_PREFIX_RATE, PROBE_PREFIX_BURST)
+        return _prober
+
+def set_prober(prober):
+    """Install a probe backend (e.g. a FakeProber) for all subsequent probes."""
+    global _prober
+    with _prober_lock:
+        _prober = prober
+
+async def probe_async(prober, host, **kwargs):
+    """Await a single probe without tying up a thread while it is in flight."""
+    reply = await asyncio.wrap_future(prober.submit(host, **kwargs))
+    span = _current_span.get()
+    if span is not None:
+        span.probe(kwargs.get("size", 56), reply)
+    return reply
+
+def _read_resolv_conf(path="/etc/resolv.conf"):
+    """Return the nameservers, search domains and ndots option from resolv.conf."""
+    servers, search, ndots = [], [], 1
+    try:
+        with open(path, encoding="utf-8") as conf:
+            for line in conf:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == "nameserver":
+                    servers.append(fields[1])
+                elif len(fields) >= 2 and fields[0] in ("search", "domain"):
+                    # As in the system resolver, the last search or domain line wins
+                    search = fields[1:]
+                elif fields and fields[0] == "options":
+                    for option in fields[1:]:
+                        if option.startswith("ndots:") and option[6:].isdigit():
+                            ndots = min(int(option[6:]), 15)
+    except OSError:
+        pass
+    return servers, search, ndots
+
+def _read_hosts_file(path="/etc/hosts"):
+    """Return the {name: [addresses]} table from a hosts file."""
+    hosts = {}
+    try:
+        with open(path, encoding="utf-8") as table:
+            for line in table:
+                fields = line.split("#", 1)[0].split()
+                if len(fields) < 2:
+                    continue
+                try:
+                    ipaddress.ip_address(fields[0].split("%", 1)[0])
+                except ValueError:
+                    continue
+                for name in fields[1:]:
+                    addresses = hosts.setdefault(name.lower().rstrip("."), [])
+                    if fields[0] not in addresses:
+                        addresses.append(fields[0])
+    except OSError:
+        pass
+    return hosts
+
+def _parse_server(server):
+    """Turn "host", "host:port", "[v6]:port" or a (host, port) tuple into (host, port)."""
+    if isinstance(server, tuple):
+        return server
+    if server.startswith("["):
+        host, _, port = server[1:].partition("]:")
+        return host, int(port or 53)
+    if server.count(":") == 1:
+        host, port = server.split(":")
+        return host, int(port)
+    return server, 53
+
+def _encode_dns_query(query_id, name, qtype):
+    """Build a recursive DNS query packet; raises UnicodeError or ValueError for names DNS cannot carry."""
+    qname = b"".join(bytes([len(label)]) + label for label in (part.encode("idna") for part in name.rstrip(".").split(".")) if label)
+    if len(qname) > 254:
+        raise ValueError(f"domain name too long: {name}")
+    return struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0) + qname + b"\x00" + struct.pack("!HH", qtype, 1)
+
+def _skip_dns_name(data, offset):
+    """Return the offset just past a (possibly compressed) domain name."""
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += 1 + length
+        if length == 0:
+            return offset
+
+def _decode_dns_response(data):
+    """Parse a DNS response into (query id, rcode, [(type, address, ttl), ...])."""
+    query_id, flags, qdcount, ancount = struct.unpack("!HHHH", data[:8])
+    offset = 12
+    for _ in range(qdcount):
+        offset = _skip_dns_name(data, offset) + 4
+    records = []
+    for _ in range(ancount):
+        offset = _skip_dns_name(data, offset)
+        rtype, _, ttl, length = struct.unpack("!HHIH", data[offset:offset + 10])
+        offset += 10
+        rdata = data[offset:offset + length]
+        offset += length
+        if rtype == DNS_A and length == 4:
+            records.append((rtype, socket.inet_ntop(socket.AF_INET, rdata), ttl))
+        elif rtype == DNS_AAAA and length == 16:
+            records.append((rtype, socket.inet_ntop(socket.AF_INET6, rdata), ttl))
+    return query_id, flags & 0x000F, records
+
+class DnsResolver:
+    """Caching stub resolver that talks DNS over UDP directly and returns every A/AAAA record.
+
+    Answers are cached for their record TTL, failures for `negative_ttl`. Concurrent lookups of
+    the same name share one query. `hosts` maps names to fixed address lists (checked first,
+    /etc/hosts by default), which together with a local `servers` entry allows running fully
+    offline. Names are tried against the `search` domains under the `ndots` rule, as the system
+    resolver does; both default to resolv.conf when `servers` does. A server that answers
+    SERVFAIL or REFUSED is treated like one that timed out. Without any usable nameserver it
+    falls back to getaddrinfo with a fixed TTL.
+    """
+
+    def __init__(self, servers=None, hosts=None, timeout=DNS_TIMEOUT, negative_ttl=DNS_NEGATIVE_TTL, search=None, ndots=None):
+        conf_servers, conf_search, conf_ndots = _read_resolv_conf() if servers is None else ([], [], 1)
+        self.servers = [_parse_server(server) for server in (servers if servers is not None else DNS_SERVERS or conf_servers)]
+        self.search = [domain.lower().strip(".") for domain in (search if search is not None else conf_search)]
+        self.ndots = conf_ndots if ndots is None else ndots
+        self.hosts = {name.lower().rstrip("."): list(addresses) for name, addresses in (hosts if hosts is not None else _read_hosts_file()).items()}
+        self.timeout = timeout
+        self.negative_ttl = negative_ttl
+        self.cache = {}
+        self.inflight = {}
+        self.queries = {}
+        self.deadlines = []
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.closed = False
+        self.sockets = {}
+        for host, _ in self.servers:
+            family = socket.AF_INET6 if ":" in host else socket.AF_INET
+            if family not in self.sockets:
+                sock = socket.socket(family, socket.SOCK_DGRAM)
+                sock.setblocking(False)
+                self.sockets[family] = sock
+        self.fallback = None if self.servers else concurrent.futures.ThreadPoolExecutor(max_workers=16)
+        self.reader = None
+        if self.sockets:
+            self.reader = threading.Thread(target=self._read_loop, name="dns-reader", daemon=True)
+            self.reader.start()
+
+    def submit(self, name):
+        """Return a future resolving to the list of addresses for `name` (empty if it does not resolve)."""
+        name = name.lower().rstrip(".")
+        future = concurrent.futures.Future()
+        try:
+            ipaddress.ip_address(name)
+            future.set_result([name])
+            return future
+        except ValueError:
+            pass
+        if name in self.hosts:
+            future.set_result(self.hosts[name])
+            return future
+        with self.lock:
+            cached = self.cache.get(name)
+            if cached is not None and cached[0] > time.monotonic():
+                future.set_result(cached[1])
+                return future
+            if name in self.inflight:
+                return self.inflight[name]
+            self.inflight[name] = future
+        if self.fallback is not None:
+            self.fallback.submit(self._getaddrinfo, name)
+        else:
+            state = {"name": name, "candidates": self._candidates(name), "sent": 0, "retries": 0, "timeouts": 0, "bytes": 0}
+            future.dns_state = state
+            self._lookup(state)
+        return future
+
+    def resolve(self, name):
+        """Resolve `name` and wait for the answer."""
+        return self.submit(name).result()
+
+    async def resolve_async(self, name):
+        """Resolve `name` from a running event loop."""
+        future = self.submit(name)
+        addresses = await asyncio.wrap_future(future)
+        span = _current_span.get()
+        state = getattr(future, "dns_state", None)
+        # Coalesced lookups share one future; only the first awaiter is charged for its queries
+        if span is not None and state is not None and not state.get("charged"):
+            state["charged"] = True
+            span.probes += state["sent"]
+            span.retries += state["retries"]
+            span.timeouts += state["timeouts"]
+            span.bytes_sent += state["bytes"]
+        return addresses
+
+    def _finish(self, name, addresses, ttl):
+        with self.lock:
+            if len(self.cache) >= DNS_CACHE_SIZE:
+                now = time.monotonic()
+                self.cache = {key: value for key, value in self.cache.items() if value[0] > now}
+            self.cache[name] = (time.monotonic() + ttl, addresses)
+            future = self.inflight.pop(name, None)
+        if future is not None:
+            future.set_result(addresses)
+
+    def _getaddrinfo(self, name):
+        try:
+            infos = socket.getaddrinfo(name, None, proto=socket.IPPROTO_TCP)
+            addresses = list(dict.fromkeys(info[4][0] for info in infos))
+            self._finish(name, addresses, DNS_FALLBACK_TTL)
+        except (OSError, UnicodeError, ValueError):
+            self._finish(name, [], self.negative_ttl)
+
+    def _candidates(self, name):
+        """The names to query for `name`, in order, applying the search list."""
+        if not self.search:
+            return [name]
+        searched = [f"{name}.{domain}" for domain in self.search]
+        return [name] + searched if name.count(".") >= self.ndots else searched + [name]
+
+    def _lookup(self, state):
+        """Query A and AAAA for the next candidate name, or finish the lookup once none is left."""
+        while state["candidates"]:
+            qname = state["candidates"].pop(0)
+            state["answers"], state["pending"] = {}, 2
+            try:
+                for qtype in (DNS_A, DNS_AAAA):
+                    self._send(qname, qtype, state, attempt=0)
+                return
+            except (UnicodeError, ValueError):
+                # Names that cannot be encoded (e.g. a label over 63 characters) do not resolve
+                continue
+        self._finish(state["name"], [], self.negative_ttl)
+
+    def _send(self, name, qtype, state, attempt):
+        host, port = self.servers[attempt % len(self.servers)]
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        # Encode first so a name that cannot be sent leaves no query or deadline behind
+        query = _encode_dns_query(0, name, qtype)
+        with self.lock:
+            query_id = random.getrandbits(16)
+            while query_id in self.queries:
+                query_id = random.getrandbits(16)
+            self.queries[query_id] = (name, qtype, state, attempt, host)
+            heapq.heappush(self.deadlines, (time.monotonic() + self.timeout, query_id))
+            self.sent += 1
+        query = struct.pack("!H", query_id) + query[2:]
+        state["sent"] += 1
+        state["retries"] += attempt > 0
+        state["bytes"] += len(query)
+        try:
+            self.sockets[family].sendto(query, (host, port))
+        except OSError:
+            pass
+
+    def _retry(self, name, qtype, state, attempt):
+        """Send a query again to the next server; False once every server has had its attempts."""
+        if attempt + 1 < DNS_ATTEMPTS * len(self.servers):
+            try:
+                self._send(name, qtype, state, attempt + 1)
+                return True
+            except (UnicodeError, ValueError):
+                pass
+        return False
+
+    def _answer(self, qtype, state, addresses, ttl):
+        """Record one query type's answer; once both A and AAAA are in, finish or try the next candidate."""
+        state["answers"][qtype] = (addresses, ttl)
+        state["pending"] -= 1
+        if state["pending"] == 0:
+            a, aaaa = state["answers"][DNS_A], state["answers"][DNS_AAAA]
+            addresses = a[0] + aaaa[0]
+            if addresses:
+                ttl = min(answer[1] for answer in (a, aaaa) if answer[0])
+                self._finish(state["name"], addresses, max(ttl, 1))
+            else:
+                self._lookup(state)
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            while self.deadlines and self.deadlines[0][0] <= now:
+                _, query_id = heapq.heappop(self.deadlines)
+                query = self.queries.pop(query_id, None)
+                if query is not None:
+                    expired.append(query)
+            wait = self.deadlines[0][0] - now if self.deadlines else 0.05
+        for name, qtype, state, attempt, _ in expired:
+            state["timeouts"] += 1
+            if not self._retry(name, qtype, state, attempt):
+                self._answer(qtype, state, [], 0)
+        return min(max(wait, 0.001), 0.05)
+
+    def _receive(self, data, host):
+        """Match one response datagram to its query and record the answer."""
+        try:
+            query_id, rcode, records = _decode_dns_response(data)
+        except (struct.error, IndexError):
+            return
+        with self.lock:
+            query = self.queries.get(query_id)
+            if query is None or query[4] != host:
+                return
+            del self.queries[query_id]
+        name, qtype, state, attempt, _ = query
+        if rcode not in (0, 3):
+            # SERVFAIL, REFUSED and the like say nothing about the name: ask the next server
+            if not self._retry(name, qtype, state, attempt):
+                self._answer(qtype, state, [], 0)
+            return
+        answers = [record for record in records if record[0] == qtype]
+        ttl = min((record[2] for record in answers), default=0)
+        self._answer(qtype, state, [record[1] for record in answers], ttl)
+
+    def _read_loop(self):
+        sockets = list(self.sockets.values())
+        while not self.closed:
+            # Every lookup in the process depends on this thread, so no single query may end it
+            try:
+                wait = self._expire()
+            except Exception:
+                wait = 0.05
+            try:
+                readable, _, _ = select.select(sockets, [], [], wait)
+            except (OSError, ValueError):
+                return
+            for sock in readable:
+                while True:
+                    try:
+                        data, (host, *_) = sock.recvfrom(4096)
+                    except (BlockingIOError, InterruptedError, OSError):
+                        break
+                    try:
+                        self._receive(data, host)
+                    except Exception:
+                        continue
+
+    def close(self):
+        self.closed = True
+        if self.reader is not None:
+            self.reader.join(timeout=1)
+        for sock in self.sockets.values():
+            sock.close()
+        if self.fallback is not None:
+            self.fallback.shutdown(wait=False)
+
+_resolver = None
+
+def get_resolver():
+    """Return the shared DNS resolver, creating it on first use."""
+    global _resolver
+    with _prober_lock:
+        if _resolver is None:
+            _resolver = DnsResolver()
+        return _resolver
+
+def set_resolver(resolver):
+    """Install a DNS resolver (e.g. one with a static `hosts` table) for all subsequent lookups."""
+    global _resolver
+    with _prober_lock:
+        _resolver = resolver
+
+def pick_address(addresses):
+    """Choose the address to probe, preferring IPv4."""
+    return next((address for address in addresses if ":" not in address), addresses[0] if addresses else None)
+
+def get_geo_location(website_name, address=None):
     """Get the geographical location of the website's IP address."""
     try:
-        ip = subprocess.run(["nslookup", website_name], capture_output=True, text=True).stdout.split()[-1]
-        response = requests.get(f"https://ipinfo.io/{ip}/json").json()
-        return f"{response.get('city', 'Unknown')}, {response.get('country', 'Unknown')}"
+        ip = address or pick_address(get_resolver().resolve(website_name))
+        if ip is None:
+            return "Unknown"
+        return get_enricher().geo(ip)
     except Exception:
         return "Unknown"
 
-def get_latency(website_name):
+class EchoSamples:
+    """Per-packet RTTs of one echo burst and the statistics derived from them."""
+
+    def __init__(self, rtts, reply_ttls=()):
+        self.rtts = list(rtts)
+        received = sorted(rtt for rtt in self.rtts if rtt is not None)
+        self.sent = len(self.rtts)
+        self.received = len(received)
+        self.loss = (self.sent - self.received) / self.sent if self.sent else 1.0
+        self.min = received[0] if received else None
+        self.max = received[-1] if received else None
+        self.avg = sum(received) / len(received) if received else None
+        if received:
+            self.stddev = (sum((rtt - self.avg) ** 2 for rtt in received) / len(received)) ** 0.5
+        else:
+            self.stddev = None
+        ordered = [rtt for rtt in self.rtts if rtt is not None]
+        if len(ordered) > 1:
+            self.jitter = sum(abs(b - a) for a, b in zip(ordered, ordered[1:])) / (len(ordered) - 1)
+        else:
+            self.jitter = None
+        ttls = [ttl for ttl in reply_ttls if ttl is not None]
+        self.reply_ttl = max(set(ttls), key=ttls.count) if ttls else None
+        self._sorted = received
+
+    def percentile(self, q):
+        """Return the q-th percentile RTT (nearest rank), or None if nothing came back."""
+        if not self._sorted:
+            return None
+        rank = max(1, -(-q * len(self._sorted) // 100))
+        return self._sorted[int(rank) - 1]
+
+    @property
+    def p50(self):
+        return self.percentile(50)
+
+    @property
+    def p90(self):
+        return self.percentile(90)
+
+    @property
+    def p99(self):
+        return self.percentile(99)
+
+    def as_dict(self):
+        """Return the sample set as plain data."""
+        return {
+            "rtts": self.rtts, "sent": self.sent, "received": self.received, "loss": self.loss,
+            "min": self.min, "avg": self.avg, "max": self.max, "stddev": self.stddev, "jitter": self.jitter,
+            "p50": self.p50, "p90": self.p90, "p99": self.p99, "reply_ttl": self.reply_ttl,
+        }
+
+class EchoSession:
+    """Run one echo burst against a target and share its samples between all metric functions."""
+
+    def __init__(self, host, count=ECHO_COUNT, size=56, interval=ECHO_INTERVAL, timeout=None, prober=None):
+        self.host = host
+        self.count = count
+        self.size = size
+        self.interval = interval
+        self.timeout = timeout
+        self.prober = prober
+        self._samples = None
+        self._task = None
+        self._lock = threading.Lock()
+
+    def run(self):
+        """Send the burst (once) and return its EchoSamples."""
+        with self._lock:
+            if self._samples is None:
+                prober = self.prober or get_prober()
+                futures = []
+                for i in range(self.count):
+                    if i and self.interval:
+                        time.sleep(self.interval)
+                    futures.append(prober.submit(self.host, size=self.size, timeout=self.timeout))
+                self._samples = self._build([future.result() for future in futures])
+            return self._samples
+
+    async def run_async(self):
+        """Send the burst (once, however many stages await it) from a running event loop and return its EchoSamples."""
+        if self._samples is None:
+            if self._task is None:
+                self._task = asyncio.ensure_future(self._burst_async())
+            self._samples = await asyncio.shield(self._task)
+        return self._samples
+
+    async def _burst_async(self):
+        prober = self.prober or get_prober()
+        futures = []
+        for i in range(self.count):
+            if i and self.interval:
+                await asyncio.sleep(self.interval)
+            futures.append(asyncio.wrap_future(prober.submit(self.host, size=self.size, timeout=self.timeout)))
+        replies = await asyncio.gather(*futures)
+        span = _current_span.get()
+        if span is not None:
+            for reply in replies:
+                span.probe(self.size, reply)
+        return self._build(replies)
+
+    @staticmethod
+    def _build(replies):
+        return EchoSamples(
+            [reply.rtt if reply.status == REPLY else None for reply in replies],
+            [reply.reply_ttl for reply in replies if reply.status == REPLY],
+        )
+
+    @property
+    def samples(self):
+        return self.run()
+
+def get_latency(website_name, session=None):
     """Calculate the average latency to the website."""
-    command = ["ping", "-c", "4", website_name] if platform.system().lower() != "windows" else ["ping", "-n", "4", website_name]
-    result = subprocess.run(command, capture_output=True, text=True)
-    output = result.stdout
-
-    match = re.findall(r'time=([0-9.]+) ms', output)
-    if match:
-        latencies = [float(time) for time in match]
-        return round(sum(latencies) / len(latencies), 2)
+    samples = (session or EchoSession(website_name)).samples
+    if samples.avg is not None:
+        return round(samples.avg, 2)
     return "N/A"
 
-def get_packet_loss(website_name):
+def get_packet_loss(website_name, session=None):
     """Calculate the packet loss percentage to the website."""
-    command = ["ping", "-c", "4", website_name] if platform.system().lower() != "windows" else ["ping", "-n", "4", website_name]
-    result = subprocess.run(command, capture_output=True, text=True)
-    output = result.stdout
+    samples = (session or EchoSession(website_name)).samples
+    return f"{round(samples.loss * 100)}%"
+
+def get_jitter(website_name, session=None):
+    """Calculate the mean RTT variation between consecutive replies."""
+    samples = (session or EchoSession(website_name)).samples
+    if samples.jitter is not None:
+        return round(samples.jitter, 2)
+    return "N/A"
 
-    match = re.search(r'(\d+)% packet loss', output)
-    return f"{match.group(1)}%" if match else "N/A"
+def get_reply_ttl(website_name, session=None):
+    """Return the TTL observed on the website's echo replies."""
+    samples = (session or EchoSession(website_name)).samples
+    return samples.reply_ttl if samples.reply_ttl is not None else "N/A"
 
 def get_ttl_hops(website_name):
     """Determine the TTL (Time to Live) hops to the website."""
-    ttl = 1
-    while True:
-        command = ["ping", website_name, "-c", "1", "-t", str(ttl)] if platform.system().lower() != "windows" else ["ping", website_name, "-n", "1", "-i", str(ttl)]
-        result = subprocess.run(command, capture_output=True, text=True)
-        output = result.stdout
+    return asyncio.run(get_ttl_hops_async(website_name))
 
-        if "TTL expired in transit" in output or "Time to live exceeded" in output:
-            ttl += 1
-        elif match := re.search(r'TTL=(\d+)', output):
-            return ttl
-        elif "Request timed out" in output or "100% packet loss" in output:
-            ttl += 1
+def estimate_hops(reply_ttl):
+    """Estimate the hop count from a reply TTL, assuming the nearest common initial TTL (64, 128 or 255)."""
+    initial_ttl = min((ttl for ttl in INITIAL_TTLS if ttl >= reply_ttl), default=INITIAL_TTLS[-1])
+    return initial_ttl - reply_ttl + 1
+
+async def get_ttl_hops_async(website_name, prober=None, session=None, max_hops=MAX_HOPS, deadline=HOPS_DEADLINE):
+    """Determine the TTL hops to the website from a running event loop.
+
+    The distance is estimated from the reply TTL of one echo (taken from `session` when given),
+    confirmed with a pair of probes around the estimate, and otherwise found with a bounded
+    binary search that finishes with a parallel sweep. A TTL whose probe is lost is probed
+    again (up to HOPS_ATTEMPTS times) before it counts as falling short. Returns "N/A" if the
+    host does not answer within `max_hops` or `deadline` seconds.
+    """
+    prober = prober or get_prober()
+    try:
+        return await asyncio.wait_for(_discover_hops(website_name, prober, session, max_hops), deadline)
+    except asyncio.TimeoutError:
+        return "N/A"
+
+async def _discover_hops(website_name, prober, session, max_hops):
+    async def reaches(ttl):
+        # Only a "time exceeded" error proves the probe fell short; a lost probe is sent again
+        for _ in range(HOPS_ATTEMPTS):
+            reply = await probe_async(prober, website_name, ttl=ttl)
+            if reply.status != TIMEOUT:
+                return reply.status == REPLY
+        return False
+
+    reply_ttl = (await session.run_async()).reply_ttl if session is not None else None
+    for _ in range(0 if session is not None else HOPS_ATTEMPTS):
+        reply = await probe_async(prober, website_name, ttl=255)
+        if reply.status == REPLY:
+            reply_ttl = reply.reply_ttl
+            break
+    if reply_ttl is None:
+        return "N/A"
+
+    estimate = min(max(estimate_hops(reply_ttl), 1), max_hops)
+    if estimate == 1:
+        if await reaches(1):
+            return 1
+        low, high, below = 2, max_hops, False
+    else:
+        below, at = await asyncio.gather(reaches(estimate - 1), reaches(estimate))
+        if at and not below:
+            return estimate
+        low, high = (1, estimate - 1) if below else (estimate + 1, max_hops)
+    # Searching upwards assumes the host answers at max_hops; one whose TTL-limited probes never arrive does not
+    if not below and not await reaches(max_hops):
+        return "N/A"
+
+    # Invariant: the host answers at TTL `high`, and not below `low`
+    while high - low + 1 > HOPS_SWEEP_WIDTH:
+        middle = (low + high) // 2
+        if await reaches(middle):
+            high = middle
         else:
-            return ttl
+            low = middle + 1
+    ttls = list(range(low, high))
+    answered = await asyncio.gather(*(reaches(ttl) for ttl in ttls))
+    return next((ttl for ttl, ok in zip(ttls, answered) if ok), high)
 
 def get_domain_details(website_name):
     """Fetch domain details using the WHOIS API."""
+    return get_enricher().whois(website_name)
+
+def get_max_buffer(website_name):
+    """Search for the largest echo payload that reaches the website without fragmentation."""
+    return asyncio.run(get_max_buffer_async(website_name))
+
+async def get_max_buffer_async(website_name, prober=None, low=1000, high=1500):
+    """Search for the largest unfragmented echo payload from a running event loop."""
+    return (await search_path_mtu_async(website_name, prober, low, high)).size
+
+async def search_path_mtu_async(website_name, prober=None, low=1000, high=1500, fanout=PMTU_FANOUT):
+    """Find the largest echo payload in [low, high] that reaches the website with DF set.
+
+    The first round probes `low`, `high` and the common plateau MTUs (and one byte above
+    each) in parallel, which settles typical paths in a single RTT. Later rounds split the
+    remaining window with `fanout` parallel probes, jumping straight to any MTU reported by
+    a "fragmentation needed" error. A size that goes unanswered twice is treated as too big
+    (a PMTU blackhole); once any size has gone unanswered, later rounds send each size twice
+    so a blackholed window narrows by one round per step. Only a first round with no answer
+    at all, followed by a silent re-probe of `low`, ends the search early (the host is down).
+    """
+    prober = prober or get_prober()
+    outcomes = {}
+    timeouts = {}
+    hints = set()
+    rounds = 0
+
+    async def probe_round(sizes):
+        nonlocal rounds
+        copies = 2 if timeouts else 1
+        sizes = [size for size in sorted(sizes) for _ in range(copies)]
+        span = _current_span.get()
+        if span is not None:
+            span.retries += sum(1 for size in sizes if size in timeouts)
+        replies = await asyncio.gather(*(probe_async(prober, website_name, size=size) for size in sizes))
+        rounds += 1
+        answered = False
+        for size, reply in zip(sizes, replies):
+            if reply.status == REPLY:
+                outcomes[size] = FITS
+                answered = True
+            elif reply.status == FRAG_NEEDED:
+                outcomes[size] = NEEDS_FRAGMENTATION
+                answered = True
+                if reply.mtu:
+                    hints.update((reply.mtu - ICMP_OVERHEAD, reply.mtu - ICMP_OVERHEAD + 1))
+            else:
+                timeouts[size] = timeouts.get(size, 0) + 1
+                outcomes.setdefault(size, NO_ANSWER)
+        return answered
+
+    first = {mtu - ICMP_OVERHEAD + offset for mtu in PMTU_PLATEAUS for offset in (0, 1)} | {low, high}
+    # A silent first round may be loss rather than a dead host, so `low` gets one more (doubled) try
+    if not await probe_round({size for size in first if low <= size <= high}) and not await probe_round({low}):
+        return PmtuResult(0, outcomes, rounds)
+
+    while rounds < PMTU_MAX_ROUNDS:
+        fits = max((size for size, outcome in outcomes.items() if outcome == FITS), default=low - 1)
+        too_big = [size for size, outcome in outcomes.items() if size > fits and (outcome == NEEDS_FRAGMENTATION or timeouts.get(size, 0) >= 2)]
+        limit = min(too_big, default=high + 1)
+        if limit - fits <= 1:
+            break
+        candidates = {size for size in hints if fits < size < limit}
+        candidates |= {size for size in range(fits + 1, limit) if outcomes.get(size) == NO_ANSWER}
+        step = (limit - fits) / (fanout + 1)
+        candidates |= {fits + max(1, round(step * i)) for i in range(1, fanout + 1)}
+        candidates = {size for size in candidates if fits < size < limit and outcomes.get(size) in (None, NO_ANSWER)}
+        if not candidates:
+            break
+        await probe_round(candidates)
+
+    size = max((size for size, outcome in outcomes.items() if outcome == FITS), default=0)
+    return PmtuResult(size, outcomes, rounds)
+
+class DiskCache:
+    """Persistent LRU cache of JSON values with a fixed expiry, saved as one JSON file."""
+
+    def __init__(self, filename, ttl, max_entries):
+        self.filename = filename
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+        self.dirty = False
+        self.lock = threading.Lock()
+        if filename:
+            self.entries.update(self._read_file())
+
+    def _read_file(self):
+        """Return the entries saved in the cache file, or none if it is missing or unreadable."""
+        try:
+            with open(self.filename, encoding="utf-8") as cachefile:
+                return OrderedDict(json.load(cachefile))
+        except (OSError, ValueError):
+            return OrderedDict()
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Hold an exclusive lock on the cache file while it is read and rewritten (POSIX only)."""
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        with open(f"{self.filename}.lock", "a") as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            yield
+
+    def _lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry["time"] > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry["value"]
+
+    def get(self, key):
+        """Return the cached value for `key`, or None if missing or expired."""
+        with self.lock:
+            value = self._lookup(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key, value, stored_at=None):
+        """Store `value` under `key` (aged from `stored_at`, default now), evicting the least recently used entries beyond max_entries."""
+        with self.lock:
+            self.entries[key] = {"time": time.time() if stored_at is None else stored_at, "value": value}
+            self.entries.move_to_end(key)
+            self.dirty = True
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def save(self):
+        """Merge the cache into the file on disk and write it back atomically, if it changed.
+
+        Worker processes share one cache file, so the file is re-read under a lock and entries
+        other processes saved in the meantime are kept; of two entries for a key the newer wins.
+        """
+        if not self.filename or not self.dirty:
+            return
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.filename}.{os.getpid()}.tmp"
+        with self._file_lock():
+            merged = self._read_file()
+            now = time.time()
+            with self.lock:
+                for key, entry in self.entries.items():
+                    if key not in merged or merged[key]["time"] <= entry["time"]:
+                        merged[key] = entry
+                    merged.move_to_end(key)
+                for key in [key for key, entry in merged.items() if now - entry["time"] > self.ttl]:
+                    del merged[key]
+                while len(merged) > self.max_entries:
+                    merged.popitem(last=False)
+                self.entries = merged
+                with open(temporary, "w", encoding="utf-8") as cachefile:
+                    json.dump(merged, cachefile)
+                self.dirty = False
+            os.replace(temporary, self.filename)
+
+class PathCache(DiskCache):
+    """Persistent LRU cache of path MTU, hop count and reply TTL keyed by address and, optionally, by prefix."""
+
+    def __init__(self, filename=PATH_CACHE_FILE, ttl=PATH_CACHE_TTL, max_entries=PATH_CACHE_SIZE, prefix_len=None):
+        super().__init__(filename, ttl, max_entries)
+        self.prefix_len = prefix_len
+
+    def _prefix(self, address):
+        if not self.prefix_len:
+            return None
+        try:
+            network = ipaddress.ip_network(address)
+        except ValueError:
+            return None
+        length = self.prefix_len if network.version == 4 else PATH_CACHE_PREFIX_V6
+        return str(network.supernet(new_prefix=min(length, network.prefixlen)))
+
+    def get(self, address):
+        """Return the cached path for `address` (or its prefix), or None if missing or expired."""
+        with self.lock:
+            entry = self._lookup(address)
+            if entry is None and (prefix := self._prefix(address)):
+                entry = self._lookup(prefix)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(self, address, pmtu, hops, reply_ttl=None):
+        """Record a measured path under its address and prefix.
+
+        A value that was not measured (None) is kept from a fresh entry for the same key. The
+        merged entry then keeps that entry's age, so no value is served for longer than the TTL.
+        """
+        for key in (address, self._prefix(address)):
+            if not key:
+                continue
+            entry = {"pmtu": pmtu, "hops": hops, "reply_ttl": reply_ttl}
+            stored_at = None
+            with self.lock:
+                previous = self._lookup(key)
+                if previous is not None:
+                    if (pmtu is None and previous["pmtu"] is not None) or (hops is None and previous["hops"] is not None):
+                        stored_at = self.entries[key]["time"]
+                    entry = {field: previous.get(field) if value is None else value for field, value in entry.items()}
+            super().put(key, entry, stored_at)
+
+def registrable_domain(website_name):
+    """Return the registrable part of a hostname (e.g. www.example.co.uk -> example.co.uk)."""
+    labels = website_name.lower().rstrip(".").split(".")
+    keep = 3 if ".".join(labels[-2:]) in MULTI_LABEL_SUFFIXES else 2
+    return ".".join(labels[-keep:])
+
+def _http_session():
+    """Create a pooled HTTP session with a bounded retry budget."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    session = requests.Session()
+    retry = Retry(total=HTTP_RETRIES, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=None)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _parse_whois_record(record):
+    """Flatten a WhoisXML API record into the domain details shown in reports."""
+    registrant = record.get("registrant", {})
+    administrative_contact = record.get("administrativeContact", {})
+    technical_contact = record.get("technicalContact", {})
+    registry_data = record.get("registryData", {})
+
+    return {
+        "registrar": record.get("registrarName", "N/A"),
+        "created_date": record.get("createdDate", "N/A"),
+        "updated_date": record.get("updatedDate", "N/A"),
+        "expires_date": record.get("expiresDate", "N/A"),
+        "name_servers": ", ".join(record.get("nameServers", {}).get("hostNames", ["N/A"])),
+        "status": ", ".join(record.get("status", ["N/A"])),
+        "registrant": {
+            "organization": registrant.get("organization", "N/A"),
+            "state": registrant.get("state", "N/A"),
+            "country": registrant.get("country", "N/A"),
+            "country_code": registrant.get("countryCode", "N/A"),
+        },
+        "administrative_contact": {
+            "organization": administrative_contact.get("organization", "N/A"),
+            "state": administrative_contact.get("state", "N/A"),
+            "country": administrative_contact.get("country", "N/A"),
+            "country_code": administrative_contact.get("countryCode", "N/A"),
+        },
+        "technical_contact": {
+            "organization": technical_contact.get("organization", "N/A"),
+            "state": technical_contact.get("state", "N/A"),
+            "country": technical_contact.get("country", "N/A"),
+            "country_code": technical_contact.get("countryCode", "N/A"),
+        },
+        "registry_data": {
+            "created_date": registry_data.get("createdDate", "N/A"),
+            "updated_date": registry_data.get("updatedDate", "N/A"),
+            "expires_date": registry_data.get("expiresDate", "N/A"),
+            "whois_server": registry_data.get("whoisServer", "N/A"),
+        },
+        "domain_availability": record.get("domainAvailability", "N/A"),
+        "contact_email": record.get("contactEmail", "N/A"),
+        "estimated_domain_age": record.get("estimatedDomainAge", "N/A"),
+        "ips": ", ".join(record.get("ips", ["N/A"])),
+    }
+
+class MaxMindDatabase:
+    """Memory-mapped reader for MaxMind DB (.mmdb) files such as GeoLite2-City, using the file's binary search tree."""
+
+    METADATA_MARKER = b"\xab\xcd\xefMaxMind.com"
+
+    def __init__(self, filename):
+        self.filename = filename
+        import mmap
+        with open(filename, "rb") as dbfile:
+            self.buffer = mmap.mmap(dbfile.fileno(), 0, access=mmap.ACCESS_READ)
+        marker = self.buffer.rfind(self.METADATA_MARKER, max(0, len(self.buffer) - 128 * 1024))
+        if marker < 0:
+            raise ValueError(f"{filename} is not a MaxMind DB file")
+        self.metadata, _ = self._decode(marker + len(self.METADATA_MARKER), marker + len(self.METADATA_MARKER))
+        self.node_count = self.metadata["node_count"]
+        self.record_size = self.metadata["record_size"]
+        if self.record_size not in (24, 28, 32):
+            raise ValueError(f"Unsupported MaxMind DB record size {self.record_size}")
+        self.node_bytes = self.record_size // 4
+        self.tree_size = self.node_bytes * self.node_count
+        self.data_start = self.tree_size + 16
+        self.ipv4_start = 0
+        if self.metadata["ip_version"] == 6:
+            node = 0
+            for _ in range(96):
+                if node >= self.node_count:
+                    break
+                node = self._record(node, 0)
+            self.ipv4_start = node
+        self.records = {}
+
+    def _record(self, node, bit):
+        """Return the left (bit 0) or right (bit 1) record of a search tree node."""
+        offset = node * self.node_bytes
+        buffer = self.buffer
+        if self.record_size == 24:
+            offset += bit * 3
+            return int.from_bytes(buffer[offset:offset + 3], "big")
+        if self.record_size == 28:
+            middle = buffer[offset + 3]
+            if bit:
+                return ((middle & 0x0F) << 24) | int.from_bytes(buffer[offset + 4:offset + 7], "big")
+            return ((middle & 0xF0) << 20) | int.from_bytes(buffer[offset:offset + 3], "big")
+        offset += bit * 4
+        return int.from_bytes(buffer[offset:offset + 4], "big")
+
+    def _decode(self, offset, base):
+        """Decode one data-section value at `offset`; pointers are relative to `base`. Returns (value, next offset)."""
+        buffer = self.buffer
+        control = buffer[offset]
+        offset += 1
+        kind = control >> 5
+        if kind == 1:
+            size = (control >> 3) & 0x3
+            value = control & 0x7
+            if size == 0:
+                pointer = (value << 8) | buffer[offset]
+            elif size == 1:
+                pointer = ((value << 16) | int.from_bytes(buffer[offset:offset + 2], "big")) + 2048
+            elif size == 2:
+                pointer = ((value << 24) | int.from_bytes(buffer[offset:offset + 3], "big")) + 526336
+            else:
+                pointer = int.from_bytes(buffer[offset:offset + 4], "big")
+            return self._decode(base + pointer, base)[0], offset + size + 1
+        if kind == 0:
+            kind = 7 + buffer[offset]
+            offset += 1
+        size = control & 0x1F
+        if size >= 29:
+            extra = size - 28
+            size = (29, 285, 65821)[extra - 1] + int.from_bytes(buffer[offset:offset + extra], "big")
+            offset += extra
+        if kind == 2:
+            return buffer[offset:offset + size].decode("utf-8"), offset + size
+        if kind == 3:
+            return struct.unpack("!d", buffer[offset:offset + 8])[0], offset + 8
+        if kind == 4:
+            return bytes(buffer[offset:offset + size]), offset + size
+        if kind in (5, 6, 9, 10):
+            return int.from_bytes(buffer[offset:offset + size], "big"), offset + size
+        if kind == 7:
+            result = {}
+            for _ in range(size):
+                key, offset = self._decode(offset, base)
+                result[key], offset = self._decode(offset, base)
+            return result, offset
+        if kind == 8:
+            return int.from_bytes(buffer[offset:offset + size], "big", signed=size == 4), offset + size
+        if kind == 11:
+            result = []
+            for _ in range(size):
+                item, offset = self._decode(offset, base)
+                result.append(item)
+            return result, offset
+        if kind == 14:
+            return bool(size), offset
+        if kind == 15:
+            return struct.unpack("!f", buffer[offset:offset + 4])[0], offset + 4
+        raise ValueError(f"Unsupported MaxMind DB data type {kind}")
+
+    def lookup(self, address):
+        """Return the record for an IP address, or None if the database has no entry for it."""
+        ip = ipaddress.ip_address(address)
+        if ip.version == 6 and self.metadata["ip_version"] == 4:
+            return None
+        packed = int(ip)
+        bits = ip.max_prefixlen
+        node = self.ipv4_start if ip.version == 4 else 0
+        for depth in range(bits):
+            if node >= self.node_count:
+                break
+            node = self._record(node, (packed >> (bits - 1 - depth)) & 1)
+        if node <= self.node_count:
+            return None
+        offset = node - self.node_count + self.tree_size
+        if offset not in self.records:
+            if len(self.records) >= GEOIP_RECORD_CACHE:
+                self.records.clear()
+            self.records[offset] = self._decode(offset, self.data_start)[0]
+        return self.records[offset]
+
+    def location(self, address):
+        """Return "City, Country" for an IP address, or None if it is not in the database."""
+        try:
+            record = self.lookup(address)
+        except ValueError:
+            return None
+        if not record:
+            return None
+        city = record.get("city", {}).get("names", {}).get("en", "Unknown")
+        country = record.get("country", record.get("registered_country", {}))
+        return f"{city}, {country.get('iso_code', 'Unknown')}"
+
+    def close(self):
+        self.buffer.close()
+
+def _format_location(info):
+    return f"{info.get('city', 'Unknown')}, {info.get('country', 'Unknown')}"
+
+class Enricher:
+    """Geo and WHOIS lookups over one pooled HTTP session, with on-disk caches, batching and request coalescing.
+
+    Geo lookups are answered from a local MaxMind database when one is configured; only misses
+    go to the remote API (if GEO_REMOTE_FALLBACK is set). Remote geo lookups arriving within
+    GEO_BATCH_DELAY are sent as one batch request (falling back to one request per IP if the
+    endpoint refuses batches). Results are cached per IP (geo)
+    and per registrable domain (WHOIS); errors are never cached. Concurrent lookups for the
+    same key share one request.
+    """
+
+    def __init__(self, geo_url=GEO_API_URL, whois_url=WHOIS_API_URL, geo_cache=None, whois_cache=None, session=None, geoip=None):
+        self.geo_url = geo_url.rstrip("/")
+        if geoip is None and GEOIP_DATABASE and os.path.exists(GEOIP_DATABASE):
+            geoip = MaxMindDatabase(GEOIP_DATABASE)
+        self.geoip = geoip
+        self.whois_url = whois_url
+        self.geo_cache = geo_cache if geo_cache is not None else DiskCache(GEO_CACHE_FILE, GEO_CACHE_TTL, ENRICH_CACHE_SIZE)
+        self.whois_cache = whois_cache if whois_cache is not None else DiskCache(WHOIS_CACHE_FILE, WHOIS_CACHE_TTL, ENRICH_CACHE_SIZE)
+        self.session = session or _http_session()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=HTTP_POOL_SIZE)
+        self.batch_supported = GEO_BATCH_SIZE > 1
+        self.requests_sent = 0
+        self.inflight = {}
+        self.geo_batch = []
+        self.geo_timer = None
+
+    def fetch_geo(self, address):
+        """Look up one IP address, returning "City, Country" or None on failure."""
+        import requests
+        try:
+            self.requests_sent += 1
+            response = self.session.get(f"{self.geo_url}/{address}/json", params=self._geo_params(), timeout=HTTP_TIMEOUT)
+            _record_http(response)
+            response.raise_for_status()
+            return _format_location(response.json())
+        except (requests.exceptions.RequestException, ValueError) as e:
+            _record_http(error=e)
+            return None
+
+    def fetch_geo_batch(self, addresses):
+        """Look up many IP addresses in one request; returns {address: location} or None if batching failed."""
+        import requests
+        try:
+            self.requests_sent += 1
+            response = self.session.post(f"{self.geo_url}/batch", json=list(addresses), params=self._geo_params(), timeout=HTTP_TIMEOUT)
+            _record_http(response)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            _record_http(error=e)
+            return None
+        return {address: _format_location(data[address]) if isinstance(data.get(address), dict) else None for address in addresses}
+
+    def _geo_params(self):
+        return {"token": GEO_API_TOKEN} if GEO_API_TOKEN else None
+
+    def fetch_whois(self, domain):
+        """Fetch domain details using the WHOIS API."""
+        import requests
+        try:
+            self.requests_sent += 1
+            response = self.session.get(
+                self.whois_url,
+                params={"domainName": domain, "apiKey": WHOIS_API_KEY, "outputFormat": "json"},
+                timeout=HTTP_TIMEOUT,
+            )
+            _record_http(response)
+            response.raise_for_status()  # Raise an exception for HTTP errors
+            data = response.json()
+
+            if data.get("WhoisRecord"):
+                return _parse_whois_record(data["WhoisRecord"])
+            else:
+                return {"error": "No WhoisRecord found"}
+        except requests.exceptions.RequestException as e:
+            _record_http(error=e)
+            return {"error": f"API request failed: {e}"}
+        except json.JSONDecodeError:
+            return {"error": "Failed to decode JSON response from API"}
+        except Exception as e:
+            return {"error": f"An unexpected error occurred: {e}"}
+
+    def local_geo(self, address):
+        """Look the address up in the local GeoIP database, returning None on a miss."""
+        return self.geoip.location(address) if self.geoip is not None else None
+
+    def geo(self, address):
+        """Return the location of an IP address, using the cache when fresh."""
+        location = self.local_geo(address)
+        if location is not None or (self.geoip is not None and not GEO_REMOTE_FALLBACK):
+            return location or "Unknown"
+        location = self.geo_cache.get(address)
+        if location is None:
+            location = self.fetch_geo(address)
+            if location is not None:
+                self.geo_cache.put(address, location)
+        return location or "Unknown"
+
+    def whois(self, website_name):
+        """Return the WHOIS details of a website's registrable domain, using the cache when fresh."""
+        domain = registrable_domain(website_name)
+        details = self.whois_cache.get(domain)
+        if details is None:
+            details = self.fetch_whois(domain)
+            if "error" not in details:
+                self.whois_cache.put(domain, details)
+        return details
+
+    async def _coalesce(self, key, start):
+        """Await the in-flight lookup for `key`, starting it with `start(future)` if there is none."""
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.inflight[key] = future
+            start(future)
+        return await asyncio.shield(future)
+
+    def _complete(self, key, value):
+        future = self.inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(value)
+
+    async def geo_async(self, address):
+        """Return the location of an IP address from a running event loop."""
+        location = self.local_geo(address)
+        if location is not None or (self.geoip is not None and not GEO_REMOTE_FALLBACK):
+            return location or "Unknown"
+        location = self.geo_cache.get(address)
+        if location is not None:
+            return location
+
+        def start(future):
+            if self.batch_supported:
+                self.geo_batch.append(address)
+                if len(self.geo_batch) >= GEO_BATCH_SIZE:
+                    self._flush_geo_batch()
+                elif self.geo_timer is None:
+                    self.geo_timer = asyncio.get_running_loop().call_later(GEO_BATCH_DELAY, self._flush_geo_batch)
+            else:
+                asyncio.ensure_future(self._fetch_geo_async([address]))
+
+        return await self._coalesce(("geo", address), start)
+
+    def _flush_geo_batch(self):
+        if self.geo_timer is not None:
+            self.geo_timer.cancel()
+            self.geo_timer = None
+        batch, self.geo_batch = self.geo_batch, []
+        if batch:
+            asyncio.ensure_future(self._fetch_geo_async(batch))
+
+    async def _fetch_geo_async(self, addresses):
+        loop = asyncio.get_running_loop()
+        locations = {}
+        try:
+            if len(addresses) > 1 or self.batch_supported:
+                locations = await loop.run_in_executor(self.executor, contextvars.copy_context().run, self.fetch_geo_batch, addresses)
+                if locations is None:
+                    self.batch_supported = False
+                    locations = {}
+            missing = [address for address in addresses if address not in locations]
+            fetched = await asyncio.gather(*(loop.run_in_executor(self.executor, contextvars.copy_context().run, self.fetch_geo, address) for address in missing))
+            locations.update(zip(missing, fetched))
+        finally:
+            for address in addresses:
+                location = locations.get(address)
+                if location is not None:
+                    self.geo_cache.put(address, location)
+                self._complete(("geo", address), location or "Unknown")
+
+    async def whois_async(self, website_name):
+        """Return the WHOIS details of a website's registrable domain from a running event loop."""
+        domain = registrable_domain(website_name)
+        details = self.whois_cache.get(domain)
+        if details is not None:
+            return details
+
+        def start(future):
+            asyncio.ensure_future(self._fetch_whois_async(domain))
+
+        return await self._coalesce(("whois", domain), start)
+
+    async def _fetch_whois_async(self, domain):
+        details = {"error": "WHOIS lookup did not complete"}
+        try:
+            details = await asyncio.get_running_loop().run_in_executor(self.executor, contextvars.copy_context().run, self.fetch_whois, domain)
+            if "error" not in details:
+                self.whois_cache.put(domain, details)
+        finally:
+            self._complete(("whois", domain), details)
+
+    def save(self):
+        """Persist both caches."""
+        self.geo_cache.save()
+        self.whois_cache.save()
+
+    def close(self):
+        self.save()
+        self.executor.shutdown(wait=False)
+        self.session.close()
+        if self.geoip is not None:
+            self.geoip.close()
+
+_enricher = None
+
+def get_enricher():
+    """Return the shared enrichment client, creating it on first use."""
+    global _enricher
+    with _prober_lock:
+        if _enricher is None:
+            _enricher = Enricher()
+        return _enricher
+
+def set_enricher(enricher):
+    """Install an enrichment client (e.g. one pointed at a local mock server)."""
+    global _enricher
+    with _prober_lock:
+        _enricher = enricher
+
+# Span that probes, DNS queries and HTTP requests are charged to, and the active tracer (None = off)
+_current_span = contextvars.ContextVar("buffer_checker_span", default=None)
+_tracer = None
+
+class Span:
+    """Wall time and traffic of one stage for one target."""
+
+    __slots__ = ("target", "stage", "queued", "start", "end", "probes", "timeouts", "retries", "bytes_sent")
+
+    def __init__(self, target, stage, queued, start):
+        self.target = target
+        self.stage = stage
+        self.queued = queued
+        self.start = start
+        self.end = None
+        self.probes = self.timeouts = self.retries = self.bytes_sent = 0
+
+    def probe(self, size, reply):
+        """Charge one echo probe of `size` payload bytes and its outcome."""
+        self.probes += 1
+        self.bytes_sent += size + ICMP_OVERHEAD
+        if reply.status == TIMEOUT:
+            self.timeouts += 1
+
+def _record_http(response=None, error=None):
+    """Charge an HTTP request (or one that failed without a response) to the current span."""
+    span = _current_span.get()
+    if span is None:
+        return
+    if response is not None:
+        span.probes += 1
+        span.bytes_sent += len(response.request.url) + len(response.request.body or b"")
+        retries = getattr(response.raw, "retries", None)
+        if retries is not None:
+            span.retries += len(retries.history)
+    elif error is not None and getattr(error, "response", None) is None:
+        import requests
+        if isinstance(error, requests.exceptions.RequestException):
+            span.probes += 1
+            span.timeouts += isinstance(error, requests.exceptions.Timeout)
+
+class Tracer:
+    """Collects a Span per stage and target; exports Chrome trace events and a per-stage summary.
+
+    Probes count ICMP echoes (or ping subprocesses with the subprocess backend), DNS queries
+    and HTTP requests. Batched geo requests are charged to the target that opened the batch.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.started_at = time.time()
+
+    @contextlib.contextmanager
+    def span(self, target, stage, queued=None):
+        start = time.perf_counter()
+        span = Span(target, stage, queued if queued is not None else start, start)
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+            span.end = time.perf_counter()
+            with self.lock:
+                self.spans.append(span)
+
+    def trace_events(self):
+        """Return the spans as Chrome trace events, one track per target."""
+        tracks = {}
+        events = [{"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": "buffer_checker"}}]
+        with self.lock:
+            spans = list(self.spans)
+        for span in spans:
+            if span.target not in tracks:
+                tracks[span.target] = len(tracks) + 1
+                events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tracks[span.target], "args": {"name": str(span.target)}})
+            events.append({
+                "name": span.stage, "cat": "stage", "ph": "X", "pid": os.getpid(), "tid": tracks[span.target],
+                "ts": round((span.start - self.origin) * 1e6), "dur": round((span.end - span.start) * 1e6),
+                "args": {"target": span.target, "queued_ms": round((span.start - span.queued) * 1000, 3), "probes": span.probes,
+                         "timeouts": span.timeouts, "retries": span.retries, "bytes_sent": span.bytes_sent},
+            })
+        return events
+
+    def write_chrome_trace(self, filename):
+        """Write a trace viewable in chrome://tracing or Perfetto."""
+        with open(filename, "w", encoding="utf-8") as tracefile:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms", "otherData": {"started_at": self.started_at}}, tracefile)
+
+    def summary(self):
+        """Return per-stage rows: spans, total/mean/p99/max wall time, queue time and traffic."""
+        by_stage = collections.defaultdict(list)
+        with self.lock:
+            for span in self.spans:
+                by_stage[span.stage].append(span)
+        rows = []
+        for stage in ("dns",) + SCAN_STAGES:
+            spans = by_stage.get(stage)
+            if not spans:
+                continue
+            durations = sorted(span.end - span.start for span in spans)
+            rows.append([
+                stage, len(spans), round(sum(durations), 2), round(sum(durations) / len(durations) * 1000, 1),
+                round(durations[min(int(len(durations) * 0.99), len(durations) - 1)] * 1000, 1), round(durations[-1] * 1000, 1),
+                round(sum(span.start - span.queued for span in spans), 2), sum(span.probes for span in spans),
+                sum(span.timeouts for span in spans), sum(span.retries for span in spans), sum(span.bytes_sent for span in spans),
+            ])
+        return rows
+
+    def print_summary(self):
+        from tabulate import tabulate
+        headers = ["Stage", "Spans", "Total (s)", "Mean (ms)", "p99 (ms)", "Max (ms)", "Queued (s)", "Probes", "Timeouts", "Retries", "Bytes Sent"]
+        print(tabulate(self.summary(), headers=headers, tablefmt="fancy_grid"))
+
+def get_tracer():
+    """Return the active Tracer, or None when instrumentation is off."""
+    return _tracer
+
+def set_tracer(tracer):
+    """Install a Tracer for all subsequent scans (None turns instrumentation off)."""
+    global _tracer
+    _tracer = tracer
+
+def _stage_semaphores(limits):
+    """Create one semaphore per scan stage."""
+    return {stage: asyncio.Semaphore(limit) for stage, limit in limits.items()}
+
+class ScanContext:
+    """State shared by every target of one scan run: stage limits, probe backend, caches and in-flight work."""
+
+    def __init__(self, prober=None, stage_limits=None, path_cache=None, resolver=None, enricher=None, stages=None):
+        self.stages = set(SCAN_STAGES if stages is None else stages)
+        self.limits = dict(STAGE_LIMITS, **(stage_limits or {}))
+        self.semaphores = _stage_semaphores(self.limits)
+        self.prober = prober or get_prober()
+        self.resolver = resolver or get_resolver()
+        self.enricher = enricher or get_enricher()
+        self.path_cache = path_cache
+        # address: [measurement task, targets waiting on it]; dropped when the last of them finishes
+        self.paths = {}
+        # Without a path cache, finished measurements by address (most recent PATH_RECENT_SIZE)
+        self.recent_paths = OrderedDict()
+
+    async def stage(self, name, coroutine, target=None):
+        """Run a stage coroutine inside its concurrency limit, recording a span for `target` when tracing."""
+        tracer = _tracer
+        if tracer is None:
+            async with self.semaphores[name]:
+                return await coroutine
+        queued = time.perf_counter()
+        async with self.semaphores[name]:
+            with tracer.span(target, name, queued):
+                return await coroutine
+
+    async def path(self, address, session):
+        """Measure (max buffer size, hop count) for an address, sharing one measurement between the targets in flight for it."""
+        if address in self.recent_paths:
+            self.recent_paths.move_to_end(address)
+            return self.recent_paths[address]
+        shared = self.paths.get(address)
+        if shared is None:
+            shared = self.paths[address] = [asyncio.ensure_future(measure_path(address, session, self)), 0]
+        shared[1] += 1
+        try:
+            return await asyncio.shield(shared[0])
+        finally:
+            shared[1] -= 1
+            if shared[1] == 0:
+                del self.paths[address]
+                task = shared[0]
+                # With a path cache, later targets for the address are answered from it instead
+                if self.path_cache is None and task.done() and not task.cancelled() and task.exception() is None:
+                    self.recent_paths[address] = task.result()
+                    if len(self.recent_paths) > PATH_RECENT_SIZE:
+                        self.recent_paths.popitem(last=False)
+
+    def close(self):
+        self.enricher.save()
+        if self.path_cache is not None:
+            self.path_cache.save()
+
+async def measure_path(address, session, context):
+    """Return (max buffer size, hop count) for a destination, taking each from the path cache when fresh.
+
+    Stages not selected for the run come back as "N/A".
+    """
+    cache = context.path_cache
+    entry = (cache.get(address) if cache is not None else None) or {}
+    measure_hops = "hops" in context.stages and entry.get("hops") is None
+    measure_mtu = "mtu" in context.stages and entry.get("pmtu") is None
+
+    async def skipped():
+        return None
+
+    ttl_hops, pmtu = await asyncio.gather(
+        context.stage("hops", get_ttl_hops_async(address, context.prober, session), address) if measure_hops else skipped(),
+        context.stage("mtu", search_path_mtu_async(address, context.prober), address) if measure_mtu else skipped(),
+    )
+    size = pmtu.size if pmtu is not None else None
+    # Each measurement is cached on its own, so a run with only some stages still fills the cache
+    if cache is not None and (size or isinstance(ttl_hops, int)):
+        cache.put(address, size or None, ttl_hops if isinstance(ttl_hops, int) else None, session.samples.reply_ttl if session and isinstance(ttl_hops, int) else None)
+    if "mtu" not in context.stages:
+        size = "N/A"
+    elif not measure_mtu:
+        size = entry["pmtu"]
+    if "hops" not in context.stages:
+        ttl_hops = "N/A"
+    elif not measure_hops:
+        ttl_hops = entry["hops"]
+    return size, ttl_hops
+
+async def scan_target(website_name, context=None):
+    """Run the selected stages for one website concurrently and return its ScanResult."""
+    if context is None:
+        context = ScanContext()
+        try:
+            return await scan_target(website_name, context)
+        finally:
+            context.close()
+    stages = context.stages
+
+    async def skipped(value):
+        return value
+
+    # Start the WHOIS lookup now so it overlaps DNS; it needs only the name
+    whois = asyncio.ensure_future(context.stage("whois", context.enricher.whois_async(website_name), website_name) if "whois" in stages else skipped({}))
     try:
-        response = requests.get(
-            f"https://www.whoisxmlapi.com/whoisserver/WhoisService?domainName={website_name}&apiKey={WHOIS_API_KEY}&outputFormat=json"
-        )
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        data = response.json()
-
-        if data.get("WhoisRecord"):
-            record = data["WhoisRecord"]
-            registrant = record.get("registrant", {})
-            administrative_contact = record.get("administrativeContact", {})
-            technical_contact = record.get("technicalContact", {})
-            registry_data = record.get("registryData", {})
-
-            domain_details = {
-                "registrar": record.get("registrarName", "N/A"),
-                "created_date": record.get("createdDate", "N/A"),
-                "updated_date": record.get("updatedDate", "N/A"),
-                "expires_date": record.get("expiresDate", "N/A"),
-                "name_servers": ", ".join(record.get("nameServers", {}).get("hostNames", ["N/A"])),
-                "status": ", ".join(record.get("status", ["N/A"])),
-                "registrant": {
-                    "organization": registrant.get("organization", "N/A"),
-                    "state": registrant.get("state", "N/A"),
-                    "country": registrant.get("country", "N/A"),
-                    "country_code": registrant.get("countryCode", "N/A"),
-                },
-                "administrative_contact": {
-                    "organization": administrative_contact.get("organization", "N/A"),
-                    "state": administrative_contact.get("state", "N/A"),
-                    "country": administrative_contact.get("country", "N/A"),
-                    "country_code": administrative_contact.get("countryCode", "N/A"),
-                },
-                "technical_contact": {
-                    "organization": technical_contact.get("organization", "N/A"),
-                    "state": technical_contact.get("state", "N/A"),
-                    "country": technical_contact.get("country", "N/A"),
-                    "country_code": technical_contact.get("countryCode", "N/A"),
-                },
-                "registry_data": {
-                    "created_date": registry_data.get("createdDate", "N/A"),
-                    "updated_date": registry_data.get("updatedDate", "N/A"),
-                    "expires_date": registry_data.get("expiresDate", "N/A"),
-                    "whois_server": registry_data.get("whoisServer", "N/A"),
-                },
-                "domain_availability": record.get("domainAvailability", "N/A"),
-                "contact_email": record.get("contactEmail", "N/A"),
-                "estimated_domain_age": record.get("estimatedDomainAge", "N/A"),
-                "ips": ", ".join(record.get("ips", ["N/A"])),
-            }
-            return domain_details
-        else:
-            return {"error": "No WhoisRecord found"}
-    except requests.exceptions.RequestException as e:
-        return {"error": f"API request failed: {e}"}
-    except json.JSONDecodeError:
-        return {"error": "Failed to decode JSON response from API"}
+        addresses = await context.stage("dns", context.resolver.resolve_async(website_name), website_name)
+    except BaseException:
+        whois.cancel()
+        raise
+    address = pick_address(addresses)
+    if address is None:
+        return ScanResult(website_name, 0, "N/A", "N/A", "N/A", "Unknown", await whois, scanned_at=time.time())
+    session = EchoSession(address, prober=context.prober) if "echo" in stages else None
+    # Start the burst before the path measurement awaits it, so its probes are charged to the echo stage
+    echo = asyncio.ensure_future(context.stage("echo", session.run_async(), website_name)) if session else skipped(None)
+
+    # Names in flight for the same address share one path measurement; later ones hit the path cache
+    if "mtu" in stages or "hops" in stages:
+        path = context.path(address, session)
+    else:
+        path = skipped(("N/A", "N/A"))
+
+    (max_buffer_size, ttl_hops), _, geo_location, domain_details = await asyncio.gather(
+        path,
+        echo,
+        context.stage("geo", context.enricher.geo_async(address), website_name) if "geo" in stages else skipped("N/A"),
+        whois,
+    )
+    if session is None:
+        return ScanResult(website_name, max_buffer_size, ttl_hops, "N/A", "N/A", geo_location, domain_details, address, scanned_at=time.time())
+    latency = get_latency(website_name, session)
+    packet_loss = get_packet_loss(website_name, session)
+    return ScanResult(
+        website_name, max_buffer_size, ttl_hops, latency, packet_loss, geo_location, domain_details,
+        address, get_jitter(website_name, session), session.samples.reply_ttl, time.time(),
+    )
+
+def _failed_result(website_name, error):
+    """Build the ScanResult reported for a target whose scan raised `error`."""
+    return ScanResult(website_name, 0, "N/A", "N/A", "N/A", "Unknown", {"error": f"Scan failed: {error}"}, scanned_at=time.time())
+
+async def _scan_target_safely(website_name, context):
+    """Scan one website, reporting an unexpected failure as an error result so the rest of the run carries on."""
+    try:
+        return await scan_target(website_name, context)
     except Exception as e:
-        return {"error": f"An unexpected error occurred: {e}"}
+        return _failed_result(website_name, e)
+
+async def scan_targets(websites, concurrency=SCAN_CONCURRENCY, stage_limits=None, prober=None, path_cache=None, resolver=None, enricher=None, stages=None):
+    """Scan websites with at most `concurrency` in flight, yielding ScanResults as they complete.
+
+    `websites` may be any iterable, including a lazy one; it is only advanced as slots free up.
+    `stages` limits the run to a subset of SCAN_STAGES. A target whose scan fails is
+    yielded as a result with an "error" entry in its domain details.
+    """
+    context = ScanContext(prober, stage_limits, path_cache, resolver, enricher, stages)
+    try:
+        websites = iter(websites)
+        pending = set()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                website = next(websites, None)
+                if website is None:
+                    exhausted = True
+                    break
+                pending.add(asyncio.ensure_future(_scan_target_safely(website, context)))
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        context.close()
 
 def find_max_buffer(website_name):
     """Find the maximum buffer size for the website."""
-    low, high = 1000, 1500
-    last_working_size = 0
-    ttl_hops = get_ttl_hops(website_name)
-    latency = get_latency(website_name)
-    packet_loss = get_packet_loss(website_name)
-    geo_location = get_geo_location(website_name)
-    domain_details = get_domain_details(website_name)
-
-    with tqdm(total=(high - low), desc=f"{Fore.GREEN}{website_name}{Style.RESET_ALL}", leave=False, bar_format="{l_bar}{bar}{r_bar}") as pbar:
-        while low <= high:
-            buffer_size = (low + high) // 2
-
-            command = ["ping", website_name, "-c", "1", "-M", "do", "-s", str(buffer_size)] if platform.system().lower() != "windows" else ["ping", website_name, "-n", "1", "-f", "-l", str(buffer_size)]
-
-            result = subprocess.run(command, capture_output=True, text=True)
-            output = result.stdout
-
-            if "TTL=" in output:
-                last_working_size = buffer_size
-                low = buffer_size + 1
-            elif "Packet needs to be fragmented" in output or "Message too long" in result.stderr:
-                high = buffer_size - 1
-            else:
-                low = buffer_size + 1
+    return asyncio.run(scan_target(website_name))
+
+REPORT_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Advanced Buffer Checker Report</title>
+    <style>
+        body {
+            font-family: 'Poppins', 'Segoe UI', Roboto, Helvetica, Arial, sans-serif;
+            margin: 0;
+            padding: 20px;
+            background: linear-gradient(to right, #2c3e50, #4ca1af);
+            background-attachment: fixed;
+            color: #fff;
+        }
+        .container {
+            max-width: 1200px;
+            margin: auto;
+            padding: 25px;
+            background: rgba(255, 255, 255, 0.1);
+            border-radius: 12px;
+            box-shadow: 0 10px 30px rgba(0,0,0,0.3);
+        }
+        .header {
+            font-size: 35px;
+            font-weight: bold;
+            text-align: center;
+            padding-bottom: 15px;
+            border-bottom: 4px solid #fff;
+            margin-bottom: 20px;
+        }
+        .toolbar {
+            display: flex;
+            gap: 10px;
+            margin-bottom: 20px;
+        }
+        #search-input {
+            flex: 1;
+            padding: 10px;
+            font-size: 16px;
+            border-radius: 5px;
+            border: 1px solid #ddd;
+        }
+        select {
+            padding: 10px;
+            font-size: 16px;
+            border-radius: 5px;
+        }
+        #latency-chart {
+            width: 100%;
+            height: 160px;
+            margin-bottom: 20px;
+        }
+        .detail-table {
+            width: 100%;
+            border-collapse: collapse;
+        }
+        .detail-table th, .detail-table td {
+            border: 1px solid #ddd;
+            padding: 8px 10px;
+            text-align: left;
+            color: #fff;
+        }
+        .detail-table th {
+            background-color: #f1c40f;
+            cursor: pointer;
+            user-select: none;
+        }
+        .detail-table tr.result:hover {
+            background: rgba(255, 255, 255, 0.15);
+            cursor: pointer;
+        }
+        .detail-table tr.details td {
+            background: rgba(0, 0, 0, 0.2);
+            font-size: 14px;
+        }
+        .website-title {
+            color: #f1c40f;
+            font-weight: bold;
+        }
+        .pagination {
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            gap: 10px;
+            margin-top: 20px;
+        }
+        .pagination button {
+            background-color: #f1c40f;
+            border: none;
+            color: white;
+            padding: 10px 15px;
+            font-size: 16px;
+            cursor: pointer;
+            border-radius: 5px;
+        }
+        .pagination button:hover {
+            background-color: #e67e22;
+        }
+        .footer {
+            text-align: center;
+            margin-top: 40px;
+            color: #ddd;
+            font-size: 15px;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">🚀 Advanced Buffer Checker Report</div>
+        <div class="toolbar">
+            <input type="text" id="search-input" placeholder="Search websites..." oninput="applyFilter()" />
+            <select id="page-size" onchange="changePageSize()">
+                <option>25</option><option selected>50</option><option>100</option><option>500</option>
+            </select>
+        </div>
+        <canvas id="latency-chart"></canvas>
+        <table class="detail-table">
+            <thead><tr id="columns"></tr></thead>
+            <tbody id="rows"></tbody>
+        </table>
+        <div class="pagination">
+            <button onclick="goToPage(page - 1)">Previous</button>
+            <span id="page-info"></span>
+            <button onclick="goToPage(page + 1)">Next</button>
+        </div>
+        <div class="footer" id="footer"></div>
+    </div>
+    <script>
+const DATA = [
+"""
+
+REPORT_TAIL = """];
+const GENERATED = %s;
+const COLUMNS = ["Website", "Max Buffer Size (bytes)", "TTL Hops", "Latency (ms)", "Packet Loss", "Geo Location"];
+let view = [], page = 0, pageSize = 50, sortColumn = -1, sortAscending = true, expanded = new Set();
+
+function esc(value) {
+    return String(value === null || value === undefined || value === "" ? "N/A" : value)
+        .replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;").replace(/"/g, "&quot;");
+}
+function label(key) {
+    return key.replace(/_/g, " ").replace(/\\b\\w/g, function(c) { return c.toUpperCase(); });
+}
+function sortKey(value) {
+    const number = parseFloat(value);
+    return isNaN(number) ? String(value).toLowerCase() : number;
+}
+function applyFilter() {
+    const filter = document.getElementById("search-input").value.toLowerCase();
+    view = [];
+    for (let i = 0; i < DATA.length; i++) {
+        if (!filter || DATA[i].slice(0, 6).join(" ").toLowerCase().includes(filter)) view.push(i);
+    }
+    applySort();
+}
+function applySort() {
+    if (sortColumn >= 0) {
+        view.sort(function(a, b) {
+            const x = sortKey(DATA[a][sortColumn]), y = sortKey(DATA[b][sortColumn]);
+            if (typeof x !== typeof y) return typeof x === "number" ? -1 : 1;
+            return (x < y ? -1 : x > y ? 1 : 0) * (sortAscending ? 1 : -1);
+        });
+    }
+    goToPage(0);
+}
+function sortBy(column) {
+    sortAscending = sortColumn === column ? !sortAscending : true;
+    sortColumn = column;
+    renderColumns();
+    applySort();
+}
+function changePageSize() {
+    pageSize = parseInt(document.getElementById("page-size").value, 10);
+    goToPage(0);
+}
+function goToPage(target) {
+    const pages = Math.max(1, Math.ceil(view.length / pageSize));
+    page = Math.min(Math.max(target, 0), pages - 1);
+    render();
+    document.getElementById("page-info").textContent = "Page " + (page + 1) + " of " + pages + " (" + view.length + " of " + DATA.length + " websites)";
+}
+function toggle(index) {
+    if (expanded.has(index)) expanded.delete(index); else expanded.add(index);
+    render();
+}
+function detailRows(details) {
+    if (!details || typeof details !== "object") return "<tr><td colspan='2' style='color: red;'><strong>Error:</strong> Invalid domain details format</td></tr>";
+    let html = "";
+    for (const key in details) {
+        const value = details[key];
+        if (value && typeof value === "object") {
+            for (const subKey in value) html += "<tr><td>" + esc(label(key) + " " + label(subKey)) + "</td><td>" + esc(value[subKey]) + "</td></tr>";
+        } else {
+            html += "<tr><td>" + esc(label(key)) + "</td><td>" + esc(value) + "</td></tr>";
+        }
+    }
+    return html;
+}
+function renderColumns() {
+    document.getElementById("columns").innerHTML = COLUMNS.map(function(name, i) {
+        return "<th onclick='sortBy(" + i + ")'>" + esc(name) + (i === sortColumn ? (sortAscending ? " ▲" : " ▼") : "") + "</th>";
+    }).join("");
+}
+function render() {
+    const slice = view.slice(page * pageSize, (page + 1) * pageSize);
+    let html = "";
+    for (const index of slice) {
+        const row = DATA[index];
+        html += "<tr class='result' onclick='toggle(" + index + ")'><td class='website-title'>" + esc(row[0]) + "</td>";
+        for (let i = 1; i < 6; i++) html += "<td>" + esc(row[i]) + "</td>";
+        html += "</tr>";
+        if (expanded.has(index)) {
+            html += "<tr class='details'><td colspan='6'><table class='detail-table'>" + detailRows(row[6]) + "</table></td></tr>";
+        }
+    }
+    document.getElementById("rows").innerHTML = html;
+    drawChart(slice);
+}
+function drawChart(slice) {
+    const canvas = document.getElementById("latency-chart");
+    const width = canvas.width = canvas.clientWidth, height = canvas.height = canvas.clientHeight;
+    const context = canvas.getContext("2d");
+    const values = slice.map(function(index) { const v = parseFloat(DATA[index][3]); return isNaN(v) ? 0 : v; });
+    const top = Math.max.apply(null, values.concat([1]));
+    const bar = width / Math.max(values.length, 1);
+    context.clearRect(0, 0, width, height);
+    context.fillStyle = "rgba(241, 196, 15, 0.7)";
+    values.forEach(function(value, i) {
+        const h = (height - 20) * value / top;
+        context.fillRect(i * bar + 1, height - h, Math.max(bar - 2, 1), h);
+    });
+    context.fillStyle = "#fff";
+    context.font = "12px sans-serif";
+    context.fillText("Latency (ms), max " + top.toFixed(2), 4, 12);
+}
+document.getElementById("footer").textContent = "Report generated on " + GENERATED + " by Advanced Buffer Checker";
+renderColumns();
+applyFilter();
+    </script>
+</body>
+</html>
+"""
+
+def _report_json(value):
+    """Serialize a value compactly for embedding inside a <script> element."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str).replace("</", "<\\/").replace("\u2028", "\\u2028").replace("\u2029", "\\u2029")
+
+class HtmlReportWriter:
+    """Write one self-contained HTML report incrementally as results arrive.
+
+    Each result is appended to an embedded JSON array as soon as it is added, so memory use
+    stays flat however many targets are scanned; searching, sorting and pagination happen
+    client-side over that array. The report needs no external CSS, fonts or scripts.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.count = 0
+        self.htmlfile = open(filename, "w", encoding="utf-8")
+        self.htmlfile.write(REPORT_HEAD)
+
+    def add(self, result):
+        """Append one result row to the report."""
+        self.htmlfile.write(("," if self.count else "") + _report_json(result[:7]) + "\n")
+        self.count += 1
+
+    def flush(self):
+        self.htmlfile.flush()
+
+    def close(self):
+        """Write the closing script and markup."""
+        if not self.htmlfile.closed:
+            self.htmlfile.write(REPORT_TAIL % _report_json(time.strftime('%Y-%m-%d %H:%M:%S')))
+            self.htmlfile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _number(value, kind=float):
+    """Convert a display value such as 12.5, "25%" or "N/A" to a number, or None."""
+    if isinstance(value, str):
+        value = value.rstrip("%")
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+def result_record(result):
+    """Map a scan result onto RESULT_SCHEMA with numeric fields as numbers (None when unknown)."""
+    if not isinstance(result, ScanResult):
+        result = ScanResult(*result)
+    return {
+        "website": result.website,
+        "ip": result.ip,
+        "max_buffer_size": _number(result.max_buffer_size, int),
+        "ttl_hops": _number(result.ttl_hops, int),
+        "latency_ms": _number(result.latency),
+        "jitter_ms": _number(result.jitter),
+        "packet_loss_pct": _number(result.packet_loss),
+        "reply_ttl": _number(result.reply_ttl, int),
+        "geo_location": result.geo_location,
+        "domain_details": result.domain_details,
+        "scanned_at": result.scanned_at,
+    }
 
-            pbar.update(1)
+class ResultSink:
+    """Base class for outputs fed as results complete; records are buffered and written in batches."""
 
-    return [website_name, last_working_size, ttl_hops, latency, packet_loss, geo_location, domain_details]
+    def __init__(self, filename, batch_size=SINK_BATCH_SIZE, flush_interval=SINK_FLUSH_INTERVAL):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.batch = []
+        self.count = 0
+        self.last_flush = time.monotonic()
 
-def generate_html_report(results, website_name, filename=None):
-    """Generate a more advanced, visually stunning, and interactive HTML report with advanced search, pagination, charts, and dynamic table sorting."""
+    def add(self, result):
+        """Queue one result, writing the batch once it is full or old enough."""
+        self.batch.append(result_record(result))
+        self.count += 1
+        if len(self.batch) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write any buffered records."""
+        if self.batch:
+            self.write(self.batch)
+            self.batch = []
+        self.last_flush = time.monotonic()
+
+    def write(self, records):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class JsonlSink(ResultSink):
+    """Append one JSON object per result to a .jsonl file."""
+
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.outfile = open(filename, "a", encoding="utf-8")
+
+    def write(self, records):
+        self.outfile.write("".join(json.dumps(record, separators=(",", ":"), default=str) + "\n" for record in records))
+        self.outfile.flush()
+
+    def close(self):
+        super().close()
+        self.outfile.close()
+
+class CsvSink(ResultSink):
+    """Append results to a CSV file; the WHOIS details column holds JSON."""
+
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, **kwargs)
+        new_file = not os.path.exists(filename) or os.path.getsize(filename) == 0
+        self.outfile = open(filename, "a", encoding="utf-8", newline="")
+        import csv
+        self.writer = csv.DictWriter(self.outfile, fieldnames=[name for name, _ in RESULT_SCHEMA])
+        if new_file:
+            self.writer.writeheader()
+
+    def write(self, records):
+        self.writer.writerows(
+            dict(record, domain_details=json.dumps(record["domain_details"], separators=(",", ":"), default=str))
+            for record in records
+        )
+        self.outfile.flush()
+
+    def close(self):
+        super().close()
+        self.outfile.close()
+
+class ParquetSink(ResultSink):
+    """Write results to a Parquet file, one row group per batch (requires pyarrow)."""
+
+    def __init__(self, filename, batch_size=PARQUET_BATCH_SIZE, **kwargs):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet output requires pyarrow: pip install pyarrow") from None
+        super().__init__(filename, batch_size=batch_size, **kwargs)
+        types = {"string": pyarrow.string(), "int": pyarrow.int64(), "float": pyarrow.float64(), "json": pyarrow.string()}
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind in RESULT_SCHEMA])
+        self.writer = pyarrow.parquet.ParquetWriter(filename, self.schema)
+
+    def write(self, records):
+        rows = [dict(record, domain_details=json.dumps(record["domain_details"], separators=(",", ":"), default=str)) for record in records]
+        self.writer.write_table(self.pyarrow.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        super().close()
+        self.writer.close()
+
+RESULT_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    command TEXT,
+    results INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS whois (
+    id INTEGER PRIMARY KEY,
+    digest BLOB NOT NULL UNIQUE,
+    details TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    website TEXT NOT NULL,
+    ip TEXT,
+    max_buffer_size INTEGER,
+    ttl_hops INTEGER,
+    latency_ms REAL,
+    jitter_ms REAL,
+    packet_loss_pct REAL,
+    reply_ttl INTEGER,
+    geo_location TEXT,
+    whois_id INTEGER REFERENCES whois (id),
+    scanned_at REAL NOT NULL,
+    PRIMARY KEY (run_id, website)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_website ON results (website, scanned_at);
+CREATE INDEX IF NOT EXISTS results_ip ON results (ip);
+CREATE INDEX IF NOT EXISTS results_scanned_at ON results (scanned_at);
+"""
+
+def open_result_store(filename):
+    """Open (creating if needed) a SQLite result store.
+
+    Results are clustered by (run, website), so each run is appended at the end of the table
+    and diffing two runs costs one index probe per target, however much history is stored.
+    """
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    import sqlite3
+    db = sqlite3.connect(filename)
+    db.execute("PRAGMA journal_mode = WAL")
+    db.execute("PRAGMA synchronous = NORMAL")
+    db.execute("PRAGMA cache_size = -65536")
+    db.executescript(RESULT_STORE_SCHEMA)
+    return db
+
+class SqliteSink(ResultSink):
+    """Append results to a SQLite result store as one run, one transaction per batch.
+
+    Identical WHOIS details are stored once and referenced by id. `command` is the argument
+    list recorded with the run (default: this process's command line).
+    """
+
+    def __init__(self, filename, batch_size=SQLITE_BATCH_SIZE, command=None, **kwargs):
+        super().__init__(filename, batch_size=batch_size, **kwargs)
+        self.db = open_result_store(filename)
+        self.whois_ids = {}
+        command = " ".join(sys.argv[1:] if command is None else command)
+        with self.db:
+            self.run_id = self.db.execute("INSERT INTO runs (started_at, command) VALUES (?, ?)", (time.time(), command)).lastrowid
+
+    def _whois_id(self, details):
+        if not details:
+            return None
+        text = json.dumps(details, sort_keys=True, separators=(",", ":"), default=str)
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        whois_id = self.whois_ids.get(digest)
+        if whois_id is None:
+            self.db.execute("INSERT OR IGNORE INTO whois (digest, details) VALUES (?, ?)", (digest, text))
+            whois_id = self.whois_ids[digest] = self.db.execute("SELECT id FROM whois WHERE digest = ?", (digest,)).fetchone()[0]
+        return whois_id
+
+    def write(self, records):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO results (run_id, website, ip, max_buffer_size, ttl_hops, latency_ms, jitter_ms, packet_loss_pct, reply_ttl, geo_location, whois_id, scanned_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (self.run_id, record["website"], record["ip"], record["max_buffer_size"], record["ttl_hops"], record["latency_ms"], record["jitter_ms"],
+                     record["packet_loss_pct"], record["reply_ttl"], record["geo_location"], self._whois_id(record["domain_details"]), record["scanned_at"] or time.time())
+                    for record in records
+                ],
+            )
+
+    def close(self):
+        super().close()
+        with self.db:
+            self.db.execute(
+                "UPDATE runs SET finished_at = ?, results = (SELECT COUNT(*) FROM results WHERE run_id = ?) WHERE id = ?",
+                (time.time(), self.run_id, self.run_id),
+            )
+        self.db.close()
+
+def list_runs(db, limit=20):
+    """Return the most recent runs as (id, started_at, finished_at, results, command) rows, newest first."""
+    return db.execute("SELECT id, started_at, finished_at, results, command FROM runs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+
+def diff_runs(db, old_run=None, new_run=None, thresholds=None):
+    """List targets whose MTU, hops, latency or loss changed by at least the thresholds between two runs.
+
+    Defaults to the two most recent runs. A value appearing or disappearing (e.g. MTU becoming
+    unknown) always counts as a change. Returns (old_run, new_run, rows).
+    """
+    thresholds = dict(DIFF_THRESHOLDS, **(thresholds or {}))
+    if old_run is None or new_run is None:
+        latest = [row[0] for row in db.execute("SELECT id FROM runs WHERE results > 0 ORDER BY id DESC LIMIT 2")]
+        if len(latest) < 2:
+            raise ValueError("the result store needs at least two finished runs to diff")
+        new_run, old_run = latest
+    changed = " OR ".join(
+        f"(a.{column} IS NOT b.{column} AND (a.{column} IS NULL OR b.{column} IS NULL OR abs(b.{column} - a.{column}) >= :{name}))"
+        for name, column in (("mtu", "max_buffer_size"), ("hops", "ttl_hops"), ("latency", "latency_ms"), ("loss", "packet_loss_pct"))
+    )
+    rows = db.execute(
+        "SELECT b.website, b.ip, a.max_buffer_size, b.max_buffer_size, a.ttl_hops, b.ttl_hops, a.latency_ms, b.latency_ms, a.packet_loss_pct, b.packet_loss_pct"
+        " FROM results AS b JOIN results AS a ON a.run_id = :old AND a.website = b.website"
+        f" WHERE b.run_id = :new AND ({changed}) ORDER BY b.website",
+        dict(thresholds, old=old_run, new=new_run),
+    ).fetchall()
+    return old_run, new_run, rows
+
+def target_history(db, website, limit=50):
+    """Return a target's results across runs, newest first."""
+    return db.execute(
+        "SELECT run_id, scanned_at, ip, max_buffer_size, ttl_hops, latency_ms, packet_loss_pct, geo_location"
+        " FROM results WHERE website = ? ORDER BY scanned_at DESC LIMIT ?",
+        (website, limit),
+    ).fetchall()
+
+def _format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)) if timestamp else "-"
+
+def _change(old, new):
+    return f"{'N/A' if old is None else round(old, 2)} → {'N/A' if new is None else round(new, 2)}"
+
+def query_store(args):
+    """Answer the --runs, --diff and --history queries against the result store."""
+    from tabulate import tabulate
+    if not os.path.exists(args.db):
+        print(f"No result store at {args.db}")
+        return
+    db = open_result_store(args.db)
+    try:
+        if args.runs:
+            rows = [(run_id, _format_time(started), _format_time(finished), results, command) for run_id, started, finished, results, command in list_runs(db)]
+            print(tabulate(rows, headers=["Run", "Started", "Finished", "Results", "Command"], tablefmt="fancy_grid"))
+        if args.history:
+            rows = [(run_id, _format_time(scanned), ip, mtu, hops, latency, loss, geo) for run_id, scanned, ip, mtu, hops, latency, loss, geo in target_history(db, args.history)]
+            print(tabulate(rows, headers=["Run", "Scanned", "IP", "Max Buffer Size (bytes)", "TTL Hops", "Latency (ms)", "Packet Loss (%)", "Geo Location"], tablefmt="fancy_grid"))
+        if args.diff is not None:
+            if len(args.diff) not in (0, 2):
+                raise ValueError("--diff takes no run ids (latest two runs) or exactly two")
+            thresholds = {name: value for name, value in (("mtu", args.mtu_change), ("hops", args.hops_change), ("latency", args.latency_change), ("loss", args.loss_change)) if value is not None}
+            old_run, new_run, rows = diff_runs(db, *(args.diff or (None, None)), thresholds)
+            print(f"🔍 {len(rows)} targets changed between run {old_run} and run {new_run}")
+            if rows:
+                print(tabulate(
+                    [(website, ip, _change(*row[0:2]), _change(*row[2:4]), _change(*row[4:6]), _change(*row[6:8])) for website, ip, *row in rows],
+                    headers=["Website", "IP", "Max Buffer Size (bytes)", "TTL Hops", "Latency (ms)", "Packet Loss (%)"],
+                    tablefmt="fancy_grid",
+                ))
+    finally:
+        db.close()
+
+SINK_TYPES = {".jsonl": JsonlSink, ".ndjson": JsonlSink, ".csv": CsvSink, ".parquet": ParquetSink, ".db": SqliteSink, ".sqlite": SqliteSink, ".sqlite3": SqliteSink, ".html": HtmlReportWriter}
+
+def open_sink(filename, command=None):
+    """Open the result sink matching a file's extension; result stores record `command` with the run."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in SINK_TYPES:
+        raise ValueError(f"Unsupported output format '{extension}' (expected one of {', '.join(SINK_TYPES)})")
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if SINK_TYPES[extension] is SqliteSink:
+        return SqliteSink(filename, command=command)
+    return SINK_TYPES[extension](filename)
+
+def generate_html_report(results, website_name=None, filename=None):
+    """Generate an interactive HTML report with search, pagination, sorting and a latency chart."""
     if not filename:
-        filename = f"reports/{website_name}_buffer_results_{time.strftime('%Y%m%d_%H%M%S')}.html"
-
-    html_content = f"""
-    <html>
-    <head>
-        <title>Advanced Buffer Checker Report</title>
-        <style>
-            @import url('https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;600&display=swap');
-            body {{
-                font-family: 'Poppins', sans-serif;
-                margin: 0;
-                padding: 20px;
-                background: linear-gradient(to right, #2c3e50, #4ca1af);
-                color: #fff;
-                transition: background 0.5s, color 0.5s;
-            }}
-            .container {{
-                max-width: 1100px;
-                margin: auto;
-                padding: 25px;
-                background: rgba(255, 255, 255, 0.1);
-                border-radius: 12px;
-                box-shadow: 0 10px 30px rgba(0,0,0,0.3);
-                backdrop-filter: blur(10px);
-            }}
-            .header {{
-                font-size: 35px;
-                font-weight: bold;
-                text-align: center;
-                padding-bottom: 15px;
-                border-bottom: 4px solid #fff;
-                margin-bottom: 20px;
-                animation: fadeIn 1.5s ease-in-out;
-            }}
-            .website-section {{
-                margin-bottom: 25px;
-                padding: 20px;
-                border-radius: 8px;
-                background: rgba(255, 255, 255, 0.2);
-                box-shadow: 0 4px 12px rgba(0,0,0,0.2);
-                animation: slideIn 1s ease-in-out;
-                transition: transform 0.3s ease-in-out;
-            }}
-            .website-section:hover {{
-                transform: scale(1.05);
-                box-shadow: 0 6px 15px rgba(0,0,0,0.3);
-            }}
-            .website-title {{
-                font-size: 24px;
-                font-weight: bold;
-                color: #f1c40f;
-                margin-bottom: 10px;
-                transition: color 0.3s ease-in-out;
-            }}
-            .website-title:hover {{
-                color: #e67e22;
-            }}
-            .detail-table {{
-                width: 100%;
-                border-collapse: collapse;
-                margin-top: 15px;
-                animation: fadeIn 1.5s ease-in-out;
-            }}
-            .detail-table th, .detail-table td {{
-                border: 1px solid #ddd;
-                padding: 10px;
-                text-align: left;
-                color: #fff;
-            }}
-            .detail-table th {{
-                background-color: #f1c40f;
-            }}
-            .footer {{
-                text-align: center;
-                margin-top: 40px;
-                color: #ddd;
-                font-size: 15px;
-                animation: fadeIn 2s ease-in-out;
-            }}
-            /* Dark Mode */
-            body.dark-mode {{
-                background: #1c1c1c;
-                color: #fff;
-            }}
-            .container.dark-mode {{
-                background: rgba(255, 255, 255, 0.2);
-            }}
-            .header.dark-mode {{
-                color: #f1c40f;
-            }}
-            .website-section.dark-mode {{
-                background: rgba(255, 255, 255, 0.3);
-                box-shadow: 0 4px 12px rgba(255, 255, 255, 0.3);
-            }}
-            /* Pagination */
-            .pagination {{
-                display: flex;
-                justify-content: center;
-                margin-top: 20px;
-            }}
-            .pagination button {{
-                background-color: #f1c40f;
-                border: none;
-                color: white;
-                padding: 10px 15px;
-                text-align: center;
-                font-size: 16px;
-                cursor: pointer;
-                border-radius: 5px;
-                margin: 0 5px;
-                transition: background 0.3s;
-            }}
-            .pagination button:hover {{
-                background-color: #e67e22;
-            }}
-            /* Search Input */
-            #search-input {{
-                padding: 10px;
-                margin-bottom: 20px;
-                width: 100%;
-                font-size: 16px;
-                border-radius: 5px;
-                border: 1px solid #ddd;
-            }}
-            @keyframes fadeIn {{
-                from {{ opacity: 0; }} to {{ opacity: 1; }}
-            }}
-            @keyframes slideIn {{
-                from {{ transform: translateY(20px); opacity: 0; }} to {{ transform: translateY(0); opacity: 1; }}
-            }}
-        </style>
-        <!-- Add Chart.js for visualizing data -->
-        <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">🚀 Advanced Buffer Checker Report</div>
-            
-            <!-- Search Bar -->
-            <input type="text" id="search-input" placeholder="Search websites..." onkeyup="searchFunction()" />
-
-            <!-- Chart Placeholder -->
-            <canvas id="latencyChart" width="400" height="200"></canvas>
-            
-            <div id="website-sections">
+        prefix = f"{website_name}_" if website_name else ""
+        filename = f"reports/{prefix}buffer_results_{time.strftime('%Y%m%d_%H%M%S')}.html"
+        os.makedirs("reports", exist_ok=True)
+
+    with HtmlReportWriter(filename) as report:
+        for result in results:
+            report.add(result)
+    return filename
+
+async def _read_message(reader):
+    """Read one length-prefixed JSON message, or None at end of stream."""
+    try:
+        header = await reader.readexactly(4)
+        return json.loads(await reader.readexactly(struct.unpack("!I", header)[0]))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+def _write_message(writer, message):
+    """Queue one length-prefixed JSON message on a stream."""
+    data = json.dumps(message, separators=(",", ":"), default=str).encode("utf-8")
+    writer.write(struct.pack("!I", len(data)) + data)
+
+async def run_worker(address, token=None):
+    """Connect to a coordinator, scan the target batches it hands out and stream the results back.
+
+    The protocol is length-prefixed JSON over TCP, so workers may run on other hosts.
     """
-    
-    # Add website sections and data for the chart
-    latency_data = []
-    labels = []
-    for result in results:
-        website_name, max_buffer_size, ttl_hops, latency, packet_loss, geo_location, domain_details = result
-        
-        labels.append(website_name)
-        latency_data.append(latency)
-        
-        html_content += f"""
-            <div class="website-section">
-                <h2 class="website-title">{website_name}</h2>
-                <table class="detail-table">
-                    <tr><th>Parameter</th><th>Value</th></tr>
-                    <tr><td>Max Buffer Size</td><td>{max_buffer_size} bytes</td></tr>
-                    <tr><td>TTL Hops</td><td>{ttl_hops}</td></tr>
-                    <tr><td>Latency</td><td>{latency} ms</td></tr>
-                    <tr><td>Packet Loss</td><td>{packet_loss}</td></tr>
-                    <tr><td>Geo Location</td><td>{geo_location}</td></tr>
-                </table>
-                <h3 class="website-title">Domain Details</h3>
-        """
-        
-        if isinstance(domain_details, dict):
-            html_content += "<table class='detail-table'>"
-            for key, value in domain_details.items():
-                if isinstance(value, dict):
-                    for sub_key, sub_value in value.items():
-                        html_content += f"<tr><td>{sub_key.replace('_', ' ').title()}</td><td>{sub_value or 'N/A'}</td></tr>"
-                else:
-                    html_content += f"<tr><td>{key.replace('_', ' ').title()}</td><td>{value or 'N/A'}</td></tr>"
-            html_content += "</table>"
-        else:
-            html_content += "<p style='color: red;'><strong>Error:</strong> Invalid domain details format</p>"
-        
-        html_content += "</div>"  # Close website-section
-    
-    html_content += f"""
-            </div> <!-- End website-sections -->
-            
-            <!-- Pagination buttons -->
-            <div class="pagination">
-                <button onclick="prevPage()">Previous</button>
-                <button onclick="nextPage()">Next</button>
-            </div>
-            
-            <div class="footer">Report generated on {time.strftime('%Y-%m-%d %H:%M:%S')} by Advanced Buffer Checker</div>
-        </div>
+    host, _, port = address.rpartition(":")
+    reader, writer = await asyncio.open_connection(host, int(port))
+    _write_message(writer, {"type": "hello", "token": token or os.environ.get("BUFFER_CHECKER_TOKEN"), "pid": os.getpid()})
+    config = await _read_message(reader)
+    if not config or config.get("type") != "config":
+        writer.close()
+        return
+    context = ScanContext(path_cache=PathCache() if config["cache"] else None, stages=config["stages"])
+    slots = asyncio.Semaphore(config["concurrency"])
+    batches = set()
+
+    async def scan_one(batch_id, target):
+        async with slots:
+            result = await _scan_target_safely(target, context)
+        _write_message(writer, {"type": "result", "batch": batch_id, "result": list(result)})
+        await writer.drain()
+
+    async def scan_batch(batch_id, targets):
+        # The coordinator waits for "done", so it is sent even if a result could not be
+        try:
+            await asyncio.gather(*(scan_one(batch_id, target) for target in targets))
+        finally:
+            _write_message(writer, {"type": "done", "batch": batch_id})
+            await writer.drain()
+
+    try:
+        while True:
+            message = await _read_message(reader)
+            if message is None or message["type"] == "stop":
+                break
+            if message["type"] == "batch":
+                task = asyncio.ensure_future(scan_batch(message["batch"], message["targets"]))
+                batches.add(task)
+                task.add_done_callback(batches.discard)
+        if batches:
+            await asyncio.gather(*batches)
+    finally:
+        context.close()
+        writer.close()
 
-        <script>
-            // Chart.js for latency data
-            var ctx = document.getElementById('latencyChart').getContext('2d');
-            var latencyChart = new Chart(ctx, {{
-                type: 'bar',
-                data: {{
-                    labels: {labels},
-                    datasets: [{{ 
-                        label: 'Latency (ms)', 
-                        data: {latency_data}, 
-                        backgroundColor: 'rgba(241, 196, 15, 0.5)', 
-                        borderColor: 'rgba(241, 196, 15, 1)', 
-                        borderWidth: 1
-                    }}]
-                }},
-                options: {{
-                    scales: {{
-                        y: {{
-                            beginAtZero: true
-                        }}
-                    }}
-                }}
-            }});
-
-            // Search function for filtering
-            function searchFunction() {{
-                var input = document.getElementById("search-input");
-                var filter = input.value.toLowerCase();
-                var sections = document.querySelectorAll(".website-section");
-                sections.forEach(function(section) {{
-                    var title = section.querySelector(".website-title").textContent;
-                    if (title.toLowerCase().includes(filter)) {{
-                        section.style.display = "block";
-                    }} else {{
-                        section.style.display = "none";
-                    }}
-                }});
-            }}
-            
-            // Pagination logic (Simple example)
-            var currentPage = 1;
-            var itemsPerPage = 5;
-            function showPage(page) {{
-                var sections = document.querySelectorAll(".website-section");
-                sections.forEach(function(section, index) {{
-                    if (index >= (page - 1) * itemsPerPage && index < page * itemsPerPage) {{
-                        section.style.display = "block";
-                    }} else {{
-                        section.style.display = "none";
-                    }}
-                }});
-            }}
-            function prevPage() {{
-                if (currentPage > 1) {{
-                    currentPage--;
-                    showPage(currentPage);
-                }}
-            }}
-            function nextPage() {{
-                currentPage++;
-                showPage(currentPage);
-            }}
-            showPage(currentPage);
-        </script>
-    </body>
-    </html>
+async def scan_targets_distributed(websites, workers=None, batch_size=WORKER_BATCH_SIZE, concurrency=SCAN_CONCURRENCY, stages=None, cache=True, backend=None, rate=None, prefix_rate=None):
+    """Scan websites across local worker processes, yielding ScanResults as they stream back.
+
+    The coordinator listens on a local TCP port and starts `workers` processes running
+    `buffer_checker.py --worker`. Each worker keeps up to WORKER_PIPELINE batches of
+    `batch_size` targets in flight. If a worker dies, its unfinished targets are queued
+    again and the process is restarted (up to WORKER_MAX_RESTARTS times per slot).
+    `rate` and `prefix_rate` are totals for the whole run and are split evenly between workers.
+    """
+    workers = workers or os.cpu_count() or 1
+    token = os.urandom(16).hex()
+    websites = iter(websites)
+    retry = collections.deque()
+    results = asyncio.Queue()
+    changed = asyncio.Condition()
+    state = {"exhausted": False, "outstanding": 0, "batch": 0, "alive": 0}
+    config = {"type": "config", "stages": sorted(SCAN_STAGES if stages is None else stages), "concurrency": concurrency, "cache": cache}
+    finished = object()
+
+    def all_done():
+        return state["exhausted"] and not retry and state["outstanding"] == 0
+
+    def next_batch():
+        if retry:
+            return retry.popleft()
+        if state["exhausted"]:
+            return None
+        targets = list(itertools.islice(websites, batch_size))
+        if len(targets) < batch_size:
+            state["exhausted"] = True
+        return targets or None
+
+    async def notify():
+        async with changed:
+            changed.notify_all()
+        if all_done():
+            await results.put(finished)
+
+    async def handle(reader, writer):
+        hello = await _read_message(reader)
+        if not hello or hello.get("token") != token:
+            writer.close()
+            return
+        _write_message(writer, config)
+        inflight = {}
+        try:
+            while True:
+                while len(inflight) < WORKER_PIPELINE and (targets := next_batch()):
+                    state["batch"] += 1
+                    state["outstanding"] += 1
+                    inflight[state["batch"]] = targets
+                    _write_message(writer, {"type": "batch", "batch": state["batch"], "targets": targets})
+                await writer.drain()
+                if not inflight:
+                    if all_done():
+                        await results.put(finished)
+                        _write_message(writer, {"type": "stop"})
+                        await writer.drain()
+                        return
+                    async with changed:
+                        await changed.wait()
+                    continue
+                message = await _read_message(reader)
+                if message is None:
+                    return
+                if message["type"] == "result":
+                    result = ScanResult(*message["result"])
+                    remaining = inflight.get(message["batch"])
+                    if remaining is not None and result.website in remaining:
+                        remaining.remove(result.website)
+                    await results.put(result)
+                elif message["type"] == "done":
+                    if inflight.pop(message["batch"], None) is not None:
+                        state["outstanding"] -= 1
+                        await notify()
+        finally:
+            # A lost worker's unfinished targets go back on the queue for the others
+            for targets in inflight.values():
+                state["outstanding"] -= 1
+                if targets:
+                    retry.append(targets)
+            writer.close()
+            if inflight:
+                await notify()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    address = f"127.0.0.1:{server.sockets[0].getsockname()[1]}"
+    command = [sys.executable, os.path.abspath(__file__), "--worker", address]
+    if backend:
+        command += ["--backend", backend]
+    if rate is not None:
+        command += ["--rate", f"{rate / workers:g}"]
+    if prefix_rate is not None:
+        command += ["--prefix-rate", f"{prefix_rate / workers:g}"]
+    environment = dict(os.environ, BUFFER_CHECKER_TOKEN=token)
+
+    processes = []
+
+    async def supervise():
+        restarts = 0
+        state["alive"] += 1
+        try:
+            while True:
+                process = await asyncio.create_subprocess_exec(*command, env=environment)
+                processes.append(process)
+                await process.wait()
+                if all_done() or restarts >= WORKER_MAX_RESTARTS:
+                    return
+                restarts += 1
+        finally:
+            state["alive"] -= 1
+            if state["alive"] == 0 and not all_done():
+                await results.put(RuntimeError("all worker processes exited before the scan finished"))
+
+    supervisors = [asyncio.ensure_future(supervise()) for _ in range(workers)]
+    try:
+        while True:
+            item = await results.get()
+            if item is finished:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        server.close()
+        if not all_done():
+            # Interrupted or failed: workers will not receive a stop message
+            for process in processes:
+                if process.returncode is None:
+                    process.terminate()
+        await asyncio.gather(*supervisors, return_exceptions=True)
+
+async def verify_path_mtu_async(website_name, size, prober=None):
+    """Cheaply check that a previously measured max payload still holds: `size` fits and `size + 1` does not."""
+    prober = prober or get_prober()
+    fits, above = await asyncio.gather(probe_async(prober, website_name, size=size), probe_async(prober, website_name, size=size + 1))
+    return fits.status == REPLY and above.status != REPLY
+
+def _metric_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Monitor:
+    """Keep re-measuring a fixed set of targets, each stage on its own schedule, and expose the latest values.
+
+    Only stages that are due are probed. The MTU stage first re-checks the previous path MTU
+    with two probes and runs a full search only when that check fails.
+    """
+
+    def __init__(self, targets, intervals=None, stages=None, concurrency=SCAN_CONCURRENCY, path_cache=None, prober=None, resolver=None, enricher=None):
+        self.targets = list(dict.fromkeys(targets))
+        self.intervals = dict(MONITOR_INTERVALS, **(intervals or {}))
+        self.stages = [stage for stage in SCAN_STAGES if stages is None or stage in stages]
+        self.concurrency = concurrency
+        self.context_args = (prober, None, path_cache, resolver, enricher, self.stages)
+        self.state = {target: {"updated": {}} for target in self.targets}
+        self.counters = collections.Counter()
+        self.lock = threading.Lock()
+        self.context = None
+
+    def _update(self, target, stage, outcome="runs", **values):
+        with self.lock:
+            self.state[target].update(values)
+            self.state[target]["updated"][stage] = time.time()
+            self.counters[f"{stage}_{outcome}"] += 1
+
+    def _count(self, counter):
+        # render_metrics copies the counters from the HTTP thread, so every change takes the lock
+        with self.lock:
+            self.counters[counter] += 1
+
+    async def _measure(self, target, stage):
+        context = self.context
+        addresses = await context.stage("dns", context.resolver.resolve_async(target), target)
+        address = pick_address(addresses)
+        if address is not None:
+            self._update(target, "dns")
+        if stage == "whois":
+            self._update(target, stage, whois=await context.stage("whois", context.enricher.whois_async(target), target))
+            return
+        if address is None:
+            self._update(target, "dns", "errors", ip=None)
+            return
+        if stage == "echo":
+            samples = await context.stage("echo", EchoSession(address, prober=context.prober).run_async(), target)
+            self._update(target, stage, ip=address, latency=samples.avg, jitter=samples.jitter, loss=samples.loss, reply_ttl=samples.reply_ttl)
+        elif stage == "hops":
+            hops = await context.stage("hops", get_ttl_hops_async(address, context.prober), target)
+            self._update(target, stage, ip=address, hops=hops if isinstance(hops, int) else None)
+            if context.path_cache is not None and isinstance(hops, int):
+                context.path_cache.put(address, None, hops, self.state[target].get("reply_ttl"))
+        elif stage == "mtu":
+            previous = self.state[target].get("pmtu")
+            if previous and self.state[target].get("ip") == address and await context.stage("mtu", verify_path_mtu_async(address, previous, context.prober), target):
+                self._count("mtu_checks_held")
+                self._update(target, stage, ip=address)
+                return
+            result = await context.stage("mtu", search_path_mtu_async(address, context.prober), target)
+            self._count("mtu_full_searches")
+            self._update(target, stage, ip=address, pmtu=result.size or None)
+            if context.path_cache is not None and result.size:
+                context.path_cache.put(address, result.size, None)
+        elif stage == "geo":
+            self._update(target, stage, ip=address, geo=await context.stage("geo", context.enricher.geo_async(address), target))
+
+    async def run(self, stop=None):
+        """Run until `stop` (an asyncio.Event) is set or the task is cancelled."""
+        self.context = ScanContext(*self.context_args)
+        slots = asyncio.Semaphore(self.concurrency)
+        now = time.monotonic()
+        # Spread the first round over a few seconds instead of probing everything at once
+        spread = MONITOR_STARTUP_SPREAD / max(len(self.targets), 1)
+        schedule = [(now + i * spread, target, stage) for i, target in enumerate(self.targets) for stage in self.stages]
+        heapq.heapify(schedule)
+        running = set()
+        # Set when a finished job reschedules itself, so the loop never sleeps past its next due time
+        rescheduled = asyncio.Event()
+
+        async def job(due, target, stage):
+            try:
+                async with slots:
+                    await self._measure(target, stage)
+            except Exception:
+                self._count(f"{stage}_errors")
+            finally:
+                heapq.heappush(schedule, (max(due + self.intervals[stage], time.monotonic()), target, stage))
+                rescheduled.set()
+
+        try:
+            while not (stop and stop.is_set()):
+                now = time.monotonic()
+                while schedule and schedule[0][0] <= now:
+                    task = asyncio.ensure_future(job(*heapq.heappop(schedule)))
+                    running.add(task)
+                    task.add_done_callback(running.discard)
+                wait = min(schedule[0][0] - now, 1.0) if schedule else 1.0
+                rescheduled.clear()
+                try:
+                    await asyncio.wait_for(rescheduled.wait(), max(wait, 0.01))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            self.context.close()
+
+    def render_metrics(self):
+        """Render the latest values in the Prometheus text exposition format."""
+        gauges = [
+            ("latency_ms", "latency", "Average echo round-trip time in milliseconds."),
+            ("jitter_ms", "jitter", "Mean RTT variation between consecutive echo replies in milliseconds."),
+            ("packet_loss_ratio", "loss", "Fraction of echo requests without a reply."),
+            ("reply_ttl", "reply_ttl", "TTL observed on echo replies."),
+            ("ttl_hops", "hops", "Hop count to the target."),
+            ("max_buffer_bytes", "pmtu", "Largest echo payload that reaches the target unfragmented."),
+        ]
+        lines = []
+        with self.lock:
+            state = {target: dict(values, updated=dict(values["updated"])) for target, values in self.state.items()}
+            counters = dict(self.counters)
+        for name, key, help_text in gauges:
+            lines += [f"# HELP buffer_checker_{name} {help_text}", f"# TYPE buffer_checker_{name} gauge"]
+            for target, values in state.items():
+                if values.get(key) is not None:
+                    lines.append(f'buffer_checker_{name}{{target="{_metric_label(target)}",ip="{_metric_label(values.get("ip"))}"}} {values[key]}')
+        lines += ["# HELP buffer_checker_geo_info Geo location of the target address.", "# TYPE buffer_checker_geo_info gauge"]
+        for target, values in state.items():
+            if values.get("geo") not in (None, "N/A"):
+                lines.append(f'buffer_checker_geo_info{{target="{_metric_label(target)}",location="{_metric_label(values["geo"])}"}} 1')
+        lines += ["# HELP buffer_checker_whois_info WHOIS registrar and expiry of the target's domain.", "# TYPE buffer_checker_whois_info gauge"]
+        for target, values in state.items():
+            whois = values.get("whois") or {}
+            if "registrar" in whois:
+                lines.append(f'buffer_checker_whois_info{{target="{_metric_label(target)}",registrar="{_metric_label(whois["registrar"])}",expires="{_metric_label(whois.get("expires_date"))}"}} 1')
+        lines += ["# HELP buffer_checker_last_update_timestamp_seconds When each stage last completed for a target.", "# TYPE buffer_checker_last_update_timestamp_seconds gauge"]
+        for target, values in state.items():
+            for stage, updated in values["updated"].items():
+                lines.append(f'buffer_checker_last_update_timestamp_seconds{{target="{_metric_label(target)}",stage="{stage}"}} {updated:.3f}')
+        lines += ["# HELP buffer_checker_stage_runs_total Stage measurements completed (for dns, names that resolved).", "# TYPE buffer_checker_stage_runs_total counter"]
+        lines += [f'buffer_checker_stage_runs_total{{stage="{stage}"}} {counters.get(f"{stage}_runs", 0)}' for stage in ("dns",) + SCAN_STAGES]
+        lines += ["# HELP buffer_checker_stage_errors_total Stage measurements that raised an error (for dns, names that did not resolve).", "# TYPE buffer_checker_stage_errors_total counter"]
+        lines += [f'buffer_checker_stage_errors_total{{stage="{stage}"}} {counters.get(f"{stage}_errors", 0)}' for stage in ("dns",) + SCAN_STAGES]
+        lines += ["# HELP buffer_checker_mtu_full_searches_total Full path-MTU searches run.", "# TYPE buffer_checker_mtu_full_searches_total counter"]
+        lines.append(f"buffer_checker_mtu_full_searches_total {counters.get('mtu_full_searches', 0)}")
+        lines += ["# HELP buffer_checker_mtu_checks_held_total Cheap path-MTU re-checks that confirmed the previous value.", "# TYPE buffer_checker_mtu_checks_held_total counter"]
+        lines.append(f"buffer_checker_mtu_checks_held_total {counters.get('mtu_checks_held', 0)}")
+        if self.context is not None:
+            lines += ["# HELP buffer_checker_probes_sent_total Probes sent by the probe backend.", "# TYPE buffer_checker_probes_sent_total counter"]
+            lines.append(f"buffer_checker_probes_sent_total {self.context.prober.sent}")
+        return "\n".join(lines) + "\n"
+
+def serve_metrics(monitor, port=METRICS_PORT, host=METRICS_HOST):
+    """Serve monitor.render_metrics() at /metrics from a background thread; returns the server."""
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = monitor.render_metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+def parse_interval(value):
+    """Parse a STAGE=SECONDS monitoring interval."""
+    stage, _, seconds = value.partition("=")
+    if stage not in SCAN_STAGES:
+        raise argparse.ArgumentTypeError(f"unknown stage '{stage}'; choose from {', '.join(SCAN_STAGES)}")
+    try:
+        return stage, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid interval '{value}', expected STAGE=SECONDS") from None
+
+def iter_targets(sources):
+    """Yield targets lazily from files ("-" for stdin): one per line or comma-separated, "#" starts a comment."""
+    for source in sources:
+        targetfile = sys.stdin if source == "-" else open(source, encoding="utf-8")
+        try:
+            for line in targetfile:
+                for target in line.split("#", 1)[0].split(","):
+                    target = target.strip()
+                    if target:
+                        yield target
+        finally:
+            if targetfile is not sys.stdin:
+                targetfile.close()
+
+def _target_hash(target):
+    return int.from_bytes(hashlib.blake2b(target.lower().encode("utf-8"), digest_size=8).digest(), "big")
+
+def in_shard(target, index, count):
+    """Deterministically assign a target to shard `index` of `count` (0-based) by hashing its name."""
+    return _target_hash(target) % count == index
+
+def parse_shard(value):
+    """Parse an "i/N" shard spec (0 <= i < N)."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}', expected i/N") from None
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}', need 0 <= i < N")
+    return index, count
+
+def parse_stages(value):
+    """Parse a comma-separated list of scan stages."""
+    stages = {stage.strip() for stage in value.split(",") if stage.strip()}
+    unknown = stages - set(SCAN_STAGES)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown stage(s) {', '.join(sorted(unknown))}; choose from {', '.join(SCAN_STAGES)}")
+    return stages
+
+class Checkpoint:
+    """Append-only record of finished targets, so an interrupted run can resume without re-probing them.
+
+    Only 64-bit hashes of finished names are kept in memory.
     """
-    
-    with open(filename, "w", encoding="utf-8") as htmlfile:
-        htmlfile.write(html_content)
 
-def main():
+    def __init__(self, filename):
+        self.filename = filename
+        self.finished = set()
+        self.pending = []
+        if os.path.exists(filename):
+            with open(filename, encoding="utf-8") as checkpointfile:
+                self.finished.update(_target_hash(line.rstrip("\n")) for line in checkpointfile if line.strip())
+        self.checkpointfile = open(filename, "a", encoding="utf-8")
+
+    def __contains__(self, target):
+        return _target_hash(target) in self.finished
+
+    def add(self, target):
+        """Mark a target finished (written on the next flush)."""
+        self.finished.add(_target_hash(target))
+        self.pending.append(target)
+
+    def flush(self):
+        if self.pending:
+            self.checkpointfile.write("".join(f"{target}\n" for target in self.pending))
+            self.checkpointfile.flush()
+            self.pending = []
+
+    def close(self):
+        self.flush()
+        self.checkpointfile.close()
+
+def build_parser():
+    """Build the command-line interface."""
+    parser = argparse.ArgumentParser(description="Measure path MTU, hops, latency, loss, geo location and WHOIS details for many websites.")
+    parser.add_argument("targets", nargs="*", help="websites to scan (comma-separated lists are accepted)")
+    parser.add_argument("-f", "--file", action="append", default=[], metavar="PATH", help="read targets from a file, one per line; '-' reads stdin (repeatable)")
+    parser.add_argument("--shard", type=parse_shard, metavar="i/N", help="only scan targets whose name hash falls in shard i of N (0-based)")
+    parser.add_argument("--checkpoint", metavar="PATH", help="record finished targets here and skip them when resuming")
+    parser.add_argument("--stages", type=parse_stages, default=set(SCAN_STAGES), help=f"comma-separated stages to run (default: {','.join(SCAN_STAGES)})")
+    parser.add_argument("--skip", type=parse_stages, default=set(), metavar="STAGES", help="comma-separated stages to skip, e.g. --skip whois,geo")
+    parser.add_argument("-o", "--output", action="append", default=[], metavar="PATH", help="write results to PATH; format from the extension: .html, .jsonl, .csv, .parquet, .db (repeatable)")
+    parser.add_argument("--db", default=RESULT_STORE, metavar="PATH", help=f"SQLite result store written by default scans and read by --runs/--diff/--history (default: {RESULT_STORE})")
+    parser.add_argument("--runs", action="store_true", help="list recent runs in the result store and exit")
+    parser.add_argument("--diff", type=int, nargs="*", metavar="RUN", help="list targets that changed between two runs (default: the latest two) and exit")
+    parser.add_argument("--history", metavar="TARGET", help="show a target's results across runs and exit")
+    parser.add_argument("--mtu-change", type=int, metavar="BYTES", help=f"smallest MTU change --diff reports (default: {DIFF_THRESHOLDS['mtu']})")
+    parser.add_argument("--hops-change", type=int, metavar="HOPS", help=f"smallest hop-count change --diff reports (default: {DIFF_THRESHOLDS['hops']})")
+    parser.add_argument("--latency-change", type=float, metavar="MS", help=f"smallest latency change --diff reports (default: {DIFF_THRESHOLDS['latency']:g})")
+    parser.add_argument("--loss-change", type=float, metavar="PCT", help=f"smallest packet-loss change --diff reports, in percentage points (default: {DIFF_THRESHOLDS['loss']:g})")
+    parser.add_argument("--concurrency", type=int, default=SCAN_CONCURRENCY, help=f"targets in flight at once (default: {SCAN_CONCURRENCY})")
+    parser.add_argument("--backend", choices=["auto", "icmp", "subprocess"], help="probe backend (default: $BUFFER_CHECKER_BACKEND or auto)")
+    parser.add_argument("--rate", type=float, metavar="PPS", help=f"probes per second across all stages, 0 to disable pacing (default: {PROBE_RATE})")
+    parser.add_argument("--prefix-rate", type=float, metavar="PPS", help=f"probes per second to any one /24 or /48 (default: {PROBE_PREFIX_RATE})")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the path cache")
+    parser.add_argument("--no-table", action="store_true", help="do not print the summary table")
+    parser.add_argument("--workers", type=int, default=0, metavar="N", help="scan with N worker processes (0: scan in this process)")
+    parser.add_argument("--batch-size", type=int, default=WORKER_BATCH_SIZE, help=f"targets per worker batch (default: {WORKER_BATCH_SIZE})")
+    parser.add_argument("--trace", metavar="PATH", help="record per-stage timings and write them as Chrome trace-event JSON")
+    parser.add_argument("--timings", action="store_true", help="print a per-stage timing and probe-count summary at the end")
+    parser.add_argument("--monitor", action="store_true", help="keep re-measuring the targets on per-stage schedules and serve Prometheus metrics")
+    parser.add_argument("--interval", type=parse_interval, action="append", default=[], metavar="STAGE=SECONDS", help="monitoring interval for a stage (defaults: " + ", ".join(f"{stage}={seconds:g}" for stage, seconds in MONITOR_INTERVALS.items()) + ")")
+    parser.add_argument("--metrics-host", default=METRICS_HOST, help=f"address for the metrics endpoint (default: {METRICS_HOST})")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help=f"port for the metrics endpoint (default: {METRICS_PORT})")
+    parser.add_argument("--worker", metavar="HOST:PORT", help=argparse.SUPPRESS)
+    return parser
+
+def main(argv=None):
     """Main function to execute the script."""
-    print_banner()
-    
-    # Allow user to input websites
-    websites = input("Enter websites (comma-separated): ").split(",")
-    websites = [website.strip() for website in websites if website.strip()]
-    
-    if not websites:
-        print("No websites provided. Exiting.")
+    global PROBE_BACKEND, PROBE_RATE, PROBE_PREFIX_RATE
+    args = build_parser().parse_args(argv)
+    if args.backend:
+        PROBE_BACKEND = args.backend
+    if args.rate is not None:
+        PROBE_RATE = args.rate
+    if args.prefix_rate is not None:
+        PROBE_PREFIX_RATE = args.prefix_rate
+    if args.worker:
+        asyncio.run(run_worker(args.worker))
+        return
+    if args.runs or args.history or args.diff is not None:
+        try:
+            query_store(args)
+        except ValueError as e:
+            build_parser().error(str(e))
+        return
+    from colorama import Fore, Style, init
+    from tabulate import tabulate
+    from tqdm import tqdm
+    # Initialize colorama for colored terminal output
+    init(autoreset=True)
+    stages = args.stages - args.skip
+    if not stages:
+        build_parser().error("--stages and --skip leave no stage to run")
+    if (args.trace or args.timings) and (args.workers or args.monitor):
+        build_parser().error("--trace and --timings cover a single in-process scan; they cannot be combined with --workers or --monitor")
+    tracer = Tracer() if args.trace or args.timings else None
+    set_tracer(tracer)
+
+    if args.targets or args.file:
+        inline = [target.strip() for item in args.targets for target in item.split(",") if target.strip()]
+        websites = itertools.chain(inline, iter_targets(args.file))
+        interactive = False
+    else:
+        print_banner()
+        # Allow user to input websites
+        websites = input("Enter websites (comma-separated): ").split(",")
+        websites = [website.strip() for website in websites if website.strip()]
+        interactive = True
+
+        if not websites:
+            print("No websites provided. Exiting.")
+            return
+
+    if args.monitor:
+        websites = [target for target in websites if not args.shard or in_shard(target, *args.shard)]
+        monitor = Monitor(websites, dict(args.interval), stages, args.concurrency, None if args.no_cache else PathCache())
+        server = serve_metrics(monitor, args.metrics_port, args.metrics_host)
+        print(f"📡 Monitoring {len(monitor.targets)} websites; metrics at http://{args.metrics_host}:{server.server_address[1]}/metrics (Ctrl+C to stop)")
+        try:
+            asyncio.run(monitor.run())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
         return
 
-    results = []
+    checkpoint = Checkpoint(args.checkpoint) if args.checkpoint else None
+    skipped = 0
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = {executor.submit(find_max_buffer, website): website for website in websites}
-        for future in concurrent.futures.as_completed(futures):
-            results.append(future.result())
+    def selected(targets):
+        nonlocal skipped
+        for target in targets:
+            if args.shard and not in_shard(target, *args.shard):
+                continue
+            if checkpoint is not None and target in checkpoint:
+                skipped += 1
+                continue
+            yield target
+
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+    outputs = args.output or [f"reports/buffer_results_{stamp}.html", f"reports/buffer_results_{stamp}.jsonl", args.db]
+    command = sys.argv[1:] if argv is None else list(argv)
+    sinks = [open_sink(output, command) for output in outputs]
+    table_data = []
+    show_table = not args.no_table
+    count = 0
+
+    async def run_scan():
+        nonlocal count
+        total = len(websites) if interactive else None
+        with tqdm(total=total, desc=f"{Fore.GREEN}Scanning{Style.RESET_ALL}", leave=False, bar_format="{l_bar}{bar}{r_bar}" if total else None) as pbar:
+            if args.workers:
+                scan = scan_targets_distributed(selected(websites), args.workers, args.batch_size, args.concurrency, stages, not args.no_cache, args.backend, PROBE_RATE, PROBE_PREFIX_RATE)
+            else:
+                scan = scan_targets(selected(websites), concurrency=args.concurrency, path_cache=None if args.no_cache else PathCache(), stages=stages)
+            async for result in scan:
+                count += 1
+                if show_table and len(table_data) < TABLE_LIMIT:
+                    table_data.append([result[0], result[1], result[2], result[3], result[4], result[5]])
+                for sink in sinks:
+                    sink.add(result)
+                if checkpoint is not None:
+                    checkpoint.add(result[0])
+                    if len(checkpoint.pending) >= SINK_BATCH_SIZE:
+                        # Results must reach the outputs before their targets are marked done
+                        for sink in sinks:
+                            sink.flush()
+                        checkpoint.flush()
+                pbar.update(1)
+
+    try:
+        asyncio.run(run_scan())
+    finally:
+        for sink in sinks:
+            sink.close()
+        if checkpoint is not None:
+            checkpoint.close()
+        set_tracer(None)
+        if tracer is not None and args.trace:
+            tracer.write_chrome_trace(args.trace)
 
     print("\n✅ All tests completed.\n")
-    
+    if skipped:
+        print(f"⏭️  Skipped {skipped} targets already finished in {args.checkpoint}")
+
     # Display table in terminal without domain details
-    table_data = [[res[0], res[1], res[2], res[3], res[4], res[5]] for res in results]
-    print(tabulate(table_data, headers=["Website", "Max Buffer Size (bytes)", "TTL Hops", "Latency (ms)", "Packet Loss", "Geo Location"], tablefmt="fancy_grid"))
+    if table_data:
+        print(tabulate(table_data, headers=["Website", "Max Buffer Size (bytes)", "TTL Hops", "Latency (ms)", "Packet Loss", "Geo Location"], tablefmt="fancy_grid"))
+        if count > len(table_data):
+            print(f"(showing the first {len(table_data)} of {count} results)")
+
+    if tracer is not None and args.timings:
+        print(f"\n⏱️  Stage timings ({type(get_prober()).__name__} backend)")
+        tracer.print_summary()
+    if tracer is not None and args.trace:
+        print(f"🧭 Trace written to {args.trace}")
 
-    # Generate HTML report for each website
-    for result in results:
-        website_name = result[0]
-        generate_html_report([result], website_name)
-        print(f"📂 Report for {website_name} saved to reports/{website_name}_buffer_results_{time.strftime('%Y%m%d_%H%M%S')}.html")
+    print(f"📂 Results for {count} websites saved to {', '.join(outputs)}")
 
 if __name__ == "__main__":
 
-    main()
\ No newline at end of file
+    main()
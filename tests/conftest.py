@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import buffer_checker as bc
+from bench_buffer_checker import start_stub_server
+
+@pytest.fixture(scope="session")
+def stub_url():
+    """Base URL of a local geo/WHOIS stub server."""
+    server, base_url = start_stub_server()
+    yield base_url
+    server.shutdown()
+
+@pytest.fixture
+def enricher(stub_url, monkeypatch):
+    """An Enricher that talks only to the stub server and caches nothing on disk."""
+    monkeypatch.setattr(bc, "GEOIP_DATABASE", None)
+    monkeypatch.setattr(bc, "HTTP_RETRIES", 0)
+    enricher = bc.Enricher(
+        geo_url=stub_url,
+        whois_url=f"{stub_url}/whois",
+        geo_cache=bc.DiskCache(None, bc.GEO_CACHE_TTL, bc.ENRICH_CACHE_SIZE),
+        whois_cache=bc.DiskCache(None, bc.WHOIS_CACHE_TTL, bc.ENRICH_CACHE_SIZE),
+    )
+    yield enricher
+    enricher.close()
@@ -0,0 +1,86 @@
+import io
+import json
+
+import pytest
+
+import buffer_checker as bc
+
+HOSTS = {"192.0.2.1": bc.FakeHost(pmtu=1500), "192.0.2.2": bc.FakeHost(pmtu=1400)}
+NAMES = {"a.example.test": ["192.0.2.1"], "b.example.test": ["192.0.2.2"], "c.example.test": ["192.0.2.1"]}
+
+@pytest.fixture
+def network(enricher, monkeypatch, tmp_path):
+    """Run main() against a fake network, inside a scratch directory."""
+    resolver = bc.DnsResolver(servers=[], hosts=NAMES)
+    monkeypatch.setattr(bc, "_prober", bc.FakeProber(HOSTS))
+    monkeypatch.setattr(bc, "_resolver", resolver)
+    monkeypatch.setattr(bc, "_enricher", enricher)
+    monkeypatch.chdir(tmp_path)
+    yield
+    resolver.close()
+
+def scanned(path):
+    with open(path, encoding="utf-8") as results:
+        return sorted(json.loads(line)["website"] for line in results)
+
+def test_iter_targets(tmp_path, monkeypatch):
+    first = tmp_path / "first.txt"
+    first.write_text("a.example.test\n\n# a comment line\nb.example.test, c.example.test  # trailing comment\n  ,d.example.test,\n")
+    monkeypatch.setattr("sys.stdin", io.StringIO("e.example.test\nf.example.test,g.example.test\n"))
+    assert list(bc.iter_targets([str(first), "-"])) == [f"{name}.example.test" for name in "abcdefg"]
+
+def test_iter_targets_reads_lazily(tmp_path):
+    first = tmp_path / "first.txt"
+    first.write_text("a.example.test\n")
+    targets = bc.iter_targets([str(first), str(tmp_path / "missing.txt")])
+    # The second file is only opened once the first is used up
+    assert next(targets) == "a.example.test"
+    with pytest.raises(FileNotFoundError):
+        next(targets)
+
+def test_shards_split_targets_exactly_once():
+    targets = [f"site{i}.example.test" for i in range(1000)]
+    shards = [[target for target in targets if bc.in_shard(target, index, 4)] for index in range(4)]
+    assert sorted(sum(shards, [])) == sorted(targets)
+    assert all(200 <= len(shard) <= 300 for shard in shards)
+    assert bc.in_shard("Site1.Example.Test", 0, 4) == bc.in_shard("site1.example.test", 0, 4)
+
+def test_parse_shard():
+    assert bc.parse_shard("0/1") == (0, 1)
+    assert bc.parse_shard("2/3") == (2, 3)
+    for value in ("3/3", "-1/2", "1/0", "1", "a/b", "1/2/3"):
+        with pytest.raises(bc.argparse.ArgumentTypeError):
+            bc.parse_shard(value)
+
+def test_parse_stages():
+    assert bc.parse_stages("mtu, hops,") == {"mtu", "hops"}
+    with pytest.raises(bc.argparse.ArgumentTypeError, match="unknown stage"):
+        bc.parse_stages("mtu,traceroute")
+
+def test_empty_stage_selection_is_rejected(network, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        bc.main(["a.example.test", "--stages", "mtu", "--skip", "mtu", "--no-table"])
+    assert exit_info.value.code == 2
+    assert "no stage to run" in capsys.readouterr().err
+
+def test_checkpoint_resumes_where_the_run_stopped(network, tmp_path):
+    checkpoint = tmp_path / "done.txt"
+    targets = tmp_path / "targets.txt"
+    targets.write_text("a.example.test\nb.example.test\n")
+    common = ["-f", str(targets), "--stages", "mtu", "--no-table", "--no-cache", "--checkpoint", str(checkpoint)]
+    bc.main(common + ["-o", "first.jsonl"])
+    assert scanned("first.jsonl") == ["a.example.test", "b.example.test"]
+    assert sorted(checkpoint.read_text().split()) == ["a.example.test", "b.example.test"]
+    targets.write_text("a.example.test\nb.example.test\nc.example.test\n")
+    bc.main(common + ["-o", "second.jsonl"])
+    assert scanned("second.jsonl") == ["c.example.test"]
+    resumed = bc.Checkpoint(str(checkpoint))
+    try:
+        assert all(name in resumed for name in NAMES)
+        assert "d.example.test" not in resumed
+    finally:
+        resumed.close()
+
+def test_shard_option_scans_only_its_share(network):
+    bc.main(list(NAMES) + ["--stages", "mtu", "--no-table", "--no-cache", "--shard", "1/2", "-o", "shard.jsonl"])
+    assert scanned("shard.jsonl") == [name for name in sorted(NAMES) if bc.in_shard(name, 1, 2)]
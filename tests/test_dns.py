@@ -0,0 +1,190 @@
+import socket
+import struct
+import threading
+
+import pytest
+
+import buffer_checker as bc
+
+def build_response(query, addresses=(), rcode=0, ttl=300):
+    """Answer a DNS query packet with A/AAAA records, naming them through a compression pointer."""
+    query_id = struct.unpack("!H", query[:2])[0]
+    qtype = struct.unpack("!H", query[-4:-2])[0]
+    answers = b""
+    count = 0
+    for address in addresses:
+        family, rtype = (socket.AF_INET6, bc.DNS_AAAA) if ":" in address else (socket.AF_INET, bc.DNS_A)
+        if rtype != qtype:
+            continue
+        rdata = socket.inet_pton(family, address)
+        answers += b"\xc0\x0c" + struct.pack("!HHIH", rtype, 1, ttl, len(rdata)) + rdata
+        count += 1
+    return struct.pack("!HHHHHH", query_id, 0x8180 | rcode, 1, count, 0, 0) + query[12:] + answers
+
+class StubDnsServer:
+    """UDP nameserver answering from a {name: [addresses]} table; unknown names get NXDOMAIN.
+
+    A non-zero `rcode` makes it answer every query with that error instead.
+    """
+
+    def __init__(self, zone, rcode=0):
+        self.zone = zone
+        self.rcode = rcode
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.address = f"127.0.0.1:{self.sock.getsockname()[1]}"
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                query, peer = self.sock.recvfrom(512)
+            except OSError:
+                return
+            labels, offset = [], 12
+            while query[offset]:
+                labels.append(query[offset + 1:offset + 1 + query[offset]].decode("ascii"))
+                offset += 1 + query[offset]
+            name = ".".join(labels)
+            self.queries.append(name)
+            if self.rcode:
+                self.sock.sendto(build_response(query, rcode=self.rcode), peer)
+            elif name in self.zone:
+                self.sock.sendto(build_response(query, self.zone[name]), peer)
+            else:
+                self.sock.sendto(build_response(query, rcode=3), peer)
+
+    def close(self):
+        self.sock.close()
+
+@pytest.fixture
+def nameserver():
+    server = StubDnsServer({"example.test": ["192.0.2.1", "192.0.2.2", "2001:db8::1"], "v6.example.test": ["2001:db8::2"]})
+    yield server
+    server.close()
+
+def test_query_round_trip():
+    query = bc._encode_dns_query(0x1234, "Example.Test.", bc.DNS_A)
+    assert query[12:] == b"\x07Example\x04Test\x00" + struct.pack("!HH", bc.DNS_A, 1)
+    query_id, rcode, records = bc._decode_dns_response(build_response(query, ["192.0.2.1", "2001:db8::1"], ttl=60))
+    assert (query_id, rcode, records) == (0x1234, 0, [(bc.DNS_A, "192.0.2.1", 60)])
+
+def test_decode_nxdomain():
+    query = bc._encode_dns_query(7, "missing.test", bc.DNS_AAAA)
+    assert bc._decode_dns_response(build_response(query, rcode=3)) == (7, 3, [])
+
+def test_resolves_all_records(nameserver):
+    resolver = bc.DnsResolver(servers=[nameserver.address])
+    try:
+        assert sorted(resolver.resolve("example.test")) == ["192.0.2.1", "192.0.2.2", "2001:db8::1"]
+        assert resolver.resolve("v6.example.test") == ["2001:db8::2"]
+        assert bc.pick_address(resolver.resolve("example.test")) == "192.0.2.1"
+    finally:
+        resolver.close()
+
+def test_answers_are_cached(nameserver):
+    resolver = bc.DnsResolver(servers=[nameserver.address])
+    try:
+        resolver.resolve("example.test")
+        resolver.resolve("EXAMPLE.test.")
+        assert resolver.resolve("missing.test") == []
+        assert resolver.resolve("missing.test") == []
+        assert nameserver.queries.count("example.test") == 2
+        assert nameserver.queries.count("missing.test") == 2
+    finally:
+        resolver.close()
+
+def test_silent_server_resolves_to_nothing(monkeypatch):
+    monkeypatch.setattr(bc, "DNS_ATTEMPTS", 2)
+    silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    silent.bind(("127.0.0.1", 0))
+    resolver = bc.DnsResolver(servers=[f"127.0.0.1:{silent.getsockname()[1]}"], timeout=0.05)
+    try:
+        assert resolver.resolve("example.test") == []
+    finally:
+        resolver.close()
+        silent.close()
+
+def test_hosts_table_and_literals():
+    resolver = bc.DnsResolver(servers=[], hosts={"Static.Test": ["198.51.100.7"]})
+    try:
+        assert resolver.resolve("static.test") == ["198.51.100.7"]
+        assert resolver.resolve("203.0.113.9") == ["203.0.113.9"]
+        assert resolver.resolve("2001:db8::5") == ["2001:db8::5"]
+    finally:
+        resolver.close()
+
+def test_hosts_file(tmp_path, nameserver, monkeypatch):
+    path = tmp_path / "hosts"
+    path.write_text(
+        "127.0.0.1 localhost\n"
+        "::1 localhost ip6-localhost  # loopback\n"
+        "# 192.0.2.9 commented.test\n"
+        "198.51.100.3 Printer.lan. printer\n"
+        "not-an-address bogus.test\n"
+    )
+    assert bc._read_hosts_file(str(path)) == {
+        "localhost": ["127.0.0.1", "::1"], "ip6-localhost": ["::1"], "printer.lan": ["198.51.100.3"], "printer": ["198.51.100.3"],
+    }
+    read_hosts_file = bc._read_hosts_file
+    monkeypatch.setattr(bc, "_read_hosts_file", lambda: read_hosts_file(str(path)))
+    resolver = bc.DnsResolver(servers=[nameserver.address])
+    try:
+        assert resolver.resolve("localhost") == ["127.0.0.1", "::1"]
+        assert resolver.resolve("example.test") == ["192.0.2.1", "192.0.2.2", "2001:db8::1"]
+        assert nameserver.queries == ["example.test", "example.test"]
+    finally:
+        resolver.close()
+
+def test_resolv_conf(tmp_path):
+    path = tmp_path / "resolv.conf"
+    path.write_text("nameserver 192.0.2.53\nsearch corp.test\nsearch lan.test example.test\noptions ndots:2 timeout:1\nnameserver 2001:db8::53\n")
+    assert bc._read_resolv_conf(str(path)) == (["192.0.2.53", "2001:db8::53"], ["lan.test", "example.test"], 2)
+    assert bc._read_resolv_conf(str(tmp_path / "missing")) == ([], [], 1)
+
+def test_search_domains(nameserver):
+    resolver = bc.DnsResolver(servers=[nameserver.address], hosts={}, search=["missing.test", "example.test"])
+    try:
+        assert resolver.resolve("v6") == ["2001:db8::2"]
+        assert resolver.resolve("example.test") == ["192.0.2.1", "192.0.2.2", "2001:db8::1"]
+        assert resolver.resolve("nothing") == []
+        names = list(dict.fromkeys(nameserver.queries))
+        assert names == ["v6.missing.test", "v6.example.test", "example.test", "nothing.missing.test", "nothing.example.test", "nothing"]
+    finally:
+        resolver.close()
+
+def test_server_failures_are_retried_on_the_next_server(nameserver):
+    failing = StubDnsServer({}, rcode=2)
+    refusing = StubDnsServer({}, rcode=5)
+    resolver = bc.DnsResolver(servers=[failing.address, refusing.address, nameserver.address], hosts={})
+    try:
+        assert sorted(resolver.resolve("example.test")) == ["192.0.2.1", "192.0.2.2", "2001:db8::1"]
+        assert failing.queries == refusing.queries == ["example.test", "example.test"]
+    finally:
+        resolver.close()
+        failing.close()
+        refusing.close()
+
+def test_unencodable_names_do_not_resolve(nameserver):
+    long_label = "a" * 64 + ".example.test"
+    with pytest.raises(UnicodeError):
+        bc._encode_dns_query(1, long_label, bc.DNS_A)
+    with pytest.raises(ValueError):
+        bc._encode_dns_query(1, ".".join(["a" * 60] * 5), bc.DNS_A)
+    resolver = bc.DnsResolver(servers=[nameserver.address], timeout=0.05)
+    try:
+        assert resolver.submit(long_label).result(timeout=1) == []
+        assert resolver.queries == {} and resolver.deadlines == []
+        assert resolver.resolve(long_label) == []
+        assert resolver.reader.is_alive()
+        assert resolver.submit("example.test").result(timeout=1) == ["192.0.2.1", "192.0.2.2", "2001:db8::1"]
+    finally:
+        resolver.close()
+
+def test_unencodable_names_without_nameservers():
+    resolver = bc.DnsResolver(servers=[])
+    try:
+        assert resolver.submit("a" * 64 + ".example.test").result(timeout=5) == []
+    finally:
+        resolver.close()
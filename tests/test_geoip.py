@@ -0,0 +1,151 @@
+import ipaddress
+import struct
+
+import pytest
+
+import buffer_checker as bc
+
+def encode(value):
+    """Encode a value in the MaxMind DB data section format."""
+    def control(kind, size, payload):
+        if size < 29:
+            prefix, extra = size, b""
+        elif size < 285:
+            prefix, extra = 29, bytes([size - 29])
+        elif size < 65821:
+            prefix, extra = 30, (size - 285).to_bytes(2, "big")
+        else:
+            prefix, extra = 31, (size - 65821).to_bytes(3, "big")
+        if kind > 7:
+            return bytes([prefix, kind - 7]) + extra + payload
+        return bytes([(kind << 5) | prefix]) + extra + payload
+
+    if isinstance(value, bool):
+        return control(14, int(value), b"")
+    if isinstance(value, str):
+        data = value.encode("utf-8")
+        return control(2, len(data), data)
+    if isinstance(value, float):
+        return control(3, 8, struct.pack("!d", value))
+    if isinstance(value, int):
+        data = value.to_bytes((value.bit_length() + 7) // 8, "big")
+        return control(6 if len(data) <= 4 else 9, len(data), data)
+    if isinstance(value, dict):
+        return control(7, len(value), b"".join(encode(key) + encode(item) for key, item in value.items()))
+    if isinstance(value, list):
+        return control(11, len(value), b"".join(encode(item) for item in value))
+    raise TypeError(value)
+
+def write_mmdb(path, networks, record_size=24, ip_version=6):
+    """Write a MaxMind DB holding `networks` ({cidr: record}); identical records are stored once."""
+    data, offsets, leaves = b"", {}, []
+    for cidr, record in networks.items():
+        key = repr(record)
+        if key not in offsets:
+            offsets[key] = len(data)
+            data += encode(record)
+        leaves.append((ipaddress.ip_network(cidr), offsets[key]))
+    bits = 128 if ip_version == 6 else 32
+    nodes = [[None, None]]
+    for network, offset in leaves:
+        prefix = network.prefixlen + (96 if network.version == 4 and ip_version == 6 else 0)
+        value = int(network.network_address)
+        node = 0
+        for depth in range(prefix):
+            bit = (value >> (bits - 1 - depth)) & 1
+            if depth == prefix - 1:
+                nodes[node][bit] = ("data", offset)
+            else:
+                if not isinstance(nodes[node][bit], int):
+                    nodes.append([None, None])
+                    nodes[node][bit] = len(nodes) - 1
+                node = nodes[node][bit]
+    count = len(nodes)
+
+    def pointer(entry):
+        if entry is None:
+            return count
+        if isinstance(entry, tuple):
+            return count + 16 + entry[1]
+        return entry
+
+    tree = b""
+    for left, right in nodes:
+        left, right = pointer(left), pointer(right)
+        if record_size == 24:
+            tree += left.to_bytes(3, "big") + right.to_bytes(3, "big")
+        elif record_size == 28:
+            tree += (left & 0xFFFFFF).to_bytes(3, "big") + bytes([((left >> 24) << 4) | (right >> 24)]) + (right & 0xFFFFFF).to_bytes(3, "big")
+        else:
+            tree += left.to_bytes(4, "big") + right.to_bytes(4, "big")
+    metadata = {
+        "node_count": count, "record_size": record_size, "ip_version": ip_version, "database_type": "Test",
+        "binary_format_major_version": 2, "binary_format_minor_version": 0, "build_epoch": 1,
+        "languages": ["en"], "description": {"en": "test"},
+    }
+    with open(path, "wb") as dbfile:
+        dbfile.write(tree + b"\0" * 16 + data + bc.MaxMindDatabase.METADATA_MARKER + encode(metadata))
+
+def city(name, country):
+    return {"city": {"geoname_id": 5128581, "names": {"en": name}}, "country": {"iso_code": country}, "location": {"latitude": 40.7, "longitude": -74.0}}
+
+NETWORKS = {
+    "192.0.2.0/24": city("New York", "US"),
+    "198.51.100.0/25": city("Berlin", "DE"),
+    "203.0.113.0/24": city("Berlin", "DE"),
+    "2001:db8::/32": {"registered_country": {"iso_code": "NL"}},
+}
+
+@pytest.mark.parametrize("record_size", [24, 28, 32])
+def test_lookup(tmp_path, record_size):
+    path = tmp_path / "test.mmdb"
+    write_mmdb(path, NETWORKS, record_size)
+    database = bc.MaxMindDatabase(str(path))
+    try:
+        assert database.metadata["node_count"] == database.node_count
+        assert database.location("192.0.2.77") == "New York, US"
+        assert database.location("198.51.100.1") == "Berlin, DE"
+        assert database.location("198.51.100.200") is None
+        assert database.location("203.0.113.5") == "Berlin, DE"
+        assert database.location("2001:db8::1") == "Unknown, NL"
+        assert database.location("10.0.0.1") is None
+        assert database.location("not an address") is None
+        record = database.lookup("192.0.2.1")
+        assert record["location"] == {"latitude": 40.7, "longitude": -74.0}
+        assert record["city"]["geoname_id"] == 5128581
+    finally:
+        database.close()
+
+def test_ipv4_database(tmp_path):
+    path = tmp_path / "v4.mmdb"
+    write_mmdb(path, {"192.0.2.0/24": city("Paris", "FR")}, ip_version=4)
+    database = bc.MaxMindDatabase(str(path))
+    try:
+        assert database.location("192.0.2.9") == "Paris, FR"
+        assert database.lookup("2001:db8::1") is None
+    finally:
+        database.close()
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not.mmdb"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        bc.MaxMindDatabase(str(path))
+
+def test_enricher_prefers_local_database(tmp_path, stub_url, monkeypatch):
+    path = tmp_path / "test.mmdb"
+    write_mmdb(path, NETWORKS)
+    monkeypatch.setattr(bc, "HTTP_RETRIES", 0)
+    enricher = bc.Enricher(
+        geo_url=stub_url,
+        geo_cache=bc.DiskCache(None, bc.GEO_CACHE_TTL, bc.ENRICH_CACHE_SIZE),
+        whois_cache=bc.DiskCache(None, bc.WHOIS_CACHE_TTL, bc.ENRICH_CACHE_SIZE),
+        geoip=bc.MaxMindDatabase(str(path)),
+    )
+    try:
+        assert enricher.geo("192.0.2.1") == "New York, US"
+        assert enricher.requests_sent == 0
+        assert enricher.geo("10.1.2.3") == "City16, ZZ"
+        assert enricher.requests_sent == 1
+    finally:
+        enricher.close()
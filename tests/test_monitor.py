@@ -0,0 +1,67 @@
+import asyncio
+import collections
+
+import buffer_checker as bc
+
+HOSTS = {"192.0.2.1": bc.FakeHost(pmtu=1400, hops=6, rtt=15.0)}
+NAMES = {"a.example.test": ["192.0.2.1"], "gone.example.test": []}
+
+def run_monitor(enricher, seconds, setup=None, **kwargs):
+    resolver = bc.DnsResolver(servers=[], hosts=NAMES)
+    monitor = bc.Monitor(list(NAMES), prober=bc.FakeProber(HOSTS), resolver=resolver, enricher=enricher, **kwargs)
+    if setup is not None:
+        setup(monitor)
+
+    async def run():
+        stop = asyncio.Event()
+        asyncio.get_running_loop().call_later(seconds, stop.set)
+        await monitor.run(stop)
+
+    try:
+        asyncio.run(run())
+    finally:
+        resolver.close()
+    return monitor
+
+def test_metrics(enricher, monkeypatch):
+    monkeypatch.setattr(bc, "MONITOR_STARTUP_SPREAD", 0)
+    monitor = run_monitor(enricher, 0.6, stages={"echo", "mtu"})
+    metrics = monitor.render_metrics()
+    assert 'buffer_checker_max_buffer_bytes{target="a.example.test",ip="192.0.2.1"} 1372' in metrics
+    assert 'buffer_checker_latency_ms{target="a.example.test",ip="192.0.2.1"} 15.0' in metrics
+    # One name resolves and one does not, for each of the two stages
+    assert 'buffer_checker_stage_runs_total{stage="dns"} 2' in metrics
+    assert 'buffer_checker_stage_errors_total{stage="dns"} 2' in metrics
+
+def test_short_intervals_do_not_drift(enricher, monkeypatch):
+    monkeypatch.setattr(bc, "MONITOR_STARTUP_SPREAD", 0)
+    monitor = run_monitor(enricher, 1.1, stages={"hops"}, intervals={"hops": 0.2})
+    assert monitor.counters["hops_runs"] >= 5
+
+class LockedCounter(collections.Counter):
+    """Counter that fails any change made without holding `lock`."""
+
+    def __init__(self, lock):
+        super().__init__()
+        self.lock = lock
+
+    def __setitem__(self, key, value):
+        assert self.lock.locked(), f"{key} changed outside the monitor lock"
+        super().__setitem__(key, value)
+
+def test_counters_change_under_the_lock(enricher, monkeypatch):
+    monkeypatch.setattr(bc, "MONITOR_STARTUP_SPREAD", 0)
+
+    async def failing(address, prober=None):
+        raise RuntimeError("probe backend failed")
+
+    monkeypatch.setattr(bc, "get_ttl_hops_async", failing)
+
+    def setup(monitor):
+        monitor.counters = LockedCounter(monitor.lock)
+
+    monitor = run_monitor(enricher, 0.5, setup, stages={"hops", "mtu"}, intervals={"mtu": 0.1})
+    # The first MTU round searches, later rounds only check that the previous size still fits
+    assert monitor.counters["mtu_full_searches"] == 1
+    assert monitor.counters["mtu_checks_held"] >= 2
+    assert monitor.counters["hops_errors"] == 1
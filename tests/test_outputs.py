@@ -0,0 +1,91 @@
+import csv
+import json
+
+import buffer_checker as bc
+
+RESULTS = [
+    bc.ScanResult("a.example.test", 1472, 8, 20.0, "0%", "City1, ZZ", {"registrar": "Bench Registrar"}, "192.0.2.1", 1.5, 57, 1700000000.0),
+    bc.ScanResult("evil</script><script>alert(1)//.test", 0, "N/A", "N/A", "N/A", "Unknown", {"note": "line\u2028separator\u2029</b>"}),
+]
+
+def report_data(path):
+    """Return the rows embedded in a report's DATA array, checking nothing in it can end the script early."""
+    html = path.read_text(encoding="utf-8")
+    assert html.endswith("</html>\n")
+    start = html.index("const DATA = [\n") + len("const DATA = [\n")
+    end = html.index("];\nconst GENERATED")
+    data = html[start:end]
+    assert "</" not in data and "\u2028" not in data and "\u2029" not in data
+    return json.loads(f"[{data}]")
+
+def test_html_report_embeds_every_result(tmp_path):
+    path = tmp_path / "report.html"
+    with bc.HtmlReportWriter(str(path)) as report:
+        for result in RESULTS:
+            report.add(result)
+    assert report_data(path) == [json.loads(json.dumps(list(result[:7]))) for result in RESULTS]
+
+def test_empty_html_report(tmp_path):
+    path = tmp_path / "empty.html"
+    bc.HtmlReportWriter(str(path)).close()
+    assert report_data(path) == []
+
+def test_generate_html_report(tmp_path):
+    path = bc.generate_html_report(RESULTS, filename=str(tmp_path / "report.html"))
+    assert [row[0] for row in report_data(tmp_path / "report.html")] == [result.website for result in RESULTS]
+    assert path == str(tmp_path / "report.html")
+
+def test_jsonl_sink_writes_schema_records(tmp_path):
+    path = tmp_path / "results.jsonl"
+    with bc.JsonlSink(str(path), batch_size=1) as sink:
+        sink.add(RESULTS[0])
+        # With a batch size of 1 each result is on disk as soon as it is added
+        assert len(path.read_text().splitlines()) == 1
+        sink.add(RESULTS[1])
+    with bc.JsonlSink(str(path)) as sink:
+        sink.add(RESULTS[0]._replace(packet_loss="25%"))
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [list(record) for record in records] == [[name for name, _ in bc.RESULT_SCHEMA]] * 3
+    assert records[0] == {
+        "website": "a.example.test", "ip": "192.0.2.1", "max_buffer_size": 1472, "ttl_hops": 8, "latency_ms": 20.0, "jitter_ms": 1.5,
+        "packet_loss_pct": 0.0, "reply_ttl": 57, "geo_location": "City1, ZZ", "domain_details": {"registrar": "Bench Registrar"},
+        "scanned_at": 1700000000.0,
+    }
+    assert (records[1]["ttl_hops"], records[1]["latency_ms"], records[1]["packet_loss_pct"], records[1]["ip"]) == (None, None, None, None)
+    assert records[2]["packet_loss_pct"] == 25.0
+
+def test_csv_sink_writes_the_header_once(tmp_path):
+    path = tmp_path / "results.csv"
+    with bc.CsvSink(str(path)) as sink:
+        for result in RESULTS:
+            sink.add(result)
+    with bc.CsvSink(str(path)) as sink:
+        sink.add(RESULTS[0])
+    with open(path, newline="", encoding="utf-8") as csvfile:
+        rows = list(csv.reader(csvfile))
+    assert rows[0] == [name for name, _ in bc.RESULT_SCHEMA]
+    assert len(rows) == 4 and rows.count(rows[0]) == 1
+    assert [row[0] for row in rows[1:]] == ["a.example.test", RESULTS[1].website, "a.example.test"]
+    assert json.loads(rows[1][9]) == {"registrar": "Bench Registrar"}
+    assert rows[2][3] == ""
+
+def test_open_sink(tmp_path):
+    assert isinstance(bc.open_sink(str(tmp_path / "out" / "r.jsonl")), bc.JsonlSink)
+    assert (tmp_path / "out").is_dir()
+    assert isinstance(bc.open_sink(str(tmp_path / "r.NDJSON")), bc.JsonlSink)
+    assert isinstance(bc.open_sink(str(tmp_path / "r.csv")), bc.CsvSink)
+    assert isinstance(bc.open_sink(str(tmp_path / "r.html")), bc.HtmlReportWriter)
+    store = bc.open_sink(str(tmp_path / "r.db"), ["a.example.test", "--stages", "mtu"])
+    store.add(RESULTS[0])
+    store.close()
+    db = bc.open_result_store(str(tmp_path / "r.db"))
+    try:
+        assert [run[4] for run in bc.list_runs(db)] == ["a.example.test --stages mtu"]
+    finally:
+        db.close()
+    try:
+        bc.open_sink(str(tmp_path / "r.xml"))
+    except ValueError as e:
+        assert "Unsupported output format '.xml'" in str(e)
+    else:
+        raise AssertionError("open_sink accepted an unknown extension")
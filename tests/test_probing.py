@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+import buffer_checker as bc
+
+def pmtu_search(host):
+    prober = bc.FakeProber({"192.0.2.1": host}, seed=0)
+    return asyncio.run(bc.search_path_mtu_async("192.0.2.1", prober))
+
+def discover_hops(host, seed=0, echo=False):
+    prober = bc.FakeProber({"192.0.2.1": host}, seed=seed)
+
+    async def run():
+        session = bc.EchoSession("192.0.2.1", prober=prober, interval=0) if echo else None
+        return await bc.get_ttl_hops_async("192.0.2.1", prober, session)
+
+    return asyncio.run(run())
+
+def test_fake_prober_outcomes():
+    prober = bc.FakeProber({"192.0.2.1": bc.FakeHost(pmtu=1400, hops=5, initial_ttl=64, rtt=12.5)})
+    assert prober.probe("192.0.2.1", ttl=4).status == bc.TTL_EXCEEDED
+    assert prober.probe("192.0.2.1", size=1400 - bc.ICMP_OVERHEAD + 1) == bc.ProbeReply(bc.FRAG_NEEDED, mtu=1400)
+    assert prober.probe("192.0.2.1", size=1400 - bc.ICMP_OVERHEAD) == bc.ProbeReply(bc.REPLY, 12.5, 60)
+    assert prober.probe("198.51.100.1").status == bc.TIMEOUT
+
+@pytest.mark.parametrize("host", ["2001:db8::1", "::1"])
+def test_icmp_prober_sends_ipv6_through_the_fallback(host):
+    try:
+        prober = bc.IcmpProber()
+    except OSError:
+        pytest.skip("ICMP sockets are not permitted here")
+    prober.fallback = bc.FakeProber({host: bc.FakeHost(rtt=5.0)})
+    try:
+        assert prober.probe(host) == bc.ProbeReply(bc.REPLY, 5.0, 55)
+        assert (prober.sent, prober.fallback.sent) == (0, 1)
+    finally:
+        prober.close()
+
+@pytest.mark.parametrize("blackhole", [False, True])
+def test_pmtu_search_exact(blackhole):
+    wrong = {}
+    for pmtu in range(1029, 1529):
+        result = pmtu_search(bc.FakeHost(pmtu=pmtu, blackhole=blackhole))
+        if result.size != pmtu - bc.ICMP_OVERHEAD or result.rounds > bc.PMTU_MAX_ROUNDS:
+            wrong[pmtu] = result.size
+    assert wrong == {}
+
+def test_pmtu_search_blackhole_with_loss():
+    wrong = {}
+    for pmtu in range(1029, 1529):
+        prober = bc.FakeProber({"192.0.2.1": bc.FakeHost(pmtu=pmtu, blackhole=True, loss=0.05)}, seed=pmtu)
+        result = asyncio.run(bc.search_path_mtu_async("192.0.2.1", prober))
+        if result.size != pmtu - bc.ICMP_OVERHEAD:
+            wrong[pmtu] = result.size
+    assert len(wrong) <= 5
+    assert 0 not in wrong.values()
+
+@pytest.mark.parametrize("pmtu", bc.PMTU_PLATEAUS)
+def test_pmtu_plateau_settles_in_one_round(pmtu):
+    result = pmtu_search(bc.FakeHost(pmtu=pmtu))
+    assert result.size == pmtu - bc.ICMP_OVERHEAD
+    assert result.rounds == 1
+    assert result.outcomes[result.size] == bc.FITS
+    if pmtu < 1500:
+        assert result.outcomes[result.size + 1] == bc.NEEDS_FRAGMENTATION
+
+def test_pmtu_search_dead_host():
+    result = pmtu_search(bc.FakeHost(loss=1.0))
+    assert result.size == 0
+    assert result.rounds == 2
+    assert set(result.outcomes.values()) == {bc.NO_ANSWER}
+
+@pytest.mark.parametrize("initial_ttl", bc.INITIAL_TTLS)
+@pytest.mark.parametrize("hops", [1, 2, 3, 7, 12, 19, 30])
+@pytest.mark.parametrize("echo", [False, True])
+def test_hop_discovery(hops, initial_ttl, echo):
+    assert discover_hops(bc.FakeHost(hops=hops, initial_ttl=initial_ttl), echo=echo) == hops
+
+def test_hop_discovery_corrects_a_wrong_estimate():
+    # Initial TTL 100 makes the reply-TTL estimate (from 128) too large
+    assert discover_hops(bc.FakeHost(hops=9, initial_ttl=100)) == 9
+
+def test_hop_discovery_is_capped():
+    assert discover_hops(bc.FakeHost(hops=bc.MAX_HOPS + 5)) == "N/A"
+    assert discover_hops(bc.FakeHost(loss=1.0)) == "N/A"
+
+@pytest.mark.parametrize("reply_ttl", [64, 63])
+def test_hop_discovery_without_ttl_limited_replies(reply_ttl):
+    # The host answers full-TTL echoes, but nothing sent with a TTL below 255 arrives
+    prober = bc.FakeProber(script=lambda host, size, ttl: bc.ProbeReply(bc.REPLY, 10.0, reply_ttl) if ttl == 255 else bc.ProbeReply(bc.TIMEOUT))
+    assert asyncio.run(bc.get_ttl_hops_async("192.0.2.1", prober)) == "N/A"
+
+@pytest.mark.parametrize("echo", [False, True])
+@pytest.mark.parametrize("loss, tolerated", [(0.1, 0), (0.3, 2)])
+def test_hop_discovery_under_loss(loss, tolerated, echo):
+    wrong = [seed for seed in range(200) if discover_hops(bc.FakeHost(hops=12, loss=loss), seed, echo) != 12]
+    assert len(wrong) <= tolerated
+
+def test_hop_discovery_retries_a_lost_first_echo():
+    replies = iter([bc.ProbeReply(bc.TIMEOUT)])
+    prober = bc.FakeProber({"192.0.2.1": bc.FakeHost(hops=6)}, script=lambda host, size, ttl: next(replies, None))
+    assert asyncio.run(bc.get_ttl_hops_async("192.0.2.1", prober)) == 6
+
+def test_echo_session_metrics():
+    prober = bc.FakeProber({"192.0.2.1": bc.FakeHost(rtt=20.0, hops=4, initial_ttl=64)}, script=lambda host, size, ttl: None)
+    session = bc.EchoSession("192.0.2.1", count=4, interval=0, prober=prober)
+    assert bc.get_latency("192.0.2.1", session) == 20.0
+    assert bc.get_packet_loss("192.0.2.1", session) == "0%"
+    assert bc.get_reply_ttl("192.0.2.1", session) == 61
+    assert prober.sent == 4
+
+def test_echo_session_loss():
+    replies = iter([bc.ProbeReply(bc.REPLY, 10.0, 60), bc.ProbeReply(bc.TIMEOUT), bc.ProbeReply(bc.REPLY, 30.0, 60), bc.ProbeReply(bc.TIMEOUT)])
+    prober = bc.FakeProber(script=lambda host, size, ttl: next(replies))
+    samples = bc.EchoSession("192.0.2.1", count=4, interval=0, prober=prober).samples
+    assert samples.loss == 0.5
+    assert samples.avg == 20.0
+    assert samples.reply_ttl == 60
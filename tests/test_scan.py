@@ -0,0 +1,193 @@
+import asyncio
+import gc
+import json
+import pickle
+
+import buffer_checker as bc
+
+HOSTS = {
+    "192.0.2.1": bc.FakeHost(pmtu=1500, hops=8, rtt=20.0),
+    "192.0.2.2": bc.FakeHost(pmtu=1400, hops=12, initial_ttl=128, rtt=40.0),
+}
+NAMES = {"a.example.test": ["192.0.2.1"], "www.a.example.test": ["192.0.2.1"], "b.other.test": ["192.0.2.2", "2001:db8::2"], "unknown.test": []}
+
+def scan(names, enricher, stages=None, prober=None, **kwargs):
+    prober = prober or bc.FakeProber(HOSTS, seed=0)
+    resolver = bc.DnsResolver(servers=[], hosts=NAMES)
+
+    async def run():
+        return [result async for result in bc.scan_targets(names, prober=prober, resolver=resolver, enricher=enricher, stages=stages, **kwargs)]
+
+    try:
+        return {result.website: result for result in asyncio.run(run())}
+    finally:
+        resolver.close()
+
+def test_full_scan(enricher):
+    results = scan(list(NAMES), enricher)
+    a = results["a.example.test"]
+    assert (a.ip, a.max_buffer_size, a.ttl_hops, a.latency, a.packet_loss, a.reply_ttl) == ("192.0.2.1", 1472, 8, 20.0, "0%", 57)
+    assert a.geo_location == "City1, ZZ"
+    assert a.domain_details["registrar"] == "Bench Registrar"
+    b = results["b.other.test"]
+    assert (b.ip, b.max_buffer_size, b.ttl_hops, b.reply_ttl) == ("192.0.2.2", 1372, 12, 117)
+    missing = results["unknown.test"]
+    assert (missing.ip, missing.max_buffer_size, missing.geo_location) == (None, 0, "Unknown")
+
+def test_names_sharing_an_address_share_the_path_measurement(enricher):
+    prober = bc.FakeProber(HOSTS, seed=0)
+    scan(["a.example.test"], enricher, stages={"mtu", "hops"}, prober=prober)
+    single = prober.sent
+    prober = bc.FakeProber(HOSTS, seed=0)
+    results = scan(["a.example.test", "www.a.example.test"], enricher, stages={"mtu", "hops"}, prober=prober)
+    assert prober.sent == single
+    assert results["www.a.example.test"].max_buffer_size == 1472
+
+def test_stage_selection(enricher):
+    result = scan(["a.example.test"], enricher, stages={"mtu"})["a.example.test"]
+    assert result.max_buffer_size == 1472
+    assert (result.ttl_hops, result.latency, result.geo_location, result.domain_details) == ("N/A", "N/A", "N/A", {})
+    assert enricher.requests_sent == 0
+
+def test_failing_target_does_not_end_the_run(enricher, monkeypatch):
+    search = bc.search_path_mtu_async
+
+    async def failing(address, *args, **kwargs):
+        if address == "192.0.2.2":
+            raise RuntimeError("probe backend failed")
+        return await search(address, *args, **kwargs)
+
+    monkeypatch.setattr(bc, "search_path_mtu_async", failing)
+    results = scan(["a.example.test", "b.other.test"], enricher, stages={"mtu"})
+    assert results["a.example.test"].max_buffer_size == 1472
+    assert results["b.other.test"].domain_details == {"error": "Scan failed: probe backend failed"}
+
+def test_finished_path_measurements_are_released(enricher):
+    resolver = bc.DnsResolver(servers=[], hosts=NAMES)
+    context = bc.ScanContext(bc.FakeProber(HOSTS, seed=0), resolver=resolver, enricher=enricher, stages={"mtu", "hops"})
+
+    async def run():
+        results = await asyncio.gather(*(bc.scan_target(name, context) for name in ("a.example.test", "www.a.example.test", "b.other.test")))
+        return results, dict(context.paths)
+
+    try:
+        results, paths = asyncio.run(run())
+    finally:
+        resolver.close()
+    assert [result.max_buffer_size for result in results] == [1472, 1472, 1372]
+    assert paths == {}
+
+def test_later_names_for_a_measured_address_are_not_measured_again(enricher):
+    sent = {}
+    for name in ("a.example.test", "b.other.test"):
+        prober = bc.FakeProber(HOSTS, seed=0)
+        scan([name], enricher, stages={"mtu", "hops"}, prober=prober)
+        sent[name] = prober.sent
+    prober = bc.FakeProber(HOSTS, seed=0)
+    # One at a time, so the measurement for a.example.test has finished before www.a.example.test starts
+    results = scan(["a.example.test", "b.other.test", "www.a.example.test"], enricher, stages={"mtu", "hops"}, prober=prober, concurrency=1)
+    assert results["www.a.example.test"].max_buffer_size == 1472
+    assert prober.sent == sent["a.example.test"] + sent["b.other.test"]
+
+def test_partial_measurements_are_cached(enricher):
+    cache = bc.PathCache(None)
+    prober = bc.FakeProber(HOSTS, seed=0)
+    assert scan(["a.example.test"], enricher, stages={"mtu"}, prober=prober, path_cache=cache)["a.example.test"].max_buffer_size == 1472
+    assert cache.get("192.0.2.1") == {"pmtu": 1472, "hops": None, "reply_ttl": None}
+    mtu_probes = prober.sent
+    result = scan(["a.example.test"], enricher, stages={"mtu"}, prober=prober, path_cache=cache)["a.example.test"]
+    assert (result.max_buffer_size, prober.sent) == (1472, mtu_probes)
+    result = scan(["a.example.test"], enricher, stages={"mtu", "hops"}, prober=prober, path_cache=cache)["a.example.test"]
+    assert (result.max_buffer_size, result.ttl_hops) == (1472, 8)
+    assert all(size == 56 for _, size, _ in prober.log[mtu_probes:])
+    assert cache.get("192.0.2.1") == {"pmtu": 1472, "hops": 8, "reply_ttl": None}
+
+def test_merged_path_cache_entries_keep_their_age():
+    cache = bc.PathCache(None)
+    cache.put("192.0.2.1", 1472, None)
+    stored_at = cache.entries["192.0.2.1"]["time"]
+    cache.put("192.0.2.1", None, 8, 57)
+    assert cache.get("192.0.2.1") == {"pmtu": 1472, "hops": 8, "reply_ttl": 57}
+    assert cache.entries["192.0.2.1"]["time"] == stored_at
+    cache.put("192.0.2.1", 1400, 9)
+    assert cache.get("192.0.2.1") == {"pmtu": 1400, "hops": 9, "reply_ttl": 57}
+    assert cache.entries["192.0.2.1"]["time"] > stored_at
+
+def test_scan_result_record():
+    result = bc.ScanResult("a.example.test", 1472, 8, 20.0, "25%", "City, ZZ", {"registrar": "R"}, "192.0.2.1", 1.5, 57, 1700000000.0)
+    assert result.packet_loss == "25%"
+    assert result[:3] == ("a.example.test", 1472, 8)
+    assert result._replace(ttl_hops="N/A").ttl_hops == "N/A"
+    assert pickle.loads(pickle.dumps(result)) == result
+    assert bc.ScanResult(*json.loads(json.dumps(list(result)))) == result
+    record = bc.result_record(result)
+    assert (record["latency_ms"], record["packet_loss_pct"], record["domain_details"]) == (20.0, 25.0, {"registrar": "R"})
+
+def test_whois_details_are_shared_and_released():
+    import gc
+    table = bc.get_whois_table()
+    details = {"registrar": "Shared Registrar", "created_date": "2001-01-01"}
+    results = [bc.ScanResult(f"site{i}.example.test", 1472, 8, 20.0, "0%", "City, ZZ", dict(details)) for i in range(3)]
+    assert results[0]._whois is results[1]._whois is results[2]._whois
+    assert results[2].domain_details == details
+    error = {"error": "API request failed: 500 for url: https://whois.example/?domainName=site0.example.test"}
+    failed = bc.ScanResult("site0.example.test", 0, "N/A", "N/A", "N/A", "Unknown", error)
+    assert failed.domain_details == error
+    assert error["error"] not in "".join(table.records.keys())
+    text = results[0]._whois.text
+    del results
+    table.recent.clear()
+    gc.collect()
+    assert text not in table.records
+
+class SlowResolver:
+    """Resolver that answers after `delay` seconds, or raises `error` instead when it is set."""
+
+    def __init__(self, events, delay=0.05, error=None):
+        self.events = events
+        self.delay = delay
+        self.error = error
+
+    async def resolve_async(self, name):
+        self.events.append("dns started")
+        await asyncio.sleep(self.delay)
+        self.events.append("dns finished")
+        if self.error is not None:
+            raise self.error
+        return NAMES[name]
+
+def watch_whois(enricher, monkeypatch, events):
+    whois = enricher.whois_async
+
+    async def watched(name):
+        events.append("whois started")
+        return await whois(name)
+
+    monkeypatch.setattr(enricher, "whois_async", watched)
+
+def test_whois_overlaps_dns(enricher, monkeypatch):
+    events = []
+    watch_whois(enricher, monkeypatch, events)
+    context = bc.ScanContext(bc.FakeProber(HOSTS, seed=0), resolver=SlowResolver(events), enricher=enricher, stages={"whois"})
+    result = asyncio.run(bc.scan_target("a.example.test", context))
+    assert result.domain_details["registrar"] == "Bench Registrar"
+    assert events.index("whois started") < events.index("dns finished")
+
+def test_whois_is_cancelled_when_dns_fails(enricher, monkeypatch, recwarn):
+    events = []
+    watch_whois(enricher, monkeypatch, events)
+    context = bc.ScanContext(bc.FakeProber(HOSTS, seed=0), resolver=SlowResolver(events, error=OSError("resolver down")), enricher=enricher, stages={"whois"})
+
+    async def run():
+        try:
+            await bc.scan_target("a.example.test", context)
+        except OSError as e:
+            error = e
+        # Give a leaked lookup the chance to run on
+        await asyncio.sleep(0.05)
+        return error
+
+    assert str(asyncio.run(run())) == "resolver down"
+    gc.collect()
+    assert not [warning for warning in recwarn if "never awaited" in str(warning.message)]
+    assert events == ["dns started", "whois started", "dns finished"]
@@ -0,0 +1,102 @@
+import concurrent.futures
+import time
+
+import pytest
+
+import buffer_checker as bc
+
+class RecordingBackend:
+    """Probe backend that records each send; every probe gets `reply`, or no answer at all when it is None."""
+
+    def __init__(self, reply=bc.ProbeReply(bc.REPLY, 20.0, 60)):
+        self.reply = reply
+        self.sent = []
+
+    def submit(self, host, size=56, ttl=64, df=True, timeout=None):
+        self.sent.append((time.monotonic(), host, timeout))
+        future = concurrent.futures.Future()
+        if self.reply is not None:
+            future.set_result(self.reply)
+        return future
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def scheduler():
+    schedulers = []
+
+    def make(backend, **kwargs):
+        schedulers.append(bc.ProbeScheduler(backend, **kwargs))
+        return schedulers[-1]
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.close()
+
+def test_rtt_estimator_timeouts():
+    estimator = bc.RttEstimator(floor=0.05, cap=2.0, initial=1.0)
+    assert estimator.timeout("192.0.2.1") == 1.0
+    estimator.update("192.0.2.1", 0.1)
+    # First sample: SRTT = R, RTTVAR = R / 2
+    assert estimator.timeout("192.0.2.1") == pytest.approx(0.1 + 4 * 0.05)
+    estimator.update("192.0.2.1", 0.2)
+    srtt, rttvar = 0.875 * 0.1 + 0.125 * 0.2, 0.75 * 0.05 + 0.25 * 0.1
+    assert estimator.timeout("192.0.2.1") == pytest.approx(srtt + 4 * rttvar)
+    # Destinations without samples borrow their prefix's estimate
+    assert estimator.timeout("192.0.2.200") == pytest.approx(srtt + 4 * rttvar)
+    assert estimator.timeout("198.51.100.1") == 1.0
+    estimator.update("198.51.100.1", 0.001)
+    assert estimator.timeout("198.51.100.1") == 0.05
+    estimator.update("203.0.113.1", 5.0)
+    assert estimator.timeout("203.0.113.1") == 2.0
+
+def test_global_rate_paces_probes(scheduler):
+    backend = RecordingBackend()
+    paced = scheduler(backend, rate=200, burst=5, prefix_rate=0)
+    started = time.monotonic()
+    futures = [paced.submit(f"192.0.2.{i}") for i in range(25)]
+    assert all(future.result(timeout=2).status == bc.REPLY for future in futures)
+    # The burst goes out at once; the other 20 probes follow at 200/s
+    assert [sent_at - started for sent_at, _, _ in backend.sent[:5]] == pytest.approx([0] * 5, abs=0.02)
+    assert backend.sent[-1][0] - started >= 0.09
+    assert paced.paced == 20
+
+def test_prefix_rate_paces_one_network(scheduler):
+    backend = RecordingBackend()
+    paced = scheduler(backend, rate=0, prefix_rate=100, prefix_burst=2)
+    futures = [paced.submit(f"192.0.2.{i}") for i in range(6)] + [paced.submit("198.51.100.1")]
+    concurrent.futures.wait(futures, timeout=2)
+    hosts = [host for _, host, _ in backend.sent]
+    # The other network is not held up behind the paced one
+    assert hosts.index("198.51.100.1") <= 3
+    # Two probes to 192.0.2.0/24 go out at once, the other four at 100/s
+    paced_network = [sent_at for sent_at, host, _ in backend.sent if host.startswith("192.0.2.")]
+    assert paced_network[-1] - paced_network[0] >= 0.035
+
+def test_queued_prefixes_take_turns(scheduler):
+    backend = RecordingBackend()
+    paced = scheduler(backend, rate=100, burst=1, prefix_rate=0)
+    futures = [paced.submit(f"192.0.2.{i}") for i in range(10)] + [paced.submit("198.51.100.1")]
+    concurrent.futures.wait(futures, timeout=2)
+    hosts = [host for _, host, _ in backend.sent]
+    assert hosts.index("198.51.100.1") <= 2
+    assert len(hosts) == 11
+
+def test_unanswered_probes_expire_at_their_deadline(scheduler):
+    backend = RecordingBackend(reply=None)
+    paced = scheduler(backend, rate=0, prefix_rate=0)
+    started = time.monotonic()
+    assert paced.probe("192.0.2.1", timeout=0.05) == bc.ProbeReply(bc.TIMEOUT)
+    assert 0.04 <= time.monotonic() - started < 0.5
+    assert paced.expired == 1
+
+def test_timeouts_come_from_the_rtt_estimator(scheduler):
+    backend = RecordingBackend(reply=bc.ProbeReply(bc.REPLY, 20.0, 60))
+    paced = scheduler(backend, rate=0, prefix_rate=0, estimator=bc.RttEstimator(floor=0.05, cap=2.0, initial=1.0))
+    paced.probe("192.0.2.1")
+    paced.probe("192.0.2.1")
+    paced.probe("192.0.2.9", timeout=0.3)
+    # The first probe knows nothing and waits the initial timeout; the reply teaches the estimator
+    assert [timeout for _, _, timeout in backend.sent] == pytest.approx([1.0, 0.02 + 4 * 0.01, 0.3])
+    assert paced.estimator.timeout("192.0.2.9") == pytest.approx(0.02 + 4 * 0.01)
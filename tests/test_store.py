@@ -0,0 +1,31 @@
+import buffer_checker as bc
+
+HOSTS = {"192.0.2.1": bc.FakeHost(pmtu=1500, hops=8), "192.0.2.2": bc.FakeHost(pmtu=1400, hops=12)}
+NAMES = {"a.example.test": ["192.0.2.1"], "b.example.test": ["192.0.2.2"]}
+
+def scan_into(store, hosts, enricher, monkeypatch):
+    resolver = bc.DnsResolver(servers=[], hosts=NAMES)
+    monkeypatch.setattr(bc, "_prober", bc.FakeProber(hosts))
+    monkeypatch.setattr(bc, "_resolver", resolver)
+    monkeypatch.setattr(bc, "_enricher", enricher)
+    argv = list(NAMES) + ["--no-cache", "--no-table", "--stages", "mtu,hops", "-o", str(store)]
+    try:
+        bc.main(argv)
+    finally:
+        resolver.close()
+    return argv
+
+def test_runs_and_diff(tmp_path, enricher, monkeypatch):
+    store = tmp_path / "results.db"
+    first = scan_into(store, HOSTS, enricher, monkeypatch)
+    second = scan_into(store, dict(HOSTS, **{"192.0.2.2": bc.FakeHost(pmtu=1280, hops=12)}), enricher, monkeypatch)
+    db = bc.open_result_store(str(store))
+    try:
+        runs = bc.list_runs(db)
+        assert [(run[0], run[3], run[4]) for run in runs] == [(2, 2, " ".join(second)), (1, 2, " ".join(first))]
+        old_run, new_run, rows = bc.diff_runs(db)
+        assert (old_run, new_run) == (1, 2)
+        assert [row[:4] for row in rows] == [("b.example.test", "192.0.2.2", 1372, 1252)]
+        assert [row[3] for row in bc.target_history(db, "b.example.test")] == [1252, 1372]
+    finally:
+        db.close()
@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+import pytest
+
+import buffer_checker as bc
+
+HOSTS = {"192.0.2.1": bc.FakeHost(pmtu=1500, hops=8), "192.0.2.2": bc.FakeHost(pmtu=1400, hops=12)}
+NAMES = {"a.example.test": ["192.0.2.1"], "b.example.test": ["192.0.2.2"]}
+
+@pytest.fixture
+def tracer():
+    tracer = bc.Tracer()
+    bc.set_tracer(tracer)
+    yield tracer
+    bc.set_tracer(None)
+
+def traced_scan(enricher, prober):
+    resolver = bc.DnsResolver(servers=[], hosts=NAMES)
+
+    async def run():
+        return [result async for result in bc.scan_targets(list(NAMES), prober=prober, resolver=resolver, enricher=enricher)]
+
+    try:
+        return asyncio.run(run())
+    finally:
+        resolver.close()
+
+def test_summary_has_a_span_per_stage_and_target(enricher, tracer):
+    prober = bc.FakeProber(HOSTS, seed=0)
+    traced_scan(enricher, prober)
+    rows = {row[0]: row for row in tracer.summary()}
+    assert list(rows) == ["dns", "hops", "echo", "mtu", "geo", "whois"]
+    assert all(row[1] == 2 for row in rows.values())
+    assert all(row[2] >= 0 and row[6] >= 0 for row in rows.values())
+    # Every probe the backend sent is charged to one of the probing stages
+    assert sum(rows[stage][7] for stage in ("hops", "echo", "mtu")) == prober.sent
+    assert rows["mtu"][10] > 0
+
+def test_trace_events_give_each_target_a_track(enricher, tracer, tmp_path):
+    traced_scan(enricher, bc.FakeProber(HOSTS, seed=0))
+    events = tracer.trace_events()
+    tracks = {event["args"]["name"]: event["tid"] for event in events if event["name"] == "thread_name"}
+    # DNS, echo, geo and WHOIS are traced per name, hops and MTU per resolved address
+    assert set(tracks) == set(NAMES) | {"192.0.2.1", "192.0.2.2"}
+    spans = [event for event in events if event["ph"] == "X"]
+    assert len(spans) == len(tracer.spans) == 12
+    assert {(event["args"]["target"], event["name"]) for event in spans if event["tid"] == tracks["192.0.2.2"]} == {("192.0.2.2", "hops"), ("192.0.2.2", "mtu")}
+    assert all(event["dur"] >= 0 and event["args"]["queued_ms"] >= 0 for event in spans)
+    path = tmp_path / "trace.json"
+    tracer.write_chrome_trace(str(path))
+    assert json.loads(path.read_text())["traceEvents"] == json.loads(json.dumps(events))
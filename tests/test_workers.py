@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+import buffer_checker as bc
+
+HOSTS = {"192.0.2.1": bc.FakeHost(pmtu=1500), "192.0.2.2": bc.FakeHost(pmtu=1400)}
+NAMES = {"a.example.test": ["192.0.2.1"], "b.example.test": ["192.0.2.2"]}
+TARGETS = [f"{name}.{i}.example.test" for i in range(7) for name in ("a", "b")]
+
+@pytest.fixture
+def network(enricher, monkeypatch):
+    """Install a fake network as the process-wide prober, resolver and enricher."""
+    names = dict(NAMES, **{target: NAMES[target.split(".", 1)[0] + ".example.test"] for target in TARGETS})
+    resolver = bc.DnsResolver(servers=[], hosts=names)
+    monkeypatch.setattr(bc, "_prober", bc.FakeProber(HOSTS))
+    monkeypatch.setattr(bc, "_resolver", resolver)
+    monkeypatch.setattr(bc, "_enricher", enricher)
+    yield
+    resolver.close()
+
+class InProcessWorker:
+    """Stands in for a worker process: runs `worker(address, token)` as a task on the coordinator's loop."""
+
+    def __init__(self, worker, command, env):
+        self.task = asyncio.ensure_future(worker(command[command.index("--worker") + 1], env["BUFFER_CHECKER_TOKEN"]))
+        self.returncode = None
+
+    async def wait(self):
+        try:
+            await self.task
+            self.returncode = 0
+        except Exception:
+            self.returncode = 1
+        return self.returncode
+
+    def terminate(self):
+        self.task.cancel()
+
+async def crashing_worker(address, token):
+    """Take the first batches the coordinator hands out, then exit without scanning them."""
+    host, _, port = address.rpartition(":")
+    reader, writer = await asyncio.open_connection(host, int(port))
+    bc._write_message(writer, {"type": "hello", "token": token})
+    await bc._read_message(reader)
+    await bc._read_message(reader)
+    writer.close()
+    raise RuntimeError("worker crashed")
+
+def run_distributed(monkeypatch, workers, spawn, **kwargs):
+    """Run scan_targets_distributed over TARGETS, starting each worker through `spawn(index)`."""
+    started = []
+
+    async def create_subprocess_exec(*command, env=None):
+        started.append(command)
+        return InProcessWorker(spawn(len(started) - 1), command, env)
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", create_subprocess_exec)
+
+    async def run():
+        scan = bc.scan_targets_distributed(TARGETS, workers, stages={"mtu"}, cache=False, **kwargs)
+        return [result async for result in scan]
+
+    return asyncio.run(asyncio.wait_for(run(), 10)), started
+
+def test_worker_reports_failed_targets_and_finishes_the_batch(network, monkeypatch):
+    search = bc.search_path_mtu_async
+
+    async def failing(address, *args, **kwargs):
+        if address == "192.0.2.2":
+            raise RuntimeError("probe backend failed")
+        return await search(address, *args, **kwargs)
+
+    monkeypatch.setattr(bc, "search_path_mtu_async", failing)
+
+    async def coordinate():
+        messages = []
+        finished = asyncio.Event()
+
+        async def handle(reader, writer):
+            await bc._read_message(reader)
+            bc._write_message(writer, {"type": "config", "stages": ["mtu"], "concurrency": 4, "cache": False})
+            bc._write_message(writer, {"type": "batch", "batch": 1, "targets": list(NAMES)})
+            while (message := await bc._read_message(reader)) is not None:
+                messages.append(message)
+                if message["type"] == "done":
+                    bc._write_message(writer, {"type": "stop"})
+                    await writer.drain()
+            finished.set()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        worker = bc.run_worker(f"127.0.0.1:{server.sockets[0].getsockname()[1]}")
+        await asyncio.wait_for(asyncio.gather(worker, finished.wait()), 10)
+        server.close()
+        return messages
+
+    messages = asyncio.run(coordinate())
+    results = {message["result"][0]: bc.ScanResult(*message["result"]) for message in messages if message["type"] == "result"}
+    assert messages[-1] == {"type": "done", "batch": 1}
+    assert results["a.example.test"].max_buffer_size == 1472
+    assert results["b.example.test"].domain_details == {"error": "Scan failed: probe backend failed"}
+
+def test_distributed_scan_hands_out_every_target_once(network, monkeypatch):
+    results, started = run_distributed(monkeypatch, 2, lambda index: bc.run_worker, batch_size=3, rate=1000, prefix_rate=50)
+    assert sorted(result.website for result in results) == sorted(TARGETS)
+    assert {result.website: result.max_buffer_size for result in results} == {target: 1472 if target.startswith("a.") else 1372 for target in TARGETS}
+    assert len(started) == 2
+    assert started[0][-4:] == ("--rate", "500", "--prefix-rate", "25")
+
+def test_crashed_worker_targets_are_handed_out_again(network, monkeypatch):
+    results, started = run_distributed(monkeypatch, 1, lambda index: crashing_worker if index == 0 else bc.run_worker, batch_size=3)
+    assert sorted(result.website for result in results) == sorted(TARGETS)
+    assert len(started) == 2
+
+def test_scan_fails_once_every_worker_is_out_of_restarts(network, monkeypatch):
+    monkeypatch.setattr(bc, "WORKER_MAX_RESTARTS", 1)
+    with pytest.raises(RuntimeError, match="all worker processes exited"):
+        run_distributed(monkeypatch, 2, lambda index: crashing_worker, batch_size=3)
+
+def test_workers_sharing_a_cache_file_keep_each_others_entries(tmp_path):
+    path = str(tmp_path / "path_cache.json")
+    first, second = bc.PathCache(path), bc.PathCache(path)
+    first.put("192.0.2.1", 1500, 8)
+    second.put("192.0.2.2", 1400, 12)
+    second.put("192.0.2.3", 1280, 3)
+    first.put("192.0.2.3", 1492, 4)
+    first.save()
+    second.save()
+    cache = bc.PathCache(path)
+    assert cache.get("192.0.2.1")["pmtu"] == 1500
+    assert cache.get("192.0.2.2")["pmtu"] == 1400
+    # Of two entries for one address, the newer measurement wins
+    assert cache.get("192.0.2.3")["pmtu"] == 1492
+    assert second.get("192.0.2.1")["pmtu"] == 1500